@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+"""
+Compare the speed of CRC16 implementations from mboot.connection.uart with the original bit by bit loop and measure
+encoding and parsing of UART frames.
+
+Usage: python benchmarks/bench_crc16.py [FRAME_SIZE] [FRAMES_COUNT]
+"""
+
+import os
+import sys
+import time
+from mboot.connection.uart import FPT, UartPacket, UartParser, crc16, crc16_table
+
+
+def crc16_bitwise(data, crc=0):
+    # the original implementation
+    for c in data:
+        crc ^= c << 8
+        for _ in range(8):
+            temp = crc << 1
+            if crc & 0x8000:
+                temp ^= 0x1021
+            crc = temp & 0xFFFF
+    return crc
+
+
+def measure(name, func, frames, size):
+    start = time.perf_counter()
+    result = [func(frame) for frame in frames]
+    elapsed = time.perf_counter() - start
+    print(f" {name:<28} {elapsed:8.3f} s {size / elapsed / (1024 * 1024):10.2f} MB/s")
+    return result
+
+
+def main():
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    frames = [os.urandom(frame_size) for _ in range(count)]
+    size = frame_size * count
+    print(f" {count} frames of {frame_size} bytes\n")
+
+    reference = measure('bit by bit loop', crc16_bitwise, frames, size)
+    assert measure('lookup table', crc16_table, frames, size) == reference, 'Different CRC'
+    assert measure('crc16 (binascii.crc_hqx)', crc16, frames, size) == reference, 'Different CRC'
+    print()
+
+    encoded = measure('UartPacket.to_bytes()', lambda frame: UartPacket(FPT.DATA, frame).to_bytes(), frames, size)
+    stream = b''.join(encoded)
+    parser = UartParser()
+    start = time.perf_counter()
+    packets = []
+    for offset in range(0, len(stream), 4096):
+        packets += parser.feed(stream[offset: offset + 4096])
+    elapsed = time.perf_counter() - start
+    print(f" {'UartParser.feed()':<28} {elapsed:8.3f} s {size / elapsed / (1024 * 1024):10.2f} MB/s")
+    assert [packet.data for packet in packets] == frames, 'Different data'
+
+
+if __name__ == '__main__':
+    main()
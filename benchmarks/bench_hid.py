@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+"""
+Compare the speed of HID report encoding by ReportEncoder with the original pack and concatenation encoder (the debug
+logging is disabled).
+
+Usage: python benchmarks/bench_hid.py [SIZE_IN_MB] [REPORT_SIZE] [PACKET_SIZE]
+"""
+
+import os
+import sys
+import time
+import logging
+from struct import pack
+from mboot.connection.usb import ReportEncoder, REPORT_ID
+
+logger = logging.getLogger('MBOOT:USB')
+
+
+def encode_report(report_id, report_size, data, offset=0):
+    # the original implementation
+    data_len = min(len(data) - offset, report_size - 4)
+    raw_data = pack('<2BH', report_id, 0x00, data_len)
+    raw_data += data[offset: offset + data_len]
+    raw_data += bytes([0x00] * (report_size - len(raw_data)))
+    logger.debug(f"OUT[{len(raw_data)}]: " + ' '.join(f"{b:02X}" for b in raw_data))
+    return raw_data, offset + data_len
+
+
+def write_original(packets, report_size, send):
+    for packet in packets:
+        data_index = 0
+        while data_index < len(packet):
+            raw_data, data_index = encode_report(REPORT_ID['DATA_OUT'], report_size, packet, data_index)
+            send(raw_data)
+
+
+def write_encoder(packets, report_size, send):
+    encoder = ReportEncoder(report_size)
+    for packet in packets:
+        for raw_data in encoder.iter_reports(REPORT_ID['DATA_OUT'], packet):
+            send(raw_data)
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 4 * 1024 * 1024
+    report_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    packet_size = int(sys.argv[3]) if len(sys.argv) > 3 else size
+    data = memoryview(os.urandom(size))
+    packets = [data[offset: offset + packet_size] for offset in range(0, size, packet_size)]
+    print(f" Data size: {size / (1024 * 1024):.1f} MB, report size: {report_size} B, packet size: {packet_size} B\n")
+
+    results = {}
+    for name, func in (('original encoder', write_original), ('ReportEncoder', write_encoder)):
+        reports = []
+        start = time.perf_counter()
+        func(packets, report_size, lambda report: None)
+        elapsed = time.perf_counter() - start
+        print(f" {name:<20} {elapsed:8.3f} s {size / elapsed / (1024 * 1024):10.2f} MB/s")
+        func(packets[:64], report_size, lambda report: reports.append(bytes(report)))
+        results[name] = reports
+    assert results['original encoder'] == results['ReportEncoder'], 'Different reports'
+
+
+if __name__ == '__main__':
+    main()
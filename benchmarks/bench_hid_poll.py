@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+"""
+Compare the write speed of libusb RawHid interface with the early response checked after every data packet and once
+per poll interval. The endpoints are simulated with timing of full-speed interrupt transfers: every report takes 1ms
+and the read of empty IN endpoint blocks for its timeout (the PyUSB is required).
+
+Usage: python benchmarks/bench_hid_poll.py [SIZE_IN_KB] [POLL_INTERVAL_IN_MS]
+"""
+
+import os
+import sys
+import time
+import errno
+from collections import deque
+from struct import pack, unpack_from
+import usb.core
+from mboot import McuBoot
+from mboot.commands import CmdPacket, PacketHeader
+from mboot.connection.usb import RawHid, REPORT_ID
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+from conftest import VirtualDevice
+
+
+class Endpoints:
+    """ OUT and IN interrupt endpoints of target with bootloader simulated by VirtualDevice """
+
+    wMaxPacketSize = 64
+
+    def __init__(self, memory_size):
+        self.device = VirtualDevice(memory_size=memory_size, max_packet_size=self.wMaxPacketSize - 4)
+        self.device.open()
+        self.polls = 0
+
+    def write(self, raw_data):
+        time.sleep(0.001)
+        length, = unpack_from('<H', raw_data, 2)
+        data = bytes(raw_data[4: 4 + length])
+        if raw_data[0] == REPORT_ID['CMD_OUT']:
+            header = PacketHeader.from_bytes(data)
+            self.device.write(CmdPacket(header.tag, header.flags, *unpack_from(f'<{header.params_count}I', data, 4)))
+        else:
+            self.device.write(data)
+
+    def read(self, size, timeout):
+        if not self.device.rx_queue:
+            self.polls += 1
+            time.sleep(timeout / 1000)
+            raise usb.core.USBError('Operation timed out', -7, errno.ETIMEDOUT)
+        time.sleep(0.001)
+        item = self.device.rx_queue.popleft()
+        if isinstance(item, bytes):
+            return pack('<2BH', REPORT_ID['DATA_IN'], 0, len(item)) + item
+        data = item.to_bytes()
+        return pack('<2BH', REPORT_ID['CMD_IN'], 0, len(data)) + data
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 128 * 1024
+    poll_interval = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else RawHid.poll_interval
+    data = os.urandom(size)
+    print(f" Data size: {size // 1024} kB, report size: {Endpoints.wMaxPacketSize} B\n")
+
+    for name, interval in (('poll every packet', 0), (f'poll every {poll_interval * 1000:.0f} ms', poll_interval)):
+        endpoints = Endpoints(size)
+        hid = RawHid()
+        hid.ep_in = hid.ep_out = endpoints
+        hid.poll_interval = interval
+        with McuBoot(hid, True) as mb:
+            start = time.perf_counter()
+            mb.write_memory(0, data)
+            elapsed = time.perf_counter() - start
+        assert endpoints.device.memory == data, 'Wrong data'
+        print(f" {name:<22} {elapsed:8.3f} s {size / elapsed / 1024:10.2f} kB/s {endpoints.polls:8d} empty polls")
+
+
+if __name__ == '__main__':
+    main()
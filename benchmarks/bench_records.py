@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+"""
+Compare the speed of Intel HEX / S-Record codec from mboot.records with bincopy.
+
+Usage: python benchmarks/bench_records.py [SIZE_IN_MB]
+"""
+
+import io
+import os
+import sys
+import time
+import bincopy
+from mboot.records import IHexWriter, SRecWriter, parse_ihex, parse_srec
+
+
+def measure(name, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f" {name:<28} {time.perf_counter() - start:8.3f} s")
+    return result
+
+
+def encode(writer_class, address, data):
+    stream = io.StringIO()
+    writer = writer_class(stream, address)
+    for offset in range(0, len(data), 0x10000):
+        writer.write(data[offset: offset + 0x10000])
+    writer.finish()
+    return stream.getvalue()
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 16 * 1024 * 1024
+    address = 0x60000000
+    data = os.urandom(size)
+    print(f" Image size: {size / (1024 * 1024):.1f} MB\n")
+
+    ref = bincopy.BinFile()
+    ref.add_binary(data, address)
+    ref.header = 'mboot'
+
+    for fmt, writer_class, parse, add_func in (('ihex', IHexWriter, parse_ihex, 'add_ihex'),
+                                               ('srec', SRecWriter, parse_srec, 'add_srec')):
+        text = measure(f"bincopy.as_{fmt}()", getattr(ref, f"as_{fmt}"))
+        out = measure(f"mboot {writer_class.__name__}", encode, writer_class, address, data)
+        assert out == text, 'Different output'
+        measure(f"bincopy.{add_func}()", getattr(bincopy.BinFile(), add_func), text)
+        image = measure(f"mboot {parse.__name__}()", parse, io.StringIO(text))
+        assert bytes(image.segments[0].data) == data, 'Different data'
+        print()
+
+
+if __name__ == '__main__':
+    main()
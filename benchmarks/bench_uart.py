@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+"""
+Measure the throughput of UART transport over pseudo-terminal pair with scripted fake bootloader (POSIX only).
+
+Usage: python benchmarks/bench_uart.py [SIZE_IN_KB] [MAX_PACKET_SIZE]
+"""
+
+import os
+import sys
+import time
+import select
+import threading
+from collections import deque
+from struct import pack, unpack_from
+from mboot import McuBoot, CommandTag, PropertyTag, StatusCode
+from mboot.commands import ResponseTag
+from mboot.connection.uart import FPT, UartPacket, UartParser, Uart, crc16
+
+
+class FakeBootloader(threading.Thread):
+    """ Target side of framing protocol with support of GetProperty, WriteMemory and ReadMemory commands """
+
+    def __init__(self, master, memory_size, max_packet_size):
+        super().__init__(daemon=True)
+        self.master = master
+        self.memory = bytearray(memory_size)
+        self.max_packet_size = max_packet_size
+        self.outgoing = deque()
+        self.write_phase = None
+
+    def send(self, fp_type, data):
+        self.outgoing.append(UartPacket(fp_type, data).to_bytes())
+
+    def response(self, tag, *params):
+        self.send(FPT.CMD, pack(f'<4B{len(params)}I', tag, 0, 0, len(params), *params))
+
+    def command(self, data):
+        tag, _, _, count = data[:4]
+        params = unpack_from(f'<{count}I', data, 4)
+        if tag == CommandTag.GET_PROPERTY:
+            if params[0] == PropertyTag.MAX_PACKET_SIZE:
+                self.response(ResponseTag.GET_PROPERTY, StatusCode.SUCCESS, self.max_packet_size)
+            else:
+                self.response(ResponseTag.GET_PROPERTY, StatusCode.UNKNOWN_PROPERTY)
+        elif tag == CommandTag.WRITE_MEMORY:
+            self.write_phase = [params[0], params[0] + params[1]]
+            self.response(ResponseTag.GENERIC, StatusCode.SUCCESS, tag)
+        elif tag == CommandTag.READ_MEMORY:
+            address, length = params[0], params[1]
+            self.response(ResponseTag.READ_MEMORY, StatusCode.SUCCESS, length)
+            for offset in range(address, address + length, self.max_packet_size):
+                self.send(FPT.DATA, bytes(self.memory[offset: min(offset + self.max_packet_size, address + length)]))
+            self.response(ResponseTag.GENERIC, StatusCode.SUCCESS, tag)
+        else:
+            self.response(ResponseTag.GENERIC, StatusCode.SUCCESS, tag)
+
+    def data(self, data):
+        address, end = self.write_phase
+        self.memory[address: address + len(data)] = data
+        self.write_phase[0] += len(data)
+        if self.write_phase[0] >= end:
+            self.write_phase = None
+            self.response(ResponseTag.GENERIC, StatusCode.SUCCESS, CommandTag.WRITE_MEMORY)
+
+    def run(self):
+        parser = UartParser()
+        ack = UartPacket(FPT.ACK).to_bytes()
+        waiting = False
+        while True:
+            select.select([self.master], [], [])
+            try:
+                received = os.read(self.master, 0x10000)
+            except OSError:
+                return
+            for packet in parser.feed(received):
+                if packet is None:
+                    os.write(self.master, UartPacket(FPT.NAK).to_bytes())
+                    continue
+                if packet.fp_type == FPT.PING:
+                    frame = pack('<2BIH', UartPacket.START_BYTE, FPT.RESP, 0x50010200, 0)
+                    os.write(self.master, frame + pack('<H', crc16(frame)))
+                elif packet.fp_type == FPT.ACK:
+                    waiting = False
+                elif packet.fp_type == FPT.CMD:
+                    os.write(self.master, ack)
+                    self.command(packet.data)
+                elif packet.fp_type == FPT.DATA:
+                    os.write(self.master, ack)
+                    self.data(packet.data)
+                if not waiting and self.outgoing:
+                    os.write(self.master, self.outgoing.popleft())
+                    waiting = True
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1024) if len(sys.argv) > 1 else 256 * 1024
+    max_packet_size = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    master, slave = os.openpty()
+    target = FakeBootloader(master, size, max_packet_size)
+    target.start()
+    data = os.urandom(size)
+    print(f" Image size: {size // 1024} kB, max packet size: {max_packet_size} B\n")
+
+    with McuBoot(Uart(os.ttyname(slave)), True) as mb:
+        for name, func, args in (('write_memory()', mb.write_memory, (0, data)),
+                                 ('read_memory()', mb.read_memory, (0, size))):
+            start = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - start
+            print(f" {name:<16} {elapsed:8.3f} s {size / elapsed / 1024:10.1f} kB/s")
+        assert result == data, 'Different data'
+
+    os.close(slave)
+    os.close(master)
+
+
+if __name__ == '__main__':
+    main()
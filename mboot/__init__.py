@@ -5,10 +5,11 @@
 # or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
 
 from .mcuboot import McuBoot
+from .aio import AsyncMcuBoot
 from .commands import CommandTag
 from .memories import ExtMemPropTags, ExtMemId
 from .properties import PropertyTag, PeripheryTag, Version, parse_property_value
-from .exceptions import McuBootError, McuBootCommandError, McuBootConnectionError
+from .exceptions import McuBootError, McuBootCommandError, McuBootConnectionError, McuBootVerifyError
 from .errorcodes import StatusCode
 from .connection import scan_usb, scan_uart
 
@@ -24,6 +25,7 @@ __all__ = [
     'parse_property_value',
     # classes
     'McuBoot',
+    'AsyncMcuBoot',
     'Version',
     # enums
     'PropertyTag',
@@ -34,5 +36,6 @@ __all__ = [
     # exceptions
     'McuBootError',
     'McuBootCommandError',
-    'McuBootConnectionError'
+    'McuBootConnectionError',
+    'McuBootVerifyError'
 ]
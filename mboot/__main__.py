@@ -6,11 +6,20 @@
 
 import os
 import sys
+import mmap
 import click
-import bincopy
+import threading
 import traceback
+from time import time
+from concurrent.futures import ThreadPoolExecutor
 
-from mboot import McuBoot, scan_usb, ExtMemId, CommandTag, PropertyTag, parse_property_value
+from mboot import McuBoot, scan_usb, scan_uart, ExtMemId, CommandTag, PropertyTag, parse_property_value
+from mboot.image import Image
+from mboot.records import open_writer, load_image
+from mboot.cache import ProfileCache, ManifestCache, ImageCache, BaudrateCache, get_file_hash
+from mboot.plan import get_sector_hashes
+from mboot.erase import ErasePlanner
+from mboot.bundle import FlashBundle
 
 
 ########################################################################################################################
@@ -218,9 +227,19 @@ def print_error(message, debug=False):
 
 
 # helper method
-def scan_interface(device_name):
+def scan_all(ctx):
+    # Scan for connected devices on USB or on serial ports selected by --uart option
+    port = ctx.obj['UART']
+    if port is None:
+        return scan_usb(ctx.obj['TARGET'])
+    ports = None if port.lower() == 'all' else port.split(',')
+    return scan_uart(ports, ctx.obj['BAUDRATE'], cache=BaudrateCache() if ctx.obj['CACHE'] else None)
+
+
+# helper method
+def scan_interface(ctx):
     # Scan for connected devices
-    devs = scan_usb(device_name)
+    devs = scan_all(ctx)
 
     if devs:
         index = 0
@@ -241,13 +260,207 @@ def scan_interface(device_name):
         print_error("Device not connected !\n")
 
 
+# helper method
+def scan_devices(ctx, all_devices, indexes):
+    # Get list of devices for gang mode (--all or --devices) or None for single device mode
+    if not all_devices and not indexes:
+        return None
+
+    devs = scan_all(ctx)
+    if not devs:
+        print_error("Device not connected !\n")
+
+    if indexes:
+        try:
+            devs = [devs[int(i, 0)] for i in indexes.split(',')]
+        except (ValueError, IndexError):
+            print_error(f"Invalid device index in: {indexes}")
+
+    for i, dev in enumerate(devs):
+        click.echo(f" DEVICE {i}: {dev.info()}")
+    click.echo()
+    return devs
+
+
+# helper method
+def run_parallel(devices, task, jobs, progress=False):
+    # Execute task(device, progress) on all devices concurrently by bounded pool of workers
+    lock = threading.Lock()
+    state = [0] * len(devices)
+
+    def update(index, done, total):
+        with lock:
+            percent = done * 100 // total if total else 100
+            if percent == state[index]:
+                return
+            state[index] = percent
+            click.echo('\r ' + ' '.join(f"[{i}]{p:3d}%" for i, p in enumerate(state)), nl=False)
+
+    def worker(index, device):
+        start = time()
+        try:
+            value = task(device, (lambda done, total: update(index, done, total)) if progress else None)
+            return True, value, time() - start
+        except Exception as e:
+            return False, str(e), time() - start
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(worker, i, dev) for i, dev in enumerate(devices)]
+        results = [future.result() for future in futures]
+
+    if progress:
+        click.echo('\n')
+    return results
+
+
+# helper method
+def print_summary(devices, results):
+    # Print pass/fail table of gang mode and exit with error code if any device failed
+    click.echo(" {:>2} | {:<32} | {:<6} | {:>7} | {}".format('#', 'DEVICE', 'RESULT', 'TIME', 'MESSAGE'))
+    click.echo(' ' + '-' * 80)
+    for i, (dev, (passed, value, elapsed)) in enumerate(zip(devices, results)):
+        message = value if isinstance(value, str) else ''
+        click.echo(" {:>2} | {:<32} | {:<6} | {:>6.1f}s | {}".format(
+            i, dev.info()[:32], 'PASS' if passed else 'FAIL', elapsed, message))
+    failed = sum(1 for passed, _, _ in results if not passed)
+    click.echo(f"\n {len(results) - failed} passed, {failed} failed")
+    if failed:
+        sys.exit(ERROR_CODE)
+
+
+# helper decorator
+def gang_options(func):
+    # Add options of gang mode into command
+    func = click.option('-j', '--jobs', type=click.IntRange(1, 64), default=4, show_default=True,
+                        help='Count of devices processed in parallel')(func)
+    func = click.option('--devices', type=click.STRING, default=None,
+                        help='Process selected devices by comma-separated indexes: 0,2,...')(func)
+    func = click.option('--all', 'all_devices', is_flag=True, default=False,
+                        help='Process all connected devices in parallel')(func)
+    return func
+
+
+# helper method
+def load_profile(ctx, mb):
+    # Load cached properties of connected device (skips the discovery of memories)
+    if ctx.obj['CACHE']:
+        mb.load_profile(ProfileCache())
+
+
+# helper method
+def save_profile(ctx, mb):
+    # Store discovered properties of connected device into profile cache
+    if ctx.obj['CACHE']:
+        try:
+            mb.save_profile(ProfileCache())
+        except OSError as e:
+            click.echo(f" Could not save device profile [{str(e)}]")
+
+
+# helper method
+def map_file(file):
+    # Map the binary file into memory (read only), the slices of returned memoryview are not copied
+    with open(file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+# helper method
+def load_input_image(ctx, file):
+    # Parse the image file, the parsed image is stored into cache of compiled images keyed by hash of file content,
+    # so the next runs only map the cached data. Returns the Image and cache entry (cache, key, meta) or None
+    if not ctx.obj['CACHE']:
+        return load_image(file), None
+    cache = ImageCache()
+    key = get_file_hash(file)
+    entry = cache.load(key)
+    if entry is not None:
+        return entry[0], (cache, key, entry[1])
+    image = load_image(file)
+    try:
+        if not cache.save(key, image):
+            return image, None
+    except OSError as e:
+        click.echo(f" Could not save compiled image [{str(e)}]")
+        return image, None
+    return image, (cache, key, {})
+
+
+# helper method
+def read_input(ctx, file, address, offset):
+    # Get the sparse image of input data (the gaps between segments are not padded), the data from specified offset
+    # are relocated to start address. Returns the Image, start address and cache entry of compiled image or None
+    image = Image()
+    cached = None
+
+    try:
+        if file.lower().endswith(('.srec', '.s19', '.hex', '.ihex')):
+            in_image, cached = load_input_image(ctx, file)
+            min_address = in_image.segments[0].address if in_image else 0
+            if address is None:
+                address = min_address
+            for segment in in_image:
+                image.add(segment.address + address - min_address - offset, segment.data, copy=False)
+        else:
+            if address is None:
+                address = 0
+            # The binary file is mapped into memory, its content is not copied
+            image.add(address - offset, map_file(file), copy=False)
+    except Exception as e:
+        print_error(f"Could not read from file: {file} \n [{str(e)}]")
+
+    image.remove(address - offset, offset)
+    return image, address, cached
+
+
+# helper method
+def parse_region(value):
+    # Parse the flash region in format START,SIZE,SECTOR_SIZE[,PAGE_SIZE]
+    try:
+        values = [int(v, 0) for v in value.split(',')]
+        if len(values) not in (3, 4) or values[2] <= 0:
+            raise ValueError()
+    except ValueError:
+        print_error(f"Invalid memory region: {value}")
+    return dict(zip(('address', 'size', 'sector_size', 'page_size'), values))
+
+
+# helper method
+def open_output(file, address):
+    # Open streaming writer for output file
+    try:
+        return open_writer(file, address)
+    except Exception as e:
+        print_error(f"Could not write to file: {file} \n [{str(e)}]")
+
+
+# helper method
+def save_output(chunks, file, address):
+    # Stream chunks into output file, which is opened with the first chunk (a failed read keeps the file untouched)
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                writer = open_output(file, address)
+            writer.write(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
 # McuBoot: base options
 @click.group(context_settings=dict(help_option_names=['-?', '--help']), help=DESCRIP)
 @click.option('-t', '--target', type=click.STRING, default=None, help='Select target MKL27, LPC55, ... [optional]')
+@click.option('-u', '--uart', type=click.STRING, default=None,
+              help="Use UART interface: port name, comma-separated names or 'all' for all serial ports")
+@click.option('-b', '--baudrate', type=UInt(), default=None, help='UART baud rate (default: autodetection)')
 @click.option('-d', "--debug", type=click.IntRange(0, 2, True), default=0, help='Debug level: 0-off, 1-info, 2-debug')
+@click.option('-n', '--no-cache', is_flag=True, default=False,
+              help='Disable the caches of device profiles and compiled images')
 @click.version_option(VERSION, '-v', '--version')
 @click.pass_context
-def cli(ctx, target, debug):
+def cli(ctx, target, uart, baudrate, debug, no_cache):
 
     if debug > 0:
         import logging
@@ -256,21 +469,52 @@ def cli(ctx, target, debug):
 
     ctx.obj['DEBUG'] = debug
     ctx.obj['TARGET'] = target
+    ctx.obj['UART'] = uart
+    ctx.obj['BAUDRATE'] = baudrate
+    ctx.obj['CACHE'] = not no_cache
 
     click.echo()
 
 
 # McuBoot: MCU info command
 @cli.command(short_help="Get MCU info (mboot properties)")
+@gang_options
 @click.pass_context
-def info(ctx):
+def info(ctx, all_devices, devices, jobs):
 
-    properties = []
-    device = scan_interface(ctx.obj['TARGET'])
+    def task(device, progress=None):
+        with McuBoot(device, True, cache_properties=True, manifests=ManifestCache()) as mb:
+            load_profile(ctx, mb)
+            properties = mb.get_property_list()
+            save_profile(ctx, mb)
+        return properties, mb.skipped_requests
+
+    def print_properties(properties, skipped):
+        for p in properties:
+            v = p.to_str()
+            if isinstance(v, list):
+                click.echo(f" {p.name}:" + "".join([f"\n  - {s}" for s in v]))
+            else:
+                click.echo(f" {p.name}: {v}")
+        # requests of properties not supported by bootloader version or known as unsupported from device profile
+        click.echo(f" Skipped Requests: {skipped}")
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        results = run_parallel(devs, task, jobs)
+        for i, (passed, value, _) in enumerate(results):
+            if passed:
+                click.echo(f" DEVICE {i}:")
+                print_properties(*value)
+                click.echo()
+        print_summary(devs, results)
+        return
+
+    properties, skipped = [], 0
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
-            properties = mb.get_property_list()
+        properties, skipped = task(device)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -278,12 +522,7 @@ def info(ctx):
     if ctx.obj['DEBUG']:
         click.echo()
 
-    for p in properties:
-        v = p.to_str()
-        if isinstance(v, list):
-            click.echo(f" {p.name}:" + "".join([f"\n  - {s}" for s in v]))
-        else:
-            click.echo(f" {p.name}: {v}")
+    print_properties(properties, skipped)
 
 
 # McuBoot: print memories list command
@@ -292,11 +531,13 @@ def info(ctx):
 def mlist(ctx):
 
     mem_list = {}
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, cache_properties=True, manifests=ManifestCache()) as mb:
+            load_profile(ctx, mb)
             mem_list = mb.get_memory_list()
+            save_profile(ctx, mb)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -358,10 +599,10 @@ def mconf(ctx, address, word, mtype, file):
     if not memory_data:
         print_error('The argument -w/--word or -f/--file must be specified !')
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             if address is None:
                 # get internal memory start address and size
                 memory_address = mb.get_property(PropertyTag.RAM_START_ADDRESS)[0]
@@ -383,18 +624,27 @@ def mconf(ctx, address, word, mtype, file):
 
 # McuBoot: receive SB file command
 @cli.command(short_help="Receive SB file")
-@click.argument('file', nargs=1, type=ImgFile(('.bin', '.sb', '.sb2'), True))
+@click.argument('file', nargs=1, type=ImgFile('.bin', '.sb', '.sb2', exists=True))
+@gang_options
 @click.pass_context
-def sbfile(ctx, file):
+def sbfile(ctx, file, all_devices, devices, jobs):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    sb_data = map_file(file)
 
-    with open(file, 'rb') as f:
-        sb_data = f.read()
+    def task(device, progress=None):
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
+            mb.receive_sb_file(sb_data, progress=progress)
+        return f"Sent {len(sb_data)} bytes"
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        print_summary(devs, run_parallel(devs, task, jobs, True))
+        return
+
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
-            mb.receive_sb_file(sb_data)
+        task(device)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -410,51 +660,171 @@ def sbfile(ctx, file):
 @click.option('-t', '--mtype', type=click.Choice(MEMS), default='INTERNAL', show_default=True, help='Memory Type')
 @click.option('-e', '--erase', is_flag=True, default=False, help='Erase')
 @click.option('-v', '--verify', is_flag=True, default=False, help='Verify')
+@click.option('-s', '--skip-blank', is_flag=True, default=False, help='Skip writing of erased pages (0xFF)')
+@click.option('-b', '--blank-check', is_flag=True, default=False, help='Skip erasing of blank sectors')
+@click.option('-f', '--fill-run', type=UInt(), default=256, show_default=True,
+              help='Min length of repeated 32-bit pattern sent as fill command, 0 for disable')
+@click.option('--force', is_flag=True, default=False, help='Write all sectors, also the unchanged')
 @click.argument('file', nargs=1, type=ImgFile('.bin', '.hex', '.ihex',  '.s19', '.srec', exists=True))
+@gang_options
 @click.pass_context
-def write(ctx, address, offset, mtype, erase, verify, file):
+def write(ctx, address, offset, mtype, erase, verify, skip_blank, blank_check, fill_run, force, file, all_devices,
+          devices, jobs):
 
     mem_id = 0 if mtype == 'INTERNAL' else ExtMemId[mtype]
-    in_data = bincopy.BinFile()
+    image, address, cached = read_input(ctx, file, address, offset)
+    meta_lock = threading.Lock()
+
+    def sector_hashes(planner):
+        # The sector hashes are stored with compiled image for every relocation and memory layout
+        if cached is None:
+            return get_sector_hashes(image, planner, mem_id)
+        cache, key, meta = cached
+        layout = f"{mem_id}:{address:X}:{offset:X}:" + ",".join(f"{start:X}-{end or 0:X}-{sector_size:X}"
+                                                                for start, end, sector_size in planner.regions(mem_id))
+        with meta_lock:
+            sectors = meta.setdefault('sectors', {})
+            if layout not in sectors:
+                sectors[layout] = list(map(list, get_sector_hashes(image, planner, mem_id).items()))
+                try:
+                    cache.save_meta(key, meta)
+                except OSError:
+                    pass
+            return {sector: value for sector, value in sectors[layout]}
+
+    def task(device, progress=None):
+        # The manifest is updated by this command, so it's not passed into McuBoot for dropping on write
+        with McuBoot(device, True, cache_properties=True) as mb:
+            load_profile(ctx, mb)
+            plan = mb.plan()
+            # The sectors with the same content as in last written and verified image are skipped
+            uid = mb.get_uid()
+            manifests = ManifestCache()
+            sectors = manifests.load(uid) if uid is not None else {}
+            hashes = {(mem_id, sector): value for sector, value in sector_hashes(plan.planner).items()}
+            unchanged = set() if force else {key for key, value in hashes.items() if sectors.get(key) == value}
+            # Erase only the sectors touched by image
+            plan.write_image(image, mem_id, {sector for _, sector in unchanged})
+            plan.verify(verify).skip_blank(skip_blank).blank_check(blank_check).fill_runs(fill_run)
+            if uid is not None:
+                # The rewritten sectors are valid only after successful verification
+                for key in hashes.keys() - unchanged:
+                    sectors.pop(key, None)
+                manifests.save(uid, sectors)
+            plan.execute(progress)
+            if uid is not None and verify:
+                sectors.update(hashes)
+                manifests.save(uid, sectors)
+            save_profile(ctx, mb)
+        if unchanged:
+            return f"Written {image.size} bytes, {len(unchanged)} of {len(hashes)} sectors unchanged"
+        return f"Written {image.size} bytes"
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        click.echo(' Writing into MCU memory, please wait !\n')
+        print_summary(devs, run_parallel(devs, task, jobs, True))
+        return
+
+    device = scan_interface(ctx)
+    click.echo(' Writing into MCU memory, please wait !\n')
 
     try:
-        if file.lower().endswith(('.srec', '.s19')):
-            in_data.add_srec_file(file)
-            if address is None:
-                address = in_data.minimum_address
-        elif file.lower().endswith(('.hex', '.ihex')):
-            in_data.add_ihex_file(file)
-            if address is None:
-                address = in_data.minimum_address
+        task(device)
+
+    except Exception as e:
+        print_error(str(e), ctx.obj['DEBUG'])
+
+    if ctx.obj['DEBUG']:
+        click.echo()
+
+    click.echo(" Writen Successfully.")
+
+
+# McuBoot: compile flash plan command
+@cli.command('compile', short_help="Compile image into flash plan file for production")
+@click.option('-a', '--address', type=UInt(), default=None, help='Start Address.')
+@click.option('-o', '--offset', type=UInt(), default=0, show_default=True, help='Offset of input data.')
+@click.option('-t', '--mtype', type=click.Choice(MEMS), default='INTERNAL', show_default=True, help='Memory Type')
+@click.option('-m', '--memory', type=click.STRING, multiple=True,
+              help='Flash region START,SIZE,SECTOR_SIZE[,PAGE_SIZE] (default: memory map of connected device)')
+@click.option('-s', '--skip-blank', is_flag=True, default=False, help='Skip writing of erased pages (0xFF)')
+@click.option('-f', '--fill-run', type=UInt(), default=256, show_default=True,
+              help='Min length of repeated 32-bit pattern sent as fill command, 0 for disable')
+@click.argument('file', nargs=1, type=ImgFile('.bin', '.hex', '.ihex',  '.s19', '.srec', exists=True))
+@click.argument('plan', nargs=1, type=ImgFile('.mbp'))
+@click.pass_context
+def compile_plan(ctx, address, offset, mtype, memory, skip_blank, fill_run, file, plan):
+
+    mem_id = 0 if mtype == 'INTERNAL' else ExtMemId[mtype]
+    image, address, _ = read_input(ctx, file, address, offset)
+
+    try:
+        if memory:
+            regions = [parse_region(value) for value in memory]
+            if mem_id == 0:
+                memory_list = {'internal_flash': dict(enumerate(regions))}
+                page_size = regions[0].get('page_size')
+            else:
+                memory_list = {'external': [dict(region, mem_id=mem_id) for region in regions]}
+                page_size = None
+            planner = ErasePlanner(memory_list, page_size=page_size)
         else:
-            in_data.add_binary_file(file)
-            if address is None:
-                address = 0
+            device = scan_interface(ctx)
+            with McuBoot(device, True, cache_properties=True, manifests=ManifestCache()) as mb:
+                load_profile(ctx, mb)
+                planner = ErasePlanner.from_device(mb)
+                save_profile(ctx, mb)
+
+        bundle = FlashBundle.compile(image, planner, mem_id, fill_run, skip_blank)
+        bundle.save(plan)
 
-        data = in_data.as_binary()
     except Exception as e:
-        print_error(f"Could not read from file: {file} \n [{str(e)}]")
-        raise
+        print_error(str(e), ctx.obj['DEBUG'])
 
-    if offset < len(data):
-        data = data[offset:]
+    if ctx.obj['DEBUG']:
+        click.echo(bundle.info())
 
-    device = scan_interface(ctx.obj['TARGET'])
-    click.echo(' Writing into MCU memory, please wait !\n')
+    click.echo(f" Compiled {len(bundle.commands)} commands with {bundle.size} bytes of data into: {plan}")
+
+
+# McuBoot: execute flash plan command
+@cli.command(short_help="Execute precompiled flash plan")
+@click.option('-v', '--verify', is_flag=True, default=False, help='Verify')
+@click.option('-c', '--check', is_flag=True, default=False, help='Only validate the plan file and print its commands')
+@click.argument('plan', nargs=1, type=ImgFile('.mbp', exists=True))
+@gang_options
+@click.pass_context
+def flash(ctx, verify, check, plan, all_devices, devices, jobs):
+
+    try:
+        bundle = FlashBundle.load(plan)
+        if check:
+            bundle.validate()
+    except Exception as e:
+        print_error(f"Could not load flash plan: {plan} \n [{str(e)}]")
+
+    if check:
+        click.echo(bundle.info())
+        click.echo(f"\n Valid flash plan: {len(bundle.commands)} commands, {bundle.size} bytes of data")
+        return
+
+    def task(device, progress=None):
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
+            bundle.execute(mb, verify, progress)
+        return f"Written {bundle.size} bytes"
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        click.echo(' Flashing MCU memory, please wait !\n')
+        print_summary(devs, run_parallel(devs, task, jobs, True))
+        return
+
+    device = scan_interface(ctx)
+    click.echo(' Flashing MCU memory, please wait !\n')
 
     try:
-        with McuBoot(device, True) as mb:
-            # Read Flash Sector Size of connected MCU
-            flash_sector_size = mb.get_property(PropertyTag.FLASH_SECTOR_SIZE, mem_id)[0]
-            # Align Erase Start Address and Len to Flash Sector Size
-            start_address = (address & ~(flash_sector_size - 1))
-            length = (len(data) & ~(flash_sector_size - 1))
-            if (len(data) % flash_sector_size) > 0:
-                length += flash_sector_size
-            # Erase specified region in MCU Flash memory
-            mb.flash_erase_region(start_address, length, mem_id)
-            # Write data into MCU Flash memory
-            mb.write_memory(address, data, mem_id)
+        task(device)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -462,7 +832,7 @@ def write(ctx, address, offset, mtype, erase, verify, file):
     if ctx.obj['DEBUG']:
         click.echo()
 
-    click.echo(" Writen Successfully.")
+    click.echo(" Flashed Successfully.")
 
 
 # McuBoot: memory read command
@@ -477,13 +847,16 @@ def write(ctx, address, offset, mtype, erase, verify, file):
 def read(ctx, address, length, mtype, compress, file):
 
     mem_id = 0 if mtype == 'INTERNAL' else ExtMemId[mtype]
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     click.echo(" Reading from MCU memory, please wait ! \n")
 
     try:
-        with McuBoot(device, True) as mb:
-            data = mb.read_memory(address, length, mem_id)
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
+            if file is None:
+                data = mb.read_memory(address, length, mem_id)
+            else:
+                save_output(mb.iter_read_memory(address, length, mem_id=mem_id), file, address)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -494,24 +867,6 @@ def read(ctx, address, length, mtype, compress, file):
     if file is None:
         click.echo(hexdump(data, address, compress))
     else:
-        try:
-            if file.lower().endswith(('.srec', '.s19')):
-                srec = bincopy.BinFile()
-                srec.add_binary(data, address)
-                srec.header = 'mboot'
-                with open(file, "w") as f:
-                    f.write(srec.as_srec())
-            elif file.lower().endswith(('.hex', '.ihex')):
-                ihex = bincopy.BinFile()
-                ihex.add_binary(data, address)
-                with open(file, "w") as f:
-                    f.write(ihex.as_ihex())
-            else:
-                with open(file, "wb") as f:
-                    f.write(data)
-        except Exception as e:
-            print_error(f"Could not write to file: {file} \n [{str(e)}]")
-
         click.echo(f"\n Successfully saved into: {file}")
 
 
@@ -521,14 +876,14 @@ def read(ctx, address, length, mtype, compress, file):
 @click.option('-a', '--address', type=UInt(), help='Start Address.')
 @click.option('-l', '--length',  type=UInt(), help='Count of bytes aligned to flash block size')
 @click.option('-t', '--mtype', type=click.Choice(MEMS), default='INTERNAL', show_default=True, help='Memory Type')
+@gang_options
 @click.pass_context
-def erase(ctx, address, length, mass, mtype):
+def erase(ctx, address, length, mass, mtype, all_devices, devices, jobs):
 
     mem_id = 0 if mtype == 'INTERNAL' else ExtMemId[mtype]
-    device = scan_interface(ctx.obj['TARGET'])
 
-    try:
-        with McuBoot(device, True) as mb:
+    def task(device, progress=None):
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             if mass:
                 values = mb.get_property(PropertyTag.AVAILABLE_COMMANDS)
                 commands = parse_property_value(PropertyTag.AVAILABLE_COMMANDS, values)
@@ -542,6 +897,17 @@ def erase(ctx, address, length, mass, mtype):
                 if address is None or length is None:
                     raise Exception("Argument \"-a, --address\" and \"-l, --length\" must be defined !")
                 mb.flash_erase_region(address, length, mem_id)
+        return "Erased"
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        print_summary(devs, run_parallel(devs, task, jobs))
+        return
+
+    device = scan_interface(ctx)
+
+    try:
+        task(device)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -560,10 +926,10 @@ def erase(ctx, address, length, mass, mtype):
 def efuse(ctx, index, value):
 
     read_value = 0
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             if value is not None:
                 mb.efuse_program_once(index, value)
             read_value = mb.efuse_read_once(index)
@@ -587,10 +953,10 @@ def otp(ctx, length, address, data):
 
     print_error("ERROR: 'otp' command is not implemented yet")
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             # TODO: write implementation
             pass
 
@@ -612,11 +978,14 @@ def otp(ctx, length, address, data):
 @click.pass_context
 def resource(ctx, address, length, option, compress, file):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
-            data = mb.flash_read_resource(address, length, option)
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
+            if file is None:
+                data = mb.flash_read_resource(address, length, option)
+            else:
+                save_output(mb.iter_flash_read_resource(address, length, option=option), file, address)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -627,24 +996,6 @@ def resource(ctx, address, length, option, compress, file):
     if file is None:
         click.echo(hexdump(data, address, compress))
     else:
-        try:
-            if file.lower().endswith(('.srec', '.s19')):
-                srec = bincopy.BinFile()
-                srec.add_binary(data, address)
-                srec.header = 'mboot'
-                with open(file, "w") as f:
-                    f.write(srec.as_srec())
-            elif file.lower().endswith(('.hex', '.ihex')):
-                ihex = bincopy.BinFile()
-                ihex.add_binary(data, address)
-                with open(file, "w") as f:
-                    f.write(ihex.as_ihex())
-            else:
-                with open(file, "wb") as f:
-                    f.write(data)
-        except Exception as e:
-            print_error(f'Could not write to file: {file} \n [{str(e)}]')
-
         click.echo(f" Successfully saved into: {file}")
 
 
@@ -654,10 +1005,10 @@ def resource(ctx, address, length, option, compress, file):
 @click.pass_context
 def unlock(ctx, key):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             if key is None:
                 mb.flash_erase_all_unsecure()
             else:
@@ -680,10 +1031,10 @@ def unlock(ctx, key):
 @click.pass_context
 def fill(ctx, address, length, pattern):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.fill_memory(address, length, pattern)
 
     except Exception as e:
@@ -701,10 +1052,10 @@ def fill(ctx, address, length, pattern):
 @click.pass_context
 def update(ctx, address):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.reliable_update(address)
 
     except Exception as e:
@@ -721,10 +1072,10 @@ def update(ctx, address):
 @click.pass_context
 def call(ctx, address, argument):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.call(address, argument)
 
     except Exception as e:
@@ -744,10 +1095,10 @@ def call(ctx, address, argument):
 @click.pass_context
 def execute(ctx, address, argument, stackpointer):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.execute(address, argument, stackpointer)
 
     except Exception as e:
@@ -761,14 +1112,24 @@ def execute(ctx, address, argument, stackpointer):
 
 # McuBoot: reset command
 @cli.command(short_help="Reset MCU")
+@gang_options
 @click.pass_context
-def reset(ctx):
+def reset(ctx, all_devices, devices, jobs):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    def task(device, progress=None):
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
+            mb.reset(reopen=False)
+        return "Reset"
+
+    devs = scan_devices(ctx, all_devices, devices)
+    if devs is not None:
+        print_summary(devs, run_parallel(devs, task, jobs))
+        return
+
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
-            mb.reset(reopen=False)
+        task(device)
 
     except Exception as e:
         print_error(str(e), ctx.obj['DEBUG'])
@@ -787,13 +1148,13 @@ def reset(ctx):
 @click.pass_context
 def keyblob(ctx, count, dekfile, blobfile):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     with open(dekfile, "rb") as f:
         dek_data = f.read()
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             blob_data = mb.generate_key_blob(dek_data, count)
 
     except Exception as e:
@@ -812,10 +1173,10 @@ def keyblob(ctx, count, dekfile, blobfile):
 @click.pass_context
 def kp_enroll(ctx):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_enroll()
 
     except Exception as e:
@@ -832,10 +1193,10 @@ def kp_enroll(ctx):
 @click.pass_context
 def kp_gen_key(ctx, key_type, key_size):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_set_intrinsic_key(key_type, key_size)
 
     except Exception as e:
@@ -852,13 +1213,12 @@ def kp_gen_key(ctx, key_type, key_size):
 @click.pass_context
 def kp_user_key(ctx, key_type, file):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
-    with open(file, "rb") as f:
-        key_data = f.read()
+    key_data = map_file(file)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_set_user_key(key_type, key_data)
 
     except Exception as e:
@@ -874,10 +1234,10 @@ def kp_user_key(ctx, key_type, file):
 @click.pass_context
 def kp_write_nvm(ctx, memid):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_write_nonvolatile(memid)
 
     except Exception as e:
@@ -893,10 +1253,10 @@ def kp_write_nvm(ctx, memid):
 @click.pass_context
 def kp_read_nvm(ctx, memid):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_read_nonvolatile(memid)
 
     except Exception as e:
@@ -913,13 +1273,12 @@ def kp_read_nvm(ctx, memid):
 @click.pass_context
 def kp_write_kstore(ctx, key_type, file):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
-    with open(file, "rb") as f:
-        key_data = f.read()
+    key_data = map_file(file)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             mb.kp_write_key_store(key_type, key_data)
 
     except Exception as e:
@@ -935,10 +1294,10 @@ def kp_write_kstore(ctx, key_type, file):
 @click.pass_context
 def kp_read_kstore(ctx, file):
 
-    device = scan_interface(ctx.obj['TARGET'])
+    device = scan_interface(ctx)
 
     try:
-        with McuBoot(device, True) as mb:
+        with McuBoot(device, True, manifests=ManifestCache()) as mb:
             key_data = mb.kp_read_key_store()
 
     except Exception as e:
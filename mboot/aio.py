@@ -0,0 +1,473 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import asyncio
+from typing import Optional, Callable
+from logging import getLogger
+
+# internal
+from .exceptions import McuBootError
+from .cache import ManifestCache
+from .connection import AsyncDevConnBase
+from .mcuboot import McuBootBase, KeyProvOperation, IO_WRITE, IO_READ, IO_POLL, IO_ABORT, IO_OPEN, IO_CLOSE, IO_SLEEP, \
+                     IO_DATA
+
+logger = getLogger('MBOOT:AIO')
+
+
+########################################################################################################################
+# McuBoot Asynchronous Class
+########################################################################################################################
+
+class AsyncMcuBoot(McuBootBase):
+    """
+    Asynchronous (asyncio) version of McuBoot class with the same set of bootloader commands.
+
+    One event loop can drive many devices, the deadline of any operation can be specified by asyncio.wait_for().
+    If the operation is cancelled in the middle of data phase, the data phase is aborted.
+    """
+
+    def __init__(self, device: AsyncDevConnBase, cmd_exception: bool = False, cache_properties: bool = False,
+                 manifests: Optional[ManifestCache] = None):
+        """
+        Initialize the AsyncMcuBoot object.
+
+        :param device: The instance of asynchronous communication interface class
+        :param cmd_exception: True to throw McuBootCommandError on any error;
+                False to set status code only
+                Note: some operation might raise McuBootCommandError is all cases
+        :param cache_properties: If True, the responses of static properties are cached during the session
+        :param manifests: The ManifestCache object, the sector hashes of device are removed from it before the first
+                          command which changes content of memory
+        """
+        super().__init__(device, cmd_exception, cache_properties, manifests)
+
+    async def __aenter__(self):
+        self.reopen = True
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.close()
+
+    async def open(self):
+        """ Connect to the device. """
+        logger.info(f'Connect: {self._device.info()}')
+        await self._device.open()
+
+    async def close(self):
+        """ Disconnect from the device. """
+        logger.info(f'Closing: {self._device.info()}')
+        await self._device.close()
+
+    async def abort(self):
+        """ Abort executed operation """
+        await self._device.abort()
+
+    async def _request(self, request: str, argument):
+        """
+        Execute one I/O request of operation
+
+        :param request: The type of request (IO_* constant)
+        :param argument: The argument of request
+        :return: The result of request
+        """
+        if request == IO_WRITE:
+            return await self._device.write(argument)
+        if request == IO_READ:
+            return await self._device.read(argument)
+        if request == IO_POLL:
+            return self._device.poll()
+        if request == IO_ABORT:
+            return await self._device.abort()
+        if request == IO_OPEN:
+            return await self._device.open()
+        if request == IO_CLOSE:
+            return await self._device.close()
+        if request == IO_SLEEP:
+            return await asyncio.sleep(argument)
+        raise McuBootError(f"Unsupported I/O request: {request}")
+
+    async def _await_request(self, operation, request: str, argument):
+        """
+        Execute one I/O request of operation, the data phase is aborted if cancelled
+
+        :return: Tuple (result, error), the error is the exception raised by interface
+        """
+        try:
+            return await self._request(request, argument), None
+        except asyncio.CancelledError:
+            logger.debug(f"CMD: Cancelled at {request} request")
+            operation.close()
+            await self._device.abort()
+            raise
+        except Exception as e:
+            return None, e
+
+    async def _run(self, operation):
+        """
+        Execute the I/O requests of operation
+
+        :param operation: The generator of I/O requests (see McuBootBase)
+        :return: The return value of operation
+        """
+        result, error = None, None
+        try:
+            while True:
+                request, argument = operation.throw(error) if error is not None else operation.send(result)
+                result, error = await self._await_request(operation, request, argument)
+        except StopIteration as e:
+            return e.value
+        finally:
+            operation.close()
+
+    async def _iter_run(self, operation):
+        """
+        Execute the I/O requests of operation as asynchronous generator of the data passed by IO_DATA requests
+
+        :param operation: The generator of I/O requests (see McuBootBase)
+        """
+        result, error = None, None
+        try:
+            while True:
+                try:
+                    request, argument = operation.throw(error) if error is not None else operation.send(result)
+                except StopIteration:
+                    return
+                if request == IO_DATA:
+                    result, error = None, None
+                    yield argument
+                else:
+                    result, error = await self._await_request(operation, request, argument)
+        finally:
+            operation.close()
+
+    async def get_property_list(self) -> list:
+        """
+        Get list of available properties
+
+        :return: list
+        """
+        return await self._run(self._get_property_list())
+
+    async def get_memory_list(self) -> dict:
+        """
+        Get list of embedded memories
+
+        :return: dict
+        """
+        return await self._run(self._get_memory_list())
+
+    async def flash_erase_all(self, mem_id: int = 0) -> bool:
+        """
+        Erase complete flash memory without recovering flash security section
+
+        :param mem_id: Memory ID
+        """
+        return await self._run(self._flash_erase_all(mem_id))
+
+    async def flash_erase_region(self, address: int, length: int, mem_id: int = 0) -> bool:
+        """
+        Erase specified range of flash
+
+        :param address: Start address
+        :param length: Count of bytes
+        :param mem_id: Memory ID
+        """
+        return await self._run(self._flash_erase_region(address, length, mem_id))
+
+    async def read_memory(self, address: int, length: int, mem_id: int = 0) -> Optional[bytes]:
+        """
+        Read data from MCU memory
+
+        :param address: Start address
+        :param length: Count of bytes
+        :param mem_id: Memory ID
+        """
+        return await self._run(self._read_memory(address, length, mem_id))
+
+    def iter_read_memory(self, address: int, length: int, chunk: int = 0x1000, mem_id: int = 0):
+        """
+        Read data from MCU memory as asynchronous generator of chunks (data are yielded as they are received)
+
+        :param address: Start address
+        :param length: Count of bytes
+        :param chunk: The size of yielded chunks in bytes (the last one can be shorter)
+        :param mem_id: Memory ID
+        """
+        return self._iter_run(self._iter_read_memory(address, length, chunk, mem_id))
+
+    async def verify_memory(self, address: int, data, mem_id: int = 0, chunk: int = 0x1000) -> bool:
+        """
+        Verify content of MCU memory, the data are read back by segments and compared in chunks. The verification
+        stops at the first different chunk, the different address ranges are available in 'mismatches' attribute.
+
+        :param address: Start address
+        :param data: The reference data as bytes-like object
+        :param mem_id: Memory ID
+        :param chunk: The size of compared chunks in bytes
+        """
+        return await self._run(self._verify_memory(address, data, mem_id, chunk))
+
+    async def read_memory_into(self, address: int, buffer, mem_id: int = 0) -> Optional[int]:
+        """
+        Read data from MCU memory directly into buffer (the count of bytes is given by buffer size)
+
+        Large reads are split into segments of 'segment_size' bytes, each one issued as separate command. If a segment
+        fails, only the missing part of it is read again. The returned count of bytes informs about the progress of
+        incomplete read.
+
+        :param address: Start address
+        :param buffer: The writable bytes-like object (bytearray, memoryview, mmap, ...)
+        :param mem_id: Memory ID
+        :return: Count of received bytes or None if the command failed
+        """
+        return await self._run(self._read_memory_into(address, buffer, mem_id))
+
+    async def write_memory(self, address: int, data, mem_id: int = 0, length: Optional[int] = None,
+                           progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """
+        Write data into MCU memory
+
+        :param address: Start address
+        :param data: Data as bytes-like object, file object or iterable of bytes chunks
+        :param mem_id: Memory ID
+        :param length: Count of bytes (required only if can't be detected from data)
+        :param progress: The callback function with arguments: sent bytes, total bytes
+        """
+        return await self._run(self._write_memory(address, data, mem_id, length, progress))
+
+    async def fill_memory(self, address: int, length: int, pattern: int = 0xFFFFFFFF) -> bool:
+        """
+        Fill MCU memory with specified pattern
+
+        :param address: Start address (must be word aligned)
+        :param length: Count of words (must be word aligned)
+        :param pattern: Count of wrote bytes
+        """
+        return await self._run(self._fill_memory(address, length, pattern))
+
+    async def flash_security_disable(self, backdoor_key: bytes) -> bool:
+        """
+        Disable flash security by using of backdoor key
+
+        :param backdoor_key: The key value as array of 8 bytes
+        """
+        return await self._run(self._flash_security_disable(backdoor_key))
+
+    async def get_property(self, prop_tag: int, index: int = 0) -> Optional[list]:
+        """
+        Get specified property value
+
+        :param prop_tag: Property TAG (see Properties Enum)
+        :param index: External memory ID or internal memory region index (depends on property type)
+        """
+        return await self._run(self._get_property(prop_tag, index))
+
+    async def set_property(self, prop_tag: int, value: int) -> bool:
+        """
+        Set value of specified property
+
+        :param  prop_tag: Property TAG (see Property enumerator)
+        :param  value: The value of selected property
+        """
+        return await self._run(self._set_property(prop_tag, value))
+
+    async def receive_sb_file(self, data, length: Optional[int] = None,
+                              progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """
+        Receive SB file
+
+        :param data: SB file data as bytes-like object, file object or iterable of bytes chunks
+        :param length: Count of bytes (required only if can't be detected from data)
+        :param progress: The callback function with arguments: sent bytes, total bytes
+        """
+        return await self._run(self._receive_sb_file(data, length, progress))
+
+    async def execute(self, address: int, argument: int, sp: int) -> bool:
+        """
+        Execute program on a given address using the stack pointer
+
+        :param address: Jump address (must be word aligned)
+        :param argument: Function arguments address
+        :param sp: Stack pointer address
+        """
+        return await self._run(self._execute(address, argument, sp))
+
+    async def call(self, address: int, argument: int) -> bool:
+        """
+        Call function on a given address
+
+        :param address: Call address (must be word aligned)
+        :param argument: Function arguments address
+        """
+        return await self._run(self._call(address, argument))
+
+    async def reset(self, timeout: int = 2000, reopen: bool = True) -> bool:
+        """
+        Reset MCU and reconnect if enabled
+
+        :param timeout: The maximal waiting time in [ms] for reopen connection
+        :param reopen: True for reopen connection after HW reset else False
+        """
+        return await self._run(self._reset(timeout, reopen))
+
+    async def flash_erase_all_unsecure(self) -> bool:
+        """
+        Erase complete flash memory and recover flash security section
+
+        :return bool
+        """
+        return await self._run(self._flash_erase_all_unsecure())
+
+    async def efuse_read_once(self, index: int) -> Optional[int]:
+        """
+        Read from MCU flash program once region (max 8 bytes)
+
+        :param index: Start index
+        """
+        return await self._run(self._efuse_read_once(index))
+
+    async def efuse_program_once(self, index: int, value: int) -> bool:
+        """
+        Write into MCU once program region
+
+        :param index: Start index
+        :param value: Int value (4 bytes long)
+        """
+        return await self._run(self._efuse_program_once(index, value))
+
+    async def flash_read_once(self, index: int, count: int = 4) -> Optional[bytes]:
+        """
+        Read from MCU flash program once region (max 8 bytes)
+
+        :param index: Start index
+        :param count: Count of bytes
+        """
+        return await self._run(self._flash_read_once(index, count))
+
+    async def flash_program_once(self, index: int, data: bytes) -> bool:
+        """
+        Write into MCU flash program once region (max 8 bytes)
+
+        :param index: Start index
+        :param data: Input data aligned to 4 or 8 bytes
+        """
+        return await self._run(self._flash_program_once(index, data))
+
+    async def flash_read_resource(self, address: int, length: int, option: int = 1) -> Optional[bytes]:
+        """
+        Read resource of flash module
+
+        :param address: Start address
+        :param length: Number of bytes
+        :param option:
+        """
+        return await self._run(self._flash_read_resource(address, length, option))
+
+    def iter_flash_read_resource(self, address: int, length: int, chunk: int = 0x1000, option: int = 1):
+        """
+        Read resource of flash module as asynchronous generator of chunks (data are yielded as they are received)
+
+        :param address: Start address
+        :param length: Number of bytes
+        :param chunk: The size of yielded chunks in bytes (the last one can be shorter)
+        :param option:
+        """
+        return self._iter_run(self._iter_flash_read_resource(address, length, chunk, option))
+
+    async def flash_read_resource_into(self, address: int, buffer, option: int = 1) -> Optional[int]:
+        """
+        Read resource of flash module directly into buffer (the count of bytes is given by buffer size)
+
+        :param address: Start address
+        :param buffer: The writable bytes-like object (bytearray, memoryview, mmap, ...)
+        :param option:
+        :return: Count of received bytes or None if the command failed
+        """
+        return await self._run(self._flash_read_resource_into(address, buffer, option))
+
+    async def configure_memory(self, address: int, mem_id: int) -> bool:
+        """
+        Configure memory
+
+        :param address: The address in memory where are locating configuration data
+        :param mem_id: External memory ID
+        """
+        return await self._run(self._configure_memory(address, mem_id))
+
+    async def reliable_update(self, address: int) -> bool:
+        """
+        Reliable Update
+
+        :param address:
+        """
+        return await self._run(self._reliable_update(address))
+
+    async def generate_key_blob(self, dek_data: bytes, count: int = 72) -> Optional[bytes]:
+        """
+        Generate Key Blob
+
+        :param dek_data: Data Encryption Key as bytes
+        :param count: Key blob count (default: 72 - AES128bit)
+        """
+        return await self._run(self._generate_key_blob(dek_data, count))
+
+    async def kp_enroll(self) -> bool:
+        """
+        Key provisioning: Enroll Command (start PUF)
+        """
+        return await self._run(self._kp_enroll())
+
+    async def kp_set_intrinsic_key(self, key_type: int, key_size: int) -> bool:
+        """
+        Key provisioning: Generate Intrinsic Key
+
+        :param key_type:
+        :param key_size:
+        """
+        return await self._run(self._kp_set_intrinsic_key(key_type, key_size))
+
+    async def kp_write_nonvolatile(self, mem_id: int = 0) -> bool:
+        """
+        Key provisioning: Write the key to a nonvolatile memory
+
+        :param mem_id: The memory ID (default: 0)
+        """
+        return await self._run(self._kp_write_nonvolatile(mem_id))
+
+    async def kp_read_nonvolatile(self, mem_id: int = 0) -> bool:
+        """
+        Key provisioning: Load the key from a nonvolatile memory to bootloader
+
+        :param mem_id: The memory ID (default: 0)
+        """
+        return await self._run(self._kp_read_nonvolatile(mem_id))
+
+    async def kp_set_user_key(self, key_type: int, key_data: bytes) -> bool:
+        """
+        Key provisioning: Send the user key specified by <key_type> to bootloader.
+
+        :param key_type:
+        :param key_data:
+        """
+        return await self._run(self._kp_send_key(KeyProvOperation.SET_USER_KEY, key_type, key_data))
+
+    async def kp_write_key_store(self, key_type: int, key_data: bytes) -> bool:
+        """
+        Key provisioning: Write key data into key store area.
+
+        :param key_type:
+        :param key_data:
+        """
+        return await self._run(self._kp_send_key(KeyProvOperation.WRITE_KEY_STORE, key_type, key_data))
+
+    async def kp_read_key_store(self) -> Optional[bytes]:
+        """
+        Key provisioning: Read key data from key store area.
+        """
+        return await self._run(self._kp_read_key_store())
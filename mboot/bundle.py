@@ -0,0 +1,204 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import os
+import mmap
+import hashlib
+from struct import Struct, pack
+from typing import Optional, Callable, List
+from logging import getLogger
+
+from .image import Image
+from .erase import ErasePlanner
+from .plan import OperationPlan, run_commands
+from .cache import write_file_atomic
+
+logger = getLogger('MBOOT:BUNDLE')
+
+
+########################################################################################################################
+# Flash Plan Bundle
+########################################################################################################################
+
+class FlashBundle:
+    """
+    Precompiled flash plan stored in single memory-mappable file.
+
+    The file contains header, table of ordered erase, fill and write commands with SHA-256 hashes of written data
+    and raw data of write commands. The commands of loaded plan refer to slices of mapped file, so nothing is parsed
+    or planned at execution time.
+    """
+
+    MAGIC = b'MBPLAN\x00\x00'
+    VERSION = 1
+    # magic, version, reserved, commands count, data offset, data size, data hash
+    HEADER = Struct('<8s2H2IQ32s')
+    # kind, mem_id, address, length, data offset or fill pattern, data hash
+    ENTRY = Struct('<4IQ32s')
+    # kind of commands
+    ERASE, ERASE_ALL, FILL, WRITE = 1, 2, 3, 4
+
+    @property
+    def size(self) -> int:
+        """ Count of bytes sent by write commands """
+        return sum(len(cmd[2]) for cmd in self.commands if cmd[0] == 'write')
+
+    def __init__(self, commands: List[tuple], digests: Optional[List[bytes]] = None,
+                 data_digest: Optional[bytes] = None):
+        """
+        Initialize the FlashBundle object.
+
+        :param commands: List of tuples as returned by OperationPlan.optimize()
+        :param digests: The SHA-256 hashes of data for every command (default: calculated)
+        :param data_digest: The SHA-256 hash of data of all write commands (default: calculated)
+        """
+        self.commands = commands
+        if digests is None:
+            digests = [hashlib.sha256(cmd[2]).digest() if cmd[0] == 'write' else bytes(32) for cmd in commands]
+        if data_digest is None:
+            data_digest = self._data_hash().digest()
+        self.digests = digests
+        self.data_digest = data_digest
+
+    @classmethod
+    def compile(cls, image: Image, planner: ErasePlanner, mem_id: int = 0, fill_run: int = 256,
+                skip_blank: bool = False):
+        """
+        Compile the image into flash plan: erase of touched sectors and writing of image data
+
+        :param image: The Image object
+        :param planner: The ErasePlanner object with memory map of target
+        :param mem_id: Memory ID
+        :param fill_run: The minimal length of repeated 32-bit pattern sent as fill command, zero for disable
+        :param skip_blank: True for leaving out the erased pages (0xFF) from written data
+        """
+        plan = OperationPlan(None, planner)
+        plan.write_image(image, mem_id).fill_runs(fill_run).skip_blank(skip_blank)
+        return cls(plan.optimize())
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Load the flash plan from file, the file is mapped into memory
+
+        :param file_path: The file path
+        """
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < cls.HEADER.size:
+                raise ValueError("Invalid flash plan file: too short")
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        magic, version, _, count, data_offset, data_size, data_digest = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError("Invalid flash plan file: wrong magic")
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported flash plan version: {version}")
+        if data_offset < cls.HEADER.size + count * cls.ENTRY.size or data_offset + data_size != len(data):
+            raise ValueError("Invalid flash plan file: wrong size")
+
+        commands = []
+        digests = []
+        table = data[cls.HEADER.size: cls.HEADER.size + count * cls.ENTRY.size]
+        for index, (kind, mem_id, address, length, value, digest) in enumerate(cls.ENTRY.iter_unpack(table)):
+            if kind == cls.ERASE:
+                commands.append(('erase', address, length, mem_id))
+            elif kind == cls.ERASE_ALL:
+                commands.append(('erase_all', mem_id))
+            elif kind == cls.FILL:
+                commands.append(('fill', address, length, value))
+            elif kind == cls.WRITE:
+                if value + length > data_size:
+                    raise ValueError(f"Invalid flash plan file: data of command {index} out of range")
+                commands.append(('write', address, data[data_offset + value: data_offset + value + length], mem_id))
+            else:
+                raise ValueError(f"Invalid flash plan file: unknown command {kind}")
+            digests.append(digest)
+
+        logger.debug(f"BUNDLE: Loaded {count} commands from {file_path}")
+        return cls(commands, digests, data_digest)
+
+    def _data_hash(self):
+        value = hashlib.sha256()
+        for cmd in self.commands:
+            if cmd[0] == 'write':
+                value.update(cmd[2])
+        return value
+
+    def save(self, file_path: str) -> None:
+        """
+        Save the flash plan into file
+
+        :param file_path: The file path
+        """
+        entries = []
+        chunks = []
+        offset = 0
+        for cmd, digest in zip(self.commands, self.digests):
+            if cmd[0] == 'erase':
+                entries.append(self.ENTRY.pack(self.ERASE, cmd[3], cmd[1], cmd[2], 0, digest))
+            elif cmd[0] == 'erase_all':
+                entries.append(self.ENTRY.pack(self.ERASE_ALL, cmd[1], 0, 0, 0, digest))
+            elif cmd[0] == 'fill':
+                entries.append(self.ENTRY.pack(self.FILL, 0, cmd[1], cmd[2], cmd[3], digest))
+            else:
+                entries.append(self.ENTRY.pack(self.WRITE, cmd[3], cmd[1], len(cmd[2]), offset, digest))
+                chunks.append(cmd[2])
+                offset += len(cmd[2])
+        # the data are aligned to 16 bytes
+        data_offset = self.HEADER.size + len(entries) * self.ENTRY.size
+        padding = bytes(-data_offset % 16)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, 0, len(entries), data_offset + len(padding), offset,
+                                  self.data_digest)
+        write_file_atomic(os.path.abspath(file_path), [header, *entries, padding, *chunks], 'wb')
+
+    def validate(self) -> None:
+        """ Check the hashes of data and alignment of fill commands, raise ValueError if the plan is corrupted """
+        if self._data_hash().digest() != self.data_digest:
+            raise ValueError("Invalid flash plan: hash of data does not match")
+        for index, (cmd, digest) in enumerate(zip(self.commands, self.digests)):
+            if cmd[0] == 'write' and hashlib.sha256(cmd[2]).digest() != digest:
+                raise ValueError(f"Invalid flash plan: hash of command {index} does not match")
+            if cmd[0] == 'fill' and (cmd[1] | cmd[2]) % 4:
+                raise ValueError(f"Invalid flash plan: fill command {index} is not word aligned")
+
+    def info(self) -> str:
+        """ Get the list of commands as string """
+        lines = []
+        for cmd, digest in zip(self.commands, self.digests):
+            if cmd[0] == 'erase':
+                lines.append(f"ERASE     0x{cmd[1]:08X} - 0x{cmd[1] + cmd[2] - 1:08X}  mem_id={cmd[3]}")
+            elif cmd[0] == 'erase_all':
+                lines.append(f"ERASE ALL mem_id={cmd[1]}")
+            elif cmd[0] == 'fill':
+                lines.append(f"FILL      0x{cmd[1]:08X} - 0x{cmd[1] + cmd[2] - 1:08X}  pattern=0x{cmd[3]:08X}")
+            else:
+                lines.append(f"WRITE     0x{cmd[1]:08X} - 0x{cmd[1] + len(cmd[2]) - 1:08X}  mem_id={cmd[3]}  "
+                             f"sha256={digest.hex()[:16]}")
+        return '\n'.join(lines)
+
+    def execute(self, mboot, verify: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """
+        Send the commands of flash plan
+
+        :param mboot: The McuBoot object
+        :param verify: True for read back and compare the written and filled data
+        :param progress: The callback function with arguments: processed bytes, total bytes
+        :return: True if all commands succeeded
+        """
+        if not run_commands(mboot, self.commands, progress):
+            return False
+        if verify:
+            for cmd in self.commands:
+                if cmd[0] == 'write':
+                    ret_val = mboot.verify_memory(cmd[1], cmd[2], cmd[3])
+                elif cmd[0] == 'fill':
+                    ret_val = mboot.verify_memory(cmd[1], pack('<I', cmd[3]) * (cmd[2] // 4))
+                else:
+                    continue
+                if not ret_val:
+                    return False
+        return True
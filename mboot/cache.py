@@ -0,0 +1,420 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import os
+import json
+import mmap
+import time
+import hashlib
+import threading
+from typing import Optional, Tuple
+from logging import getLogger
+
+from .commands import parse_cmd_response
+from .image import Image
+
+logger = getLogger('MBOOT:CACHE')
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def get_cache_dir(*subdirs: str) -> str:
+    """
+    Get path of mboot cache directory (MBOOT_CACHE_DIR environment variable or ~/.mboot)
+
+    :param subdirs: The names of sub-directories
+    """
+    path = os.environ.get('MBOOT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.mboot'))
+    return os.path.join(path, *subdirs)
+
+
+def write_file_atomic(file_path: str, data, mode: str = 'w') -> None:
+    """
+    Write file over temporary file, so the readers never see the incomplete content
+
+    :param file_path: The file path
+    :param data: The file content or list of content chunks
+    :param mode: The open mode: 'w' or 'wb'
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, mode) as f:
+        if isinstance(data, list):
+            f.writelines(data)
+        else:
+            f.write(data)
+    os.replace(temp_path, file_path)
+
+
+########################################################################################################################
+# Device Profile
+########################################################################################################################
+
+class DeviceProfile:
+    """ The cached properties of specific device (memory map and supported properties) """
+
+    def __init__(self, identity: str, version: int, responses: Optional[dict] = None,
+                 unsupported: Optional[set] = None):
+        """
+        Initialize the DeviceProfile object.
+
+        :param identity: The device identification (unique or system device ident)
+        :param version: The raw value of CURRENT_VERSION property
+        :param responses: The responses of GetProperty command as dict {(prop_tag, index): CmdResponse}
+        :param unsupported: The set of unsupported property tags
+        """
+        self.identity = identity
+        self.version = version
+        self.responses = responses if responses is not None else {}
+        self.unsupported = unsupported if unsupported is not None else set()
+
+    @property
+    def key(self) -> str:
+        return f"{self.identity}_{self.version:08X}"
+
+    def to_dict(self) -> dict:
+        return {
+            'identity': self.identity,
+            'version': self.version,
+            'responses': [[tag, index, response.to_bytes().hex()]
+                          for (tag, index), response in sorted(self.responses.items())],
+            'unsupported': sorted(self.unsupported)
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        responses = {}
+        for tag, index, raw_data in data['responses']:
+            responses[(tag, index)] = parse_cmd_response(bytes.fromhex(raw_data))
+        return cls(data['identity'], data['version'], responses, set(data.get('unsupported', [])))
+
+
+class ProfileCache:
+    """ Persistent on-disk cache of device profiles """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the ProfileCache object.
+
+        :param path: The cache directory (default: <cache dir>/profiles)
+        """
+        self.path = path if path is not None else get_cache_dir('profiles')
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.path, key + '.json')
+
+    def load(self, identity: str, version: int) -> Optional[DeviceProfile]:
+        """
+        Load device profile
+
+        :param identity: The device identification
+        :param version: The raw value of CURRENT_VERSION property
+        :return: DeviceProfile or None if not exist
+        """
+        file_path = self._file_path(DeviceProfile(identity, version).key)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            with open(file_path, 'r') as f:
+                profile = DeviceProfile.from_dict(json.load(f))
+        except Exception as e:
+            logger.debug(f"Invalid profile file {file_path}: {str(e)}")
+            return None
+        if profile.identity != identity or profile.version != version:
+            return None
+        return profile
+
+    def save(self, profile: DeviceProfile) -> None:
+        """
+        Save device profile
+
+        :param profile: The DeviceProfile object
+        """
+        write_file_atomic(self._file_path(profile.key), json.dumps(profile.to_dict(), indent=1))
+
+    def remove(self, identity: str, version: int) -> None:
+        """
+        Remove device profile
+
+        :param identity: The device identification
+        :param version: The raw value of CURRENT_VERSION property
+        """
+        file_path = self._file_path(DeviceProfile(identity, version).key)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+########################################################################################################################
+# Sector Manifest
+########################################################################################################################
+
+class ManifestCache:
+    """ Persistent on-disk cache of sector hashes of the last written and verified images, keyed by device UID """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the ManifestCache object.
+
+        :param path: The cache directory (default: <cache dir>/manifests)
+        """
+        self.path = path if path is not None else get_cache_dir('manifests')
+
+    def _file_path(self, identity: str) -> str:
+        return os.path.join(self.path, identity + '.json')
+
+    def load(self, identity: str) -> dict:
+        """
+        Load sector hashes of device
+
+        :param identity: The unique device identification
+        :return: The dict {(mem_id, sector_address): hash}, empty if not exist
+        """
+        file_path = self._file_path(identity)
+        if not os.path.isfile(file_path):
+            return {}
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+            if data['identity'] != identity:
+                return {}
+            return {(mem_id, address): digest for mem_id, address, digest in data['sectors']}
+        except Exception as e:
+            logger.debug(f"Invalid manifest file {file_path}: {str(e)}")
+            return {}
+
+    def save(self, identity: str, sectors: dict) -> None:
+        """
+        Save sector hashes of device
+
+        :param identity: The unique device identification
+        :param sectors: The dict {(mem_id, sector_address): hash}
+        """
+        data = {
+            'identity': identity,
+            'sectors': [[mem_id, address, digest] for (mem_id, address), digest in sorted(sectors.items())]
+        }
+        write_file_atomic(self._file_path(identity), json.dumps(data, indent=1))
+
+    def remove(self, identity: str) -> None:
+        """
+        Remove sector hashes of device
+
+        :param identity: The unique device identification
+        """
+        file_path = self._file_path(identity)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+########################################################################################################################
+# UART Baud Rate Cache
+########################################################################################################################
+
+class BaudrateCache:
+    """ Persistent on-disk cache of UART baud rates detected on serial ports """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the BaudrateCache object.
+
+        :param path: The cache file (default: <cache dir>/baudrates.json)
+        """
+        self.path = path if path is not None else get_cache_dir('baudrates.json')
+        self._lock = threading.Lock()
+
+    def _load_all(self) -> dict:
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return dict(json.load(f))
+        except Exception as e:
+            logger.debug(f"Invalid baud rate cache {self.path}: {str(e)}")
+            return {}
+
+    def load(self, port: str) -> Optional[int]:
+        """
+        Load baud rate of serial port
+
+        :param port: The serial port name
+        :return: Baud rate or None if not exist
+        """
+        return self._load_all().get(port)
+
+    def save(self, port: str, baudrate: int) -> None:
+        """
+        Save baud rate of serial port
+
+        :param port: The serial port name
+        :param baudrate: The baud rate
+        """
+        with self._lock:
+            data = self._load_all()
+            data[port] = baudrate
+            write_file_atomic(self.path, json.dumps(data, indent=1))
+
+    def remove(self, port: str) -> None:
+        """
+        Remove baud rate of serial port
+
+        :param port: The serial port name
+        """
+        with self._lock:
+            data = self._load_all()
+            if data.pop(port, None) is not None:
+                write_file_atomic(self.path, json.dumps(data, indent=1))
+
+
+########################################################################################################################
+# Compiled Image Cache
+########################################################################################################################
+
+def get_file_hash(file_path: str) -> str:
+    """
+    Get SHA-256 hash of file content
+
+    :param file_path: The file path
+    """
+    value = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(0x100000), b''):
+            value.update(chunk)
+    return value.hexdigest()
+
+
+class ImageCache:
+    """
+    Persistent on-disk cache of parsed image files keyed by hash of file content.
+
+    The compiled image is stored as raw binary data of all segments (<key>.bin) and small index with segment addresses
+    and additional precomputed values (<key>.json). The loaded image segments are memory-mapped slices of raw data.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 512 * 1024 * 1024, max_age: int = 30 * 24 * 3600):
+        """
+        Initialize the ImageCache object.
+
+        :param path: The cache directory (default: <cache dir>/images)
+        :param max_size: The maximal size of all cached images in bytes
+        :param max_age: The maximal age of unused cached image in seconds
+        """
+        self.path = path if path is not None else get_cache_dir('images')
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def _file_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.path, key + extension)
+
+    def load(self, key: str) -> Optional[Tuple[Image, dict]]:
+        """
+        Load compiled image
+
+        :param key: The hash of source file content
+        :return: Tuple (Image, meta data) or None if not exist
+        """
+        index_path = self._file_path(key, '.json')
+        data_path = self._file_path(key, '.bin')
+        if not os.path.isfile(index_path) or not os.path.isfile(data_path):
+            return None
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            image = Image()
+            if index['size']:
+                with open(data_path, 'rb') as f:
+                    data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                if len(data) != index['size']:
+                    raise ValueError(f"Invalid size {len(data)}")
+                for address, offset, length in index['segments']:
+                    image.add(address, data[offset: offset + length], copy=False)
+            # the access time is used for eviction
+            os.utime(index_path)
+        except Exception as e:
+            logger.debug(f"Invalid cached image {key}: {str(e)}")
+            return None
+        return image, index['meta']
+
+    def save(self, key: str, image: Image, meta: Optional[dict] = None) -> bool:
+        """
+        Save compiled image, the least recently used images are evicted if the limits are exceeded
+
+        :param key: The hash of source file content
+        :param image: The Image object
+        :param meta: The additional precomputed values (must be JSON serializable)
+        :return: False if the image is larger than max_size and it was not saved
+        """
+        segments = []
+        offset = 0
+        for segment in image:
+            segments.append([segment.address, offset, len(segment.data)])
+            offset += len(segment.data)
+        if offset > self.max_size:
+            logger.debug(f"Image {key} with size {offset} exceeds the cache size, not saved")
+            return False
+        # the index is written as last, so the incomplete data are never used
+        write_file_atomic(self._file_path(key, '.bin'), [segment.data for segment in image], 'wb')
+        self.save_meta(key, meta or {}, segments)
+        self.evict(keep=key)
+        return True
+
+    def save_meta(self, key: str, meta: dict, segments: Optional[list] = None) -> None:
+        """
+        Update precomputed values of compiled image
+
+        :param key: The hash of source file content
+        :param meta: The additional precomputed values (must be JSON serializable)
+        :param segments: The segments as list of [address, offset, length] (default: keep current)
+        """
+        index_path = self._file_path(key, '.json')
+        if segments is None:
+            with open(index_path, 'r') as f:
+                segments = json.load(f)['segments']
+        index = {'segments': segments, 'size': sum(length for _, _, length in segments), 'meta': meta}
+        write_file_atomic(index_path, json.dumps(index))
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Remove the images unused longer than max_age and the least recently used images above max_size
+
+        :param keep: The key of image which is never removed (the image just saved)
+        """
+        if not os.path.isdir(self.path):
+            return
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                key = name[:-5]
+                try:
+                    used = os.path.getmtime(self._file_path(key, '.json'))
+                    size = os.path.getsize(self._file_path(key, '.bin'))
+                except OSError:
+                    used, size = 0, 0
+                entries.append((used, size, key))
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for used, size, key in sorted(entries):
+            if now - used <= self.max_age and total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= size
+
+    def remove(self, key: str) -> None:
+        """
+        Remove compiled image
+
+        :param key: The hash of source file content
+        """
+        for extension in ('.json', '.bin'):
+            try:
+                os.remove(self._file_path(key, extension))
+            except OSError:
+                # not exist or still mapped by other process (Windows)
+                pass
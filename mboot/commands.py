@@ -153,6 +153,12 @@ class CmdResponse:
         return f"Tag={ResponseTag[self.header.tag]}" + \
                "".join(f", P[{n}]=0x{param:08X}" for n, param in enumerate(self.params))
 
+    def to_bytes(self) -> bytes:
+        """
+        Serialize CmdResponse into bytes
+        """
+        return self.header.to_bytes() + pack(f"<{len(self.params)}I", *self.params)
+
     @classmethod
     def from_bytes(cls, data: bytes, offset: int = 0):
         """
@@ -5,6 +5,6 @@
 # or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
 
 
-from .base import DevConnBase
-from .usb import scan_usb, RawHid
-from .uart import scan_uart, Uart
+from .base import DevConnBase, AsyncDevConnBase
+from .usb import scan_usb, RawHid, AsyncRawHid
+from .uart import scan_uart, Uart, AsyncUart
@@ -7,6 +7,10 @@
 
 class DevConnBase:
 
+    # The minimal interval in [s] between checks of early response by poll() in data phase (0 - after every packet),
+    # the interfaces with expensive poll() use longer interval
+    poll_interval = 0
+
     @property
     def is_opened(self):
         raise NotImplementedError()
@@ -26,8 +30,59 @@ class DevConnBase:
     def read(self, timeout=1000):
         raise NotImplementedError()
 
+    def poll(self):
+        """
+        Return response packet if it's already received, otherwise None (used for early detection of data phase
+        termination). The interfaces without support of non-blocking read return always None.
+        """
+        return None
+
     def write(self, packet):
         raise NotImplementedError()
 
     def info(self):
         raise NotImplementedError()
+
+
+class AsyncDevConnBase:
+    """ Base class of asynchronous (asyncio) communication interfaces """
+
+    # The minimal interval in [s] between checks of early response by poll() in data phase (0 - after every packet)
+    poll_interval = 0
+
+    @property
+    def is_opened(self):
+        raise NotImplementedError()
+
+    def __init__(self, **kwargs):
+        self.reopen = kwargs.get('reopen', False)
+
+    async def open(self):
+        raise NotImplementedError()
+
+    async def close(self):
+        raise NotImplementedError()
+
+    async def abort(self):
+        raise NotImplementedError()
+
+    async def read(self, timeout=1000):
+        """
+        Read response or data packet
+
+        :param timeout: The maximal waiting time in [ms], raise TimeoutError if expired
+        """
+        raise NotImplementedError()
+
+    def poll(self):
+        """
+        Return response packet if it's already received, otherwise None (used for early detection of data phase
+        termination).
+        """
+        return None
+
+    async def write(self, packet):
+        raise NotImplementedError()
+
+    def info(self):
+        raise NotImplementedError()
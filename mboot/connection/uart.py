@@ -5,14 +5,20 @@
 # or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
 
 
+import asyncio
 import logging
 from time import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from easy_enum import Enum
 from struct import pack, unpack_from
+from typing import List
 from serial import Serial
 from serial.tools.list_ports import comports
-from .base import DevConnBase
-from ..commands import CmdPacket, CmdResponse, parse_cmd_response
+from .base import DevConnBase, AsyncDevConnBase
+from ..commands import CmdPacket, parse_cmd_response
+from ..properties import Version
+from ..exceptions import McuBootConnectionError
 
 
 logger = logging.getLogger('MBOOT:UART')
@@ -22,24 +28,70 @@ logger = logging.getLogger('MBOOT:UART')
 # Helper Methods
 ########################################################################################################################
 
-def crc16(data: bytes, crc_init: int = 0) -> int:
+def _crc16_table() -> List[int]:
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+
+# lookup table of CRC-16/XMODEM (polynomial 0x1021)
+CRC16_TABLE = _crc16_table()
+
+
+def crc16_table(data, crc_init: int = 0) -> int:
     """
-    Calculate 16-bit CRC from input data
+    Calculate 16-bit CRC from input data by lookup table (fallback if binascii.crc_hqx is not available)
 
-    :param data: Input data
-    :param crc_init: Initialization value
+    :param data: Input data (bytes-like object)
+    :param crc_init: Initialization value or CRC of previous data
     """
     crc = crc_init
-    for c in data:
-        crc ^= c << 8
-        for _ in range(8):
-            temp = crc << 1
-            if crc & 0x8000:
-                temp ^= 0x1021
-            crc = temp
+    for c in memoryview(data).cast('B'):
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ c]
     return crc
 
 
+try:
+    from binascii import crc_hqx as _crc_hqx
+except ImportError:
+    _crc_hqx = crc16_table
+
+
+def crc16(data, crc_init: int = 0) -> int:
+    """
+    Calculate 16-bit CRC from input data, the CRC of data split into parts is calculated by chaining the calls:
+    crc16(part2, crc16(part1))
+
+    :param data: Input data (bytes-like object)
+    :param crc_init: Initialization value or CRC of previous data
+    """
+    return _crc_hqx(data, crc_init)
+
+
+class Crc16:
+    """ Incremental calculation of 16-bit CRC """
+
+    def __init__(self, crc_init: int = 0):
+        self.value = crc_init
+
+    def update(self, data):
+        """
+        Add data into calculation
+
+        :param data: Input data (bytes-like object)
+        """
+        self.value = _crc_hqx(data, self.value)
+        return self
+
+
+# The standard baud rates tried by autodetection, the highest first
+BAUDRATES = (921600, 460800, 230400, 115200, 57600, 38400, 19200, 9600)
+
+
 ########################################################################################################################
 # UART Packet
 ########################################################################################################################
@@ -63,41 +115,151 @@ class UartPacket:
         self.fp_type = fp_type
         self.data = data
 
-    def to_bytes(self) -> bytes:
-        raw_data = pack('2B', self.START_BYTE, self.fp_type)
-        if self.data is None:
-            raw_data += b'\x00\x00'
-            crc = crc16(raw_data)
-            raw_data += pack('<H', crc)
-        else:
-            raw_data += pack('<H', len(self.data))
-            crc = crc16(raw_data + bytes(self.data))
-            raw_data += pack('<H', crc) + bytes(self.data)
-        return raw_data
+    @classmethod
+    def from_packet(cls, packet):
+        """
+        Create framing packet for command or data packet
 
+        :param packet: Command packet (CmdPacket) or data packet (bytes-like object)
+        """
+        if isinstance(packet, CmdPacket):
+            return cls(FPT.CMD, packet.to_bytes(False))
+        if isinstance(packet, (bytes, bytearray, memoryview)):
+            return cls(FPT.DATA, packet)
+        raise McuBootConnectionError(f"Unsupported packet type: {type(packet).__name__}")
 
-########################################################################################################################
-# Scan UART method
-########################################################################################################################
+    def to_bytes(self) -> bytes:
+        if self.fp_type in (FPT.ACK, FPT.NAK, FPT.ABORT, FPT.PING):
+            # the special packets are without length and crc fields
+            return pack('2B', self.START_BYTE, self.fp_type)
+        data = b'' if self.data is None else self.data
+        header = pack('<2BH', self.START_BYTE, self.fp_type, len(data))
+        # the CRC is calculated over header and payload without concatenation
+        crc = crc16(data, crc16(header))
+        return b''.join((header, pack('<H', crc), data))
 
-def scan_uart(port=None):
+
+def parse_ping_response(data: bytes) -> tuple:
     """
-    Scan for connected devices
+    Parse payload of ping response, the same handshake is used by Uart and AsyncUart
 
-    :param port: The serial port name Windows (COM<X>), Linux (/dev/tty<XX>) or None
+    :param data: The payload of PingResp packet
+    :return: Tuple (protocol version, options)
     """
-    devices = []
-    ports = comports()
+    version, options = unpack_from('<IH', data)
+    return version, options
+
+
+class UartParser:
+    """ Incremental parser of framing packets received from UART """
+
+    # size of ping response after start byte and packet type: protocol version (4), options (2) and crc (2)
+    PING_RESPONSE_SIZE = 8
+    # the longest payload of command and data packet, the longer length field is corrupted
+    MAX_PAYLOAD_SIZE = 0x1000
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def reset(self) -> None:
+        self._buffer.clear()
+
+    def feed(self, data) -> list:
+        """
+        Append received data and parse all complete framing packets
+
+        :param data: Received bytes
+        :return: List of UartPacket objects, the corrupted packet (CRC or length error) is represented by None
+        """
+        self._buffer += data
+        buffer = self._buffer
+        packets = []
+        offset = 0
+        # the parsed packets are removed from buffer at once
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(UartPacket.START_BYTE, offset)
+                if start < 0:
+                    offset = len(buffer)
+                    break
+                if start > offset:
+                    logger.debug(f"RX: Dropped {start - offset} bytes of garbage")
+                    offset = start
+                if len(buffer) - offset < 2:
+                    break
+                fp_type = buffer[offset + 1]
+                if fp_type in (FPT.ACK, FPT.NAK, FPT.ABORT, FPT.PING):
+                    packets.append(UartPacket(fp_type))
+                    offset += 2
+                elif fp_type == FPT.RESP:
+                    end = offset + 2 + self.PING_RESPONSE_SIZE
+                    if len(buffer) < end:
+                        break
+                    crc, = unpack_from('<H', buffer, end - 2)
+                    if crc16(view[offset: end - 2]) != crc:
+                        # the start byte could be a part of corrupted data, search for next one
+                        packets.append(None)
+                        offset += 1
+                        continue
+                    packets.append(UartPacket(fp_type, bytes(view[offset + 2: end - 2])))
+                    offset = end
+                elif fp_type in (FPT.CMD, FPT.DATA):
+                    if len(buffer) - offset < 6:
+                        break
+                    length, crc = unpack_from('<2H', buffer, offset + 2)
+                    end = offset + 6 + length
+                    if length <= self.MAX_PAYLOAD_SIZE and len(buffer) < end:
+                        break
+                    if length > self.MAX_PAYLOAD_SIZE or \
+                       crc16(view[offset + 6: end], crc16(view[offset: offset + 4])) != crc:
+                        # the length field or start byte could be corrupted, search for next start byte
+                        logger.debug(f"RX: Corrupted {fp_type:#04x} packet with length {length}")
+                        packets.append(None)
+                        offset += 1
+                        continue
+                    packets.append(UartPacket(fp_type, bytes(view[offset + 6: end])))
+                    offset = end
+                else:
+                    # not a start of packet, search for next start byte
+                    offset += 1
+        del buffer[:offset]
+        return packets
 
-    if port:
-        ports = [p for p in ports if p.device == port]
 
-    for p in ports:
-        dev = Uart(p)
-        # TODO: Check connection
-        devices.append(dev)
+########################################################################################################################
+# Scan UART method
+########################################################################################################################
 
-    return devices
+def scan_uart(port=None, baudrate=115200, timeout=100, jobs=32, cache=None):
+    """
+    Scan for serial ports with connected bootloader, all ports are probed by ping concurrently
+
+    :param port: The serial port name Windows (COM<X>), Linux (/dev/tty<XX>), list of names or None for all ports
+    :param baudrate: The baud rate, list of candidate baud rates or None for autodetection from BAUDRATES
+    :param timeout: The maximal waiting time in [ms] for ping response at every baud rate
+    :param jobs: Count of ports probed in parallel
+    :param cache: The BaudrateCache object
+    :return: List of Uart objects (closed) with response to ping, the protocol version is in 'version' attribute
+    """
+    if port is None:
+        ports = [p.device for p in comports()]
+    else:
+        ports = [port] if isinstance(port, str) else list(port)
+
+    def probe(name):
+        dev = Uart(name, baudrate, cache=cache, pings=1, ping_timeout=timeout)
+        try:
+            dev.open()
+        except (McuBootConnectionError, OSError) as e:
+            logger.debug(f"SCAN: {name} -> {str(e)}")
+            return None
+        dev.close()
+        return dev
+
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(ports)))) as pool:
+        return [dev for dev in pool.map(probe, ports) if dev is not None]
 
 
 ########################################################################################################################
@@ -105,21 +267,138 @@ def scan_uart(port=None):
 ########################################################################################################################
 
 class Uart(DevConnBase):
+    """
+    UART interface with framing protocol. Every command and data packet is confirmed by ACK and repeated if the target
+    responds with NAK, the received packets are confirmed the same way. All waiting bytes are read at once and
+    processed by incremental parser, which resynchronizes on next start byte after corrupted frame.
+    """
+
+    # the maximal waiting time in [s] of one read from serial port, the timeouts of operations are counted by loop
+    READ_TIMEOUT = 0.05
 
     @property
     def is_opened(self):
         return self._ser.is_open
 
-    def __init__(self, port, baudrate=115200, **kwargs):
+    @property
+    def baudrate(self) -> int:
+        return self._ser.baudrate
+
+    def __init__(self, port, baudrate=115200, retries=3, cache=None, pings=3, ping_timeout=None, **kwargs):
+        """
+        Initialize the Uart object.
+
+        :param port: The serial port name Windows (COM<X>), Linux (/dev/tty<XX>)
+        :param baudrate: The baud rate, list of candidate baud rates or None for autodetection from BAUDRATES
+        :param retries: Count of repeats of packet rejected by NAK
+        :param cache: The BaudrateCache object for storing of detected baud rate (the cached value is tried first)
+        :param pings: Count of successful pings required for accepting the candidate baud rate
+        :param ping_timeout: The maximal waiting time in [ms] for ping response on open (default: 500 for single baud
+                             rate, 100 for every candidate baud rate)
+        """
         super().__init__(**kwargs)
-        self._ser = Serial(baudrate=baudrate, timeout=0.5)
+        if baudrate is None:
+            baudrate = BAUDRATES
+        self.baudrates = [baudrate] if isinstance(baudrate, int) else list(baudrate)
+        self._ser = Serial(baudrate=self.baudrates[0], timeout=self.READ_TIMEOUT)
         self._ser.port = port
+        self._parser = UartParser()
+        self._rx_queue = deque()
+        self._acks = deque()
+        self._ping_response = None
+        self.retries = retries
+        self.cache = cache
+        self.pings = pings
+        self.ping_timeout = ping_timeout
+        # the protocol version reported by ping response
+        self.version = None
+        self._detected = None
 
     def _send_ufp(self, ufp: UartPacket):
         self._ser.write(ufp.to_bytes())
 
+    def _receive(self) -> None:
+        """ Read all waiting bytes (at least one or until READ_TIMEOUT) and process received packets """
+        data = self._ser.read(self._ser.in_waiting or 1)
+        if data and self._ser.in_waiting:
+            data += self._ser.read(self._ser.in_waiting)
+        for packet in self._parser.feed(data):
+            if packet is None:
+                logger.debug('RX: CRC Error')
+                self._send_ufp(UartPacket(FPT.NAK))
+            elif packet.fp_type in (FPT.ACK, FPT.NAK, FPT.ABORT):
+                self._acks.append(packet.fp_type)
+            elif packet.fp_type == FPT.CMD:
+                self._send_ufp(UartPacket(FPT.ACK))
+                self._rx_queue.append(parse_cmd_response(packet.data))
+            elif packet.fp_type == FPT.DATA:
+                self._send_ufp(UartPacket(FPT.ACK))
+                self._rx_queue.append(packet.data)
+            elif packet.fp_type == FPT.RESP:
+                self._ping_response = packet.data
+
+    def _wait(self, queue: deque, timeout: int):
+        """
+        Receive packets until the queue is not empty
+
+        :param queue: The queue of received packets
+        :param timeout: The maximal waiting time in [ms], raise TimeoutError if expired
+        :return: The first packet from queue
+        """
+        deadline = time() + timeout / 1000
+        while not queue:
+            if time() > deadline:
+                raise TimeoutError()
+            self._receive()
+        return queue.popleft()
+
+    def _try_baudrate(self, baudrate: int, pings: int, timeout: int) -> bool:
+        """ Switch the serial port to baud rate and check the response to specified count of pings """
+        self._ser.baudrate = baudrate
+        self._ser.reset_input_buffer()
+        self._parser.reset()
+        self._rx_queue.clear()
+        self._acks.clear()
+        try:
+            for _ in range(pings):
+                self.ping(timeout)
+        except TimeoutError:
+            logger.debug(f"PING: No response at {baudrate} baud")
+            return False
+        return True
+
     def open(self):
+        """
+        Open the serial port and synchronize the framing by ping. If more baud rates are specified, the baud rate
+        detected by previous open (or cached for the port) and then the candidates from the highest are tried until
+        the target answers all pings.
+
+        The bootloader locks its baud rate on the first ping which it detects after reset and then it answers only at
+        this rate. A fresh target is therefore locked at the first candidate it detects, even if the line is not
+        reliable at this rate, and the lower candidates can't be used until the target is reset. The search over
+        candidates finds the rate of already locked target, for a fresh target on poor line specify one reliable rate.
+        """
         self._ser.open()
+        port = self._ser.port
+        cached = self.cache.load(port) if self.cache is not None else None
+        if len(self.baudrates) == 1:
+            candidates = [(self.baudrates[0], 1, self.ping_timeout or 500)]
+        else:
+            # the baud rate detected by previous open is tried first
+            preferred = self._detected or cached
+            baudrates = sorted(self.baudrates, key=lambda value: (value != preferred, -value))
+            candidates = [(baudrate, self.pings, self.ping_timeout or 100) for baudrate in baudrates]
+        for baudrate, pings, timeout in candidates:
+            if self._try_baudrate(baudrate, pings, timeout):
+                logger.info(f"PING: Connected to {port} at {baudrate} baud")
+                self._detected = baudrate
+                if self.cache is not None and cached != baudrate:
+                    self.cache.save(port, baudrate)
+                return
+        self._ser.close()
+        if self.cache is not None and cached is not None:
+            self.cache.remove(port)
+        raise McuBootConnectionError(f"No response to ping from {port}")
 
     def close(self):
         self._ser.close()
@@ -129,27 +408,204 @@ class Uart(DevConnBase):
             self._send_ufp(UartPacket(FPT.ABORT))
 
     def info(self):
-        pass
+        if self.version is None:
+            return f"{self._ser.port} ({self._ser.baudrate} baud)"
+        return f"{self._ser.port} ({self._ser.baudrate} baud, {self.version})"
+
+    def ping(self, timeout=500):
+        """
+        Check that the target is alive and synchronize the framing
+
+        :param timeout: The maximal waiting time in [ms] for ping response
+        :return: Tuple (protocol version, options)
+        """
+        self._ping_response = None
+        self._send_ufp(UartPacket(FPT.PING))
+        deadline = time() + timeout / 1000
+        while self._ping_response is None:
+            if time() > deadline:
+                raise TimeoutError()
+            self._receive()
+        version, options = parse_ping_response(self._ping_response)
+        self.version = Version(version)
+        return version, options
 
     def read(self, timeout=1000):
         """
-        Read data from UART
+        Read response or data packet from UART
 
-        :param timeout:
+        :param timeout: The maximal waiting time in [ms]
         """
-        raise NotImplementedError()
+        return self._wait(self._rx_queue, timeout)
+
+    def poll(self):
+        if not self._rx_queue and self._ser.in_waiting:
+            self._receive()
+        return self._rx_queue.popleft() if self._rx_queue else None
 
-    def write(self, packet):
+    def write(self, packet, timeout=1000):
         """
-        Write data to UART
+        Write command or data packet into UART and wait for ACK
 
         :param packet: Command or Data packet
+        :param timeout: The maximal waiting time in [ms] for ACK
         """
-        if isinstance(packet, CmdPacket):
-            uart_packet = UartPacket(FPT.CMD, packet.to_bytes())
-        elif isinstance(packet, (bytes, bytearray)):
-            uart_packet = UartPacket(FPT.DATA, packet)
-        else:
-            raise Exception()
+        data = UartPacket.from_packet(packet).to_bytes()
+        self._acks.clear()
+        for _ in range(self.retries + 1):
+            self._ser.write(data)
+            if self._wait(self._acks, timeout) != FPT.NAK:
+                # ACK or ABORT of data phase (the status is reported by following response packet)
+                return
+            logger.debug('TX: NAK received, packet is repeated')
+        raise McuBootConnectionError('Packet not accepted by target')
+
+
+class AsyncUart(AsyncDevConnBase):
+    """
+    Asynchronous UART interface, the received data are processed by event loop reader (POSIX systems only).
+    Every command and data packet is confirmed by ACK and repeated if the target responds with NAK.
+
+    The port is synchronized by ping on open like in Uart class, the ping also locks the baud rate of fresh target.
+    """
 
-        data = uart_packet.to_bytes()
+    @property
+    def is_opened(self):
+        return self._ser.is_open
+
+    def __init__(self, port, baudrate=115200, retries=3, ping_timeout=500, **kwargs):
+        """
+        Initialize the AsyncUart object.
+
+        :param port: The serial port name Windows (COM<X>), Linux (/dev/tty<XX>)
+        :param baudrate: The baud rate
+        :param retries: Count of repeats of packet rejected by NAK
+        :param ping_timeout: The maximal waiting time in [ms] for ping response on open
+        """
+        super().__init__(**kwargs)
+        self._ser = Serial(baudrate=baudrate, timeout=0)
+        self._ser.port = port
+        self._parser = UartParser()
+        self._loop = None
+        self._rx_queue = None
+        self._ack = None
+        self._ping_response = None
+        self.retries = retries
+        self.ping_timeout = ping_timeout
+        # the protocol version reported by ping response
+        self.version = None
+
+    def _send_ufp(self, ufp: UartPacket):
+        self._ser.write(ufp.to_bytes())
+
+    def _on_data(self):
+        try:
+            data = self._ser.read(self._ser.in_waiting or 1)
+        except Exception as e:
+            logger.debug(f"RX: {str(e)}")
+            return
+        for packet in self._parser.feed(data):
+            if packet is None:
+                logger.debug('RX: CRC Error')
+                self._send_ufp(UartPacket(FPT.NAK))
+            elif packet.fp_type in (FPT.ACK, FPT.NAK, FPT.ABORT):
+                if self._ack is not None and not self._ack.done():
+                    self._ack.set_result(packet.fp_type)
+            elif packet.fp_type == FPT.CMD:
+                self._send_ufp(UartPacket(FPT.ACK))
+                self._rx_queue.put_nowait(parse_cmd_response(packet.data))
+            elif packet.fp_type == FPT.DATA:
+                self._send_ufp(UartPacket(FPT.ACK))
+                self._rx_queue.put_nowait(packet.data)
+            elif packet.fp_type == FPT.RESP:
+                if self._ping_response is not None and not self._ping_response.done():
+                    self._ping_response.set_result(packet.data)
+
+    async def open(self):
+        """
+        Open the serial port and synchronize the framing by ping, the bootloader locks its baud rate on the first
+        ping which it detects after reset (see Uart.open)
+        """
+        self._ser.open()
+        self._loop = asyncio.get_event_loop()
+        self._rx_queue = asyncio.Queue()
+        self._parser.reset()
+        self._loop.add_reader(self._ser.fileno(), self._on_data)
+        try:
+            await self.ping(self.ping_timeout)
+        except TimeoutError:
+            await self.close()
+            raise McuBootConnectionError(f"No response to ping from {self._ser.port}")
+        logger.info(f"PING: Connected to {self._ser.port} at {self._ser.baudrate} baud")
+
+    async def close(self):
+        if self._ser.is_open:
+            self._loop.remove_reader(self._ser.fileno())
+            self._ser.close()
+
+    async def abort(self):
+        if self._ser.is_open:
+            self._send_ufp(UartPacket(FPT.ABORT))
+
+    def info(self):
+        if self.version is None:
+            return f"{self._ser.port} ({self._ser.baudrate} baud)"
+        return f"{self._ser.port} ({self._ser.baudrate} baud, {self.version})"
+
+    async def ping(self, timeout=500):
+        """
+        Check that the target is alive and synchronize the framing
+
+        :param timeout: The maximal waiting time in [ms] for ping response
+        :return: Tuple (protocol version, options)
+        """
+        self._ping_response = self._loop.create_future()
+        self._send_ufp(UartPacket(FPT.PING))
+        try:
+            data = await asyncio.wait_for(self._ping_response, timeout / 1000)
+        except asyncio.TimeoutError:
+            raise TimeoutError()
+        finally:
+            self._ping_response = None
+        version, options = parse_ping_response(data)
+        self.version = Version(version)
+        return version, options
+
+    async def read(self, timeout=1000):
+        """
+        Read response or data packet from UART
+
+        :param timeout: The maximal waiting time in [ms]
+        """
+        try:
+            return await asyncio.wait_for(self._rx_queue.get(), timeout / 1000)
+        except asyncio.TimeoutError:
+            raise TimeoutError()
+
+    def poll(self):
+        if self._rx_queue is None or self._rx_queue.empty():
+            return None
+        return self._rx_queue.get_nowait()
+
+    async def write(self, packet, timeout=1000):
+        """
+        Write command or data packet into UART and wait for ACK
+
+        :param packet: Command or Data packet
+        :param timeout: The maximal waiting time in [ms] for ACK
+        """
+        data = UartPacket.from_packet(packet).to_bytes()
+        for _ in range(self.retries + 1):
+            self._ack = self._loop.create_future()
+            self._ser.write(data)
+            try:
+                result = await asyncio.wait_for(self._ack, timeout / 1000)
+            except asyncio.TimeoutError:
+                raise TimeoutError()
+            finally:
+                self._ack = None
+            if result != FPT.NAK:
+                # ACK or ABORT of data phase (the status is reported by following response packet)
+                return
+            logger.debug('TX: NAK received, packet is repeated')
+        raise McuBootConnectionError('Packet not accepted by target')
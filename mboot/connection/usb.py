@@ -6,11 +6,14 @@
 
 
 import os
+import errno
+import asyncio
 import logging
 import collections
 from time import time
-from struct import pack, unpack_from
-from .base import DevConnBase
+from struct import pack_into, unpack_from
+from typing import Iterator
+from .base import DevConnBase, AsyncDevConnBase
 from ..commands import CmdPacket, parse_cmd_response
 
 logger = logging.getLogger('MBOOT:USB')
@@ -70,6 +73,48 @@ REPORT_ID = {
 }
 
 
+class ReportEncoder:
+    """
+    Encoder of HID reports with fixed size. All reports are filled in place into one preallocated buffer, so the
+    yielded report must be sent before the next one is requested.
+    """
+
+    def __init__(self, report_size: int):
+        """
+        Initialize the ReportEncoder object.
+
+        :param report_size: The size of HID report in bytes (including report ID and header)
+        """
+        self.report_size = report_size
+        self._buffer = bytearray(report_size)
+        self._view = memoryview(self._buffer)
+        self._zeros = bytes(report_size)
+        # length of data in buffer, the padding after shorter data is cleared
+        self._length = 0
+
+    def iter_reports(self, report_id: int, data) -> Iterator[bytearray]:
+        """
+        Split the data into HID reports
+
+        :param report_id: The report ID
+        :param data: The bytes-like object
+        :return: Iterator of reports, all reports are the same reused bytearray object
+        """
+        data = memoryview(data).cast('B')
+        payload_size = self.report_size - 4
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for offset in range(0, len(data), payload_size):
+            length = min(len(data) - offset, payload_size)
+            pack_into('<2BH', self._buffer, 0, report_id, 0x00, length)
+            self._view[4: 4 + length] = data[offset: offset + length]
+            if length < self._length:
+                self._view[4 + length: 4 + self._length] = self._zeros[:self._length - length]
+            self._length = length
+            if debug:
+                logger.debug(f"OUT[{self.report_size}]: " + ' '.join(f"{b:02X}" for b in self._buffer))
+            yield self._buffer
+
+
 class RawHidBase(DevConnBase):
 
     @property
@@ -83,19 +128,17 @@ class RawHidBase(DevConnBase):
         self.pid = 0
         self.vendor_name = ""
         self.product_name = ""
+        self._encoder = None
 
-    @staticmethod
-    def _encode_report(report_id, report_size, data, offset=0):
-        data_len = min(len(data) - offset, report_size - 4)
-        raw_data = pack('<2BH', report_id, 0x00, data_len)
-        raw_data += data[offset: offset + data_len]
-        raw_data += bytes([0x00] * (report_size - len(raw_data)))
-        logger.debug(f"OUT[{len(raw_data)}]: " + ' '.join(f"{b:02X}" for b in raw_data))
-        return raw_data, offset + data_len
+    def _iter_reports(self, report_id, report_size, data):
+        if self._encoder is None or self._encoder.report_size != report_size:
+            self._encoder = ReportEncoder(report_size)
+        return self._encoder.iter_reports(report_id, data)
 
     @staticmethod
     def _decode_report(raw_data):
-        logger.debug(f"IN [{len(raw_data)}]: " + ' '.join(f"{b:02X}" for b in raw_data))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"IN [{len(raw_data)}]: " + ' '.join(f"{b:02X}" for b in raw_data))
         report_id, _, plen = unpack_from('<2BH', raw_data)
         data = bytes(raw_data[4: 4 + plen])
         if report_id == REPORT_ID['CMD_IN']:
@@ -176,16 +219,14 @@ if os.name == "nt":
             if isinstance(packet, CmdPacket):
                 report_id = REPORT_ID['CMD_OUT']
                 data = packet.to_bytes()
-            elif isinstance(packet, (bytes, bytearray)):
+            elif isinstance(packet, (bytes, bytearray, memoryview)):
                 report_id = REPORT_ID['DATA_OUT']
                 data = packet
             else:
                 raise Exception()
 
-            data_index = 0
             report_size = self.report[report_id - 1]._HidReport__raw_report_size
-            while data_index < len(data):
-                raw_data, data_index = self._encode_report(report_id, report_size, data, data_index)
+            for raw_data in self._iter_reports(report_id, report_size, data):
                 self.report[report_id - 1].send(raw_data)
 
         def read(self, timeout=2000):
@@ -202,6 +243,15 @@ if os.name == "nt":
             raw_data = self.rcv_data.popleft()
             return self._decode_report(bytes(raw_data))
 
+        def poll(self):
+            """
+            Return already received packet from IN endpoint or None
+            """
+            if len(self.rcv_data) == 0:
+                return None
+            raw_data = self.rcv_data.popleft()
+            return self._decode_report(bytes(raw_data))
+
         @staticmethod
         def enumerate(vid, pid):
             """
@@ -255,6 +305,9 @@ else:
             - write/read an endpoint
         """
 
+        # every poll() is a read with timeout of 1ms, which would halve the write speed if called after every report
+        poll_interval = 0.05
+
         def __init__(self):
             super().__init__()
             self.ep_out = None
@@ -286,17 +339,15 @@ else:
             if isinstance(packet, CmdPacket):
                 report_id = REPORT_ID['CMD_OUT']
                 data = packet.to_bytes()
-            elif isinstance(packet, (bytes, bytearray)):
+            elif isinstance(packet, (bytes, bytearray, memoryview)):
                 report_id = REPORT_ID['DATA_OUT']
                 data = packet
             else:
                 raise Exception()
 
-            data_index = 0
             if self.ep_out:
                 report_size = self.ep_out.wMaxPacketSize
-                while data_index < len(data):
-                    raw_data, data_index = self._encode_report(report_id, report_size, data, data_index)
+                for raw_data in self._iter_reports(report_id, report_size, data):
                     self.ep_out.write(raw_data)
 
             else:
@@ -305,8 +356,7 @@ else:
                 wValue = 0x200 + report_id      # Issuing an OUT report with specified ID
                 wIndex = self.interface_number  # Interface number for HID
                 report_size = 36                # TODO: get the value from descriptor
-                while data_index < len(data):
-                    raw_data, data_index = self._encode_report(report_id, report_size, data, data_index)
+                for raw_data in self._iter_reports(report_id, report_size, data):
                     self.device.ctrl_transfer(bmRequestType, bmRequest, wValue, wIndex, raw_data)
 
         def read(self, timeout=1000):
@@ -319,6 +369,19 @@ else:
             raw_data = self.ep_in.read(self.ep_in.wMaxPacketSize, timeout)
             return self._decode_report(raw_data)
 
+        def poll(self):
+            """
+            Return already received packet from IN endpoint or None
+            """
+            try:
+                # the zero timeout means infinite wait in libusb
+                raw_data = self.ep_in.read(self.ep_in.wMaxPacketSize, 1)
+            except usb.core.USBError as e:
+                if e.errno != errno.ETIMEDOUT:
+                    raise
+                return None
+            return self._decode_report(raw_data)
+
         @staticmethod
         def enumerate(vid, pid):
             """
@@ -388,3 +451,57 @@ else:
                 targets.append(new_target)
 
             return targets
+
+
+########################################################################################################################
+# USB Asynchronous Interface Class
+########################################################################################################################
+
+class AsyncRawHid(AsyncDevConnBase):
+    """
+    Asynchronous wrapper of RawHid interface, the blocking USB transfers are executed in executor (thread pool),
+    so the event loop is never blocked.
+    """
+
+    @property
+    def is_opened(self):
+        return self._device.is_opened
+
+    @property
+    def poll_interval(self):
+        return self._device.poll_interval
+
+    def __init__(self, device: RawHid, executor=None, **kwargs):
+        """
+        Initialize the AsyncRawHid object.
+
+        :param device: The RawHid object (see scan_usb())
+        :param executor: The concurrent.futures executor (None for default executor of event loop)
+        """
+        super().__init__(**kwargs)
+        self._device = device
+        self._executor = executor
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        await self._run(self._device.open)
+
+    async def close(self):
+        await self._run(self._device.close)
+
+    async def abort(self):
+        await self._run(self._device.abort)
+
+    async def read(self, timeout=1000):
+        return await self._run(self._device.read, timeout)
+
+    def poll(self):
+        return self._device.poll()
+
+    async def write(self, packet):
+        await self._run(self._device.write, packet)
+
+    def info(self):
+        return self._device.info()
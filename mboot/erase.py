@@ -0,0 +1,191 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+from typing import Optional, List, Tuple
+from logging import getLogger
+
+from .image import merge_ranges
+from .properties import PropertyTag
+from .exceptions import McuBootCommandError
+
+logger = getLogger('MBOOT:ERASE')
+
+
+########################################################################################################################
+# Erase Planner
+########################################################################################################################
+
+class ErasePlanner:
+    """
+    Builds the minimal set of aligned erase commands from the memory map of target.
+
+    The erase ranges are extended or checked to sector boundaries of flash region which they touch, the ranges in
+    internal RAM are dropped (RAM needs no erase) and the ranges overlapping reserved regions are refused. The ranges
+    covering complete flash (or its erase_all_threshold part) are replaced by one erase all command.
+    """
+
+    def __init__(self, memory_list: dict, reserved: Optional[List[Tuple[int, int]]] = None,
+                 page_size: Optional[int] = None, erase_all_threshold: float = 1.0):
+        """
+        Initialize the ErasePlanner object.
+
+        :param memory_list: The memory list as returned by McuBoot.get_memory_list()
+        :param reserved: The list of reserved regions as tuples (start, end), the end is exclusive
+        :param page_size: The page size of internal flash (FLASH_PAGE_SIZE property)
+        :param erase_all_threshold: The minimal covered part of every flash region for using erase all, the sectors
+                                    which are not covered are erased too (default: only complete memory)
+        """
+        self.erase_all_threshold = erase_all_threshold
+        # write page sizes for every memory id
+        self._page_size = {0: page_size}
+        # erasable regions as list of (start, end, sector_size) for every memory id
+        self._flash = {0: []}
+        for region in memory_list.get('internal_flash', {}).values():
+            if 'sector_size' in region:
+                self._flash[0].append((region['address'], region['address'] + region['size'],
+                                       region['sector_size']))
+        for mem in memory_list.get('external', []):
+            sector_size = mem.get('sector_size', mem.get('block_size'))
+            if sector_size:
+                start = mem.get('address', 0)
+                end = start + mem['size'] if 'size' in mem else None
+                self._flash.setdefault(mem['mem_id'], []).append((start, end, sector_size))
+            self._page_size[mem['mem_id']] = mem.get('page_size')
+        self._ram = [(region['address'], region['address'] + region['size'])
+                     for region in memory_list.get('internal_ram', {}).values()]
+        self.reserved = merge_ranges(reserved or [])
+
+    @classmethod
+    def from_device(cls, mboot):
+        """
+        Create the ErasePlanner object from memory list and reserved regions of connected device
+
+        :param mboot: The McuBoot object
+        """
+        try:
+            memory_list = mboot.get_memory_list()
+        except McuBootCommandError:
+            memory_list = {}
+        try:
+            values = mboot.get_property(PropertyTag.RESERVED_REGIONS)
+        except McuBootCommandError:
+            values = None
+        reserved = []
+        if values:
+            # the end address of reserved region is inclusive, the empty regions are reported as (0, 0)
+            reserved = [(values[i], values[i + 1] + 1) for i in range(0, len(values) - 1, 2)
+                        if values[i] != values[i + 1]]
+        try:
+            values = mboot.get_property(PropertyTag.FLASH_PAGE_SIZE)
+        except McuBootCommandError:
+            values = None
+        return cls(memory_list, reserved, values[0] if values else None)
+
+    def page_size(self, mem_id: int = 0) -> Optional[int]:
+        """
+        Get the write page size of memory
+
+        :param mem_id: Memory ID
+        :return: Page size in bytes or None if not known
+        """
+        return self._page_size.get(mem_id)
+
+    def regions(self, mem_id: int = 0) -> List[Tuple[int, Optional[int], int]]:
+        """
+        Get the erasable regions of memory
+
+        :param mem_id: Memory ID
+        :return: List of tuples (start, end, sector_size), the end is None if the size of memory is not known
+        """
+        return list(self._flash.get(mem_id, []))
+
+    def region(self, address: int, mem_id: int = 0) -> Optional[Tuple[int, int, int]]:
+        """
+        Get the flash region which contains specified address
+
+        :param address: The address
+        :param mem_id: Memory ID
+        :return: Tuple (start, end, sector_size) or None if the address is not in known flash region
+        """
+        for start, end, sector_size in self._flash.get(mem_id, []):
+            if start <= address and (end is None or address < end):
+                return start, end, sector_size
+        return None
+
+    def align(self, start: int, end: int, mem_id: int = 0) -> Tuple[int, int]:
+        """
+        Extend the range <start, end) to boundaries of sectors which it touches
+
+        :param start: Start address
+        :param end: End address (exclusive)
+        :param mem_id: Memory ID
+        :return: Tuple (start, end)
+        """
+        region = self.region(start, mem_id)
+        if region is not None:
+            start -= (start - region[0]) % region[2]
+        region = self.region(end - 1, mem_id)
+        if region is not None:
+            end += -(end - region[0]) % region[2]
+        return start, end
+
+    def is_ram(self, start: int, end: int, mem_id: int = 0) -> bool:
+        """ Check if the range <start, end) is inside internal RAM """
+        return mem_id == 0 and any(ram_start <= start and end <= ram_end for ram_start, ram_end in self._ram)
+
+    def _use_erase_all(self, ranges: List[Tuple[int, int]], mem_id: int) -> bool:
+        """
+        Check if the mass erase is cheaper than erasing of merged ranges sector by sector. It's used only if the
+        ranges cover the erase_all_threshold part of every flash region, the memory with unknown size or with reserved
+        regions (they would be erased too) is always erased by ranges
+        """
+        regions = self._flash.get(mem_id, [])
+        if not regions or any(end is None for _, end, _ in regions):
+            return False
+        total = 0
+        for start, end, _ in regions:
+            if mem_id == 0 and any(start < reserved_end and reserved_start < end
+                                   for reserved_start, reserved_end in self.reserved):
+                return False
+            covered = sum(min(end, range_end) - max(start, range_start) for range_start, range_end in ranges
+                          if range_start < end and start < range_end)
+            if covered < (end - start) * self.erase_all_threshold:
+                return False
+            total += covered
+        # the ranges outside flash regions are not erased by erase all
+        return total == sum(end - start for start, end in ranges)
+
+    def plan(self, ranges: List[Tuple[int, int]], mem_id: int = 0, align: bool = False) -> List[tuple]:
+        """
+        Get the minimal list of erase commands for specified ranges
+
+        :param ranges: The list of ranges as tuples (start, end)
+        :param mem_id: Memory ID
+        :param align: True for extending the ranges to sector boundaries, False for refusing unaligned ranges
+        :return: List of tuples: ('erase', address, length, mem_id) or ('erase_all', mem_id)
+        """
+        ranges = [(start, end) for start, end in ranges if end > start and not self.is_ram(start, end, mem_id)]
+        if align:
+            ranges = [self.align(start, end, mem_id) for start, end in ranges]
+        ranges = merge_ranges(ranges)
+
+        for start, end in ranges:
+            for reserved_start, reserved_end in self.reserved:
+                if mem_id == 0 and start < reserved_end and reserved_start < end:
+                    raise ValueError(f"Erase region 0x{start:08X} - 0x{end:08X} overlaps reserved region "
+                                     f"0x{reserved_start:08X} - 0x{reserved_end - 1:08X}")
+            for address, boundary in ((start, start), (end - 1, end)):
+                region = self.region(address, mem_id)
+                if region is not None and (boundary - region[0]) % region[2]:
+                    raise ValueError(f"Erase region 0x{start:08X} - 0x{end:08X} is not aligned to sector size "
+                                     f"0x{region[2]:X}")
+
+        if self._use_erase_all(ranges, mem_id):
+            logger.info(f"ERASE: {len(ranges)} region(s) replaced by erase all (mem_id={mem_id})")
+            return [('erase_all', mem_id)]
+
+        return [('erase', start, end - start, mem_id) for start, end in ranges]
@@ -45,3 +45,16 @@ class McuBootConnectionError(McuBootError):
     MBoot Module: Connection Exception
     """
     fmt = 'MBoot ERROR: Connection issue -> {description}'
+
+
+class McuBootVerifyError(McuBootError):
+    """
+    MBoot Module: Verification Exception
+    """
+    fmt = 'MBoot ERROR: Verification failed -> {description}'
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+        self.description = ", ".join(f"0x{start:08X} - 0x{end:08X}" for start, end in ranges[:8])
+        if len(ranges) > 8:
+            self.description += f", ... ({len(ranges)} ranges)"
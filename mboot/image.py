@@ -0,0 +1,126 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Tuple
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merge overlapping and adjacent address ranges
+
+    :param ranges: The list of ranges as tuples (start, end)
+    :return: Sorted list of merged ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+########################################################################################################################
+# Sparse Memory Image
+########################################################################################################################
+
+class Segment:
+    """ Continuous block of data """
+
+    __slots__ = ('address', 'data')
+
+    @property
+    def end(self) -> int:
+        return self.address + len(self.data)
+
+    def __init__(self, address: int, data: bytearray):
+        self.address = address
+        self.data = data
+
+    def __repr__(self):
+        return f"<Segment(address=0x{self.address:08X}, size={len(self.data)})>"
+
+    def __eq__(self, obj):
+        return isinstance(obj, Segment) and self.address == obj.address and self.data == obj.data
+
+
+class Image:
+    """ Sparse memory image: sorted list of non-overlapping segments, the adjacent segments are merged """
+
+    @property
+    def size(self) -> int:
+        """ Count of data bytes in all segments """
+        return sum(len(segment.data) for segment in self._segments)
+
+    @property
+    def segments(self) -> List[Segment]:
+        return self._segments
+
+    def __init__(self):
+        self._segments = []
+
+    def __len__(self):
+        return len(self._segments)
+
+    def __iter__(self) -> Iterator[Segment]:
+        return iter(self._segments)
+
+    def __bool__(self):
+        return bool(self._segments)
+
+    def _span(self, start: int, end: int) -> Tuple[int, int]:
+        """ Get indexes of segments which overlap or touch range <start, end) """
+        starts = [segment.address for segment in self._segments]
+        first = bisect_left(starts, start)
+        if first > 0 and self._segments[first - 1].end >= start:
+            first -= 1
+        return first, bisect_right(starts, end)
+
+    def add(self, address: int, data, copy: bool = True) -> None:
+        """
+        Add data into image, the overlapped data are overwritten
+
+        :param address: Start address
+        :param data: The bytes-like object
+        :param copy: False for keeping the reference to data if they aren't merged with other segments (the data
+                     must not be modified later)
+        """
+        end = address + len(data)
+        if end == address:
+            return
+        first, last = self._span(address, end)
+        if first < last:
+            start = min(address, self._segments[first].address)
+            buffer = bytearray(max(end, self._segments[last - 1].end) - start)
+            for segment in self._segments[first:last]:
+                buffer[segment.address - start: segment.end - start] = segment.data
+            buffer[address - start: end - start] = data
+        else:
+            start, buffer = address, bytearray(data) if copy else memoryview(data).cast('B')
+        self._segments[first:last] = [Segment(start, buffer)]
+
+    def remove(self, address: int, length: int) -> None:
+        """
+        Remove data from image
+
+        :param address: Start address
+        :param length: Count of bytes
+        """
+        end = address + length
+        first, last = self._span(address, end)
+        segments = []
+        for segment in self._segments[first:last]:
+            if segment.address < address:
+                segments.append(Segment(segment.address, segment.data[:address - segment.address]))
+            if segment.end > end:
+                segments.append(Segment(end, segment.data[end - segment.address:]))
+        self._segments[first:last] = segments
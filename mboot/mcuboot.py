@@ -5,18 +5,23 @@
 # or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
 
 
-from time import sleep
-from typing import Optional
+import mmap
+from time import sleep, monotonic
+from typing import Optional, Callable
 from logging import getLogger
 from easy_enum import Enum
 
 # internal
-from .commands import CommandTag, CmdPacket, CmdResponse, GenericResponse
+from .commands import CommandTag, ResponseTag, CmdPacket, CmdResponse, GenericResponse, GetPropertyResponse, \
+                       PacketHeader
 from .memories import ExtMemPropTags, ExtMemId
-from .properties import PropertyTag, Version, parse_property_value
-from .exceptions import McuBootError, McuBootCommandError, McuBootConnectionError
+from .properties import PropertyTag, Version, parse_property_value, STATIC_PROPERTIES, INDEXED_PROPERTIES, \
+                         PROPERTIES_VERSION
+from .exceptions import McuBootError, McuBootCommandError, McuBootConnectionError, McuBootVerifyError
 from .errorcodes import StatusCode
 from .connection import DevConnBase
+from .cache import DeviceProfile, ProfileCache, ManifestCache
+from .plan import OperationPlan
 
 ########################################################################################################################
 # McuBoot Logger Name
@@ -24,6 +29,214 @@ from .connection import DevConnBase
 
 logger = getLogger('MBOOT')
 
+# Size of data packet used if the MAX_PACKET_SIZE property is not supported by target
+DEFAULT_MAX_PACKET_SIZE = 32
+
+
+########################################################################################################################
+# McuBoot helper functions
+########################################################################################################################
+
+def get_data_length(data) -> Optional[int]:
+    """
+    Get length of data (bytes-like object, memory-mapped file, file object or iterable of bytes chunks)
+
+    :param data: Input data
+    :return: Length in bytes or None if it's unknown
+    """
+    if isinstance(data, (bytes, bytearray, mmap.mmap)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+    if hasattr(data, 'read'):
+        if hasattr(data, 'seekable') and not data.seekable():
+            return None
+        position = data.tell()
+        length = data.seek(0, 2) - position
+        data.seek(position)
+        return length
+    if isinstance(data, (list, tuple)):
+        return sum(len(chunk) for chunk in data)
+    return None
+
+
+def iter_data_packets(data, packet_size: int):
+    """
+    Split input data into packets of specified size
+
+    :param data: Input data as bytes-like object, file object or iterable of bytes chunks
+    :param packet_size: The size of one packet in bytes
+    :return: Generator of bytes-like packets
+    """
+    if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(data).cast('B')
+        for offset in range(0, len(view), packet_size):
+            yield view[offset: offset + packet_size]
+    elif hasattr(data, 'read'):
+        while True:
+            packet = data.read(packet_size)
+            if not packet:
+                break
+            yield packet
+    else:
+        buffer = bytearray()
+        for chunk in data:
+            buffer += chunk
+            if len(buffer) >= packet_size:
+                view = memoryview(buffer)
+                offset = 0
+                while len(buffer) - offset >= packet_size:
+                    yield bytes(view[offset: offset + packet_size])
+                    offset += packet_size
+                view.release()
+                del buffer[:offset]
+        if buffer:
+            yield bytes(buffer)
+
+
+def get_diff_ranges(address: int, data, ref_data) -> list:
+    """
+    Get address ranges where the data differ from reference data
+
+    :param address: Start address of data
+    :param data: The bytes-like object
+    :param ref_data: The reference bytes-like object with the same length
+    :return: List of ranges as tuples (start, end)
+    """
+    ranges = []
+    start = None
+    for offset, (a, b) in enumerate(zip(data, ref_data)):
+        if a != b:
+            if start is None:
+                start = offset
+        elif start is not None:
+            ranges.append((address + start, address + offset))
+            start = None
+    if start is not None:
+        ranges.append((address + start, address + len(data)))
+    return ranges
+
+
+def build_property_list():
+    """
+    Build list of available properties, the I/O independent part of get_property_list() shared by McuBoot and
+    AsyncMcuBoot. The properties which are not supported by version of connected bootloader are skipped.
+
+    The generator yields GetProperty requests as tuples (prop_tag, index) and receives their results as tuples
+    (values, status_code), the values are None if the request failed.
+
+    :return: Tuple (property list, count of skipped requests) as return value of generator
+    """
+    property_list = []
+    skipped = 0
+    version_values, _ = yield PropertyTag.CURRENT_VERSION, 0
+    version = Version(version_values[0]) if version_values else None
+
+    for _, tag, _ in PropertyTag:
+        if tag == PropertyTag.CURRENT_VERSION:
+            values = version_values
+        elif version is not None and version < PROPERTIES_VERSION.get(tag, version):
+            skipped += 1
+            continue
+        else:
+            values, _ = yield tag, 0
+
+        if values:
+            property_list.append(parse_property_value(tag, values))
+
+    return property_list, skipped
+
+
+def build_memory_list():
+    """
+    Build list of embedded memories, the I/O independent part of get_memory_list() shared by McuBoot and AsyncMcuBoot
+
+    The generator yields GetProperty requests as tuples (prop_tag, index) and receives their results as tuples
+    (values, status_code), the values are None if the request failed.
+
+    :return: The memory list as return value of generator
+    """
+    memory_list = {}
+
+    # Internal FLASH and RAM regions
+    for name, tags in (('internal_flash', (('address', PropertyTag.FLASH_START_ADDRESS),
+                                           ('size', PropertyTag.FLASH_SIZE),
+                                           ('sector_size', PropertyTag.FLASH_SECTOR_SIZE))),
+                       ('internal_ram', (('address', PropertyTag.RAM_START_ADDRESS),
+                                         ('size', PropertyTag.RAM_SIZE)))):
+        mdata = {}
+        index = 0
+        start_address = 0
+        while True:
+            region = {}
+            for key, tag in tags:
+                values, _ = yield tag, index
+                if not values:
+                    break
+                if key == 'address' and index > 0 and values[0] == start_address:
+                    # the target without support of indexed regions reports always the first one
+                    break
+                region[key] = values[0]
+            else:
+                if index == 0:
+                    start_address = region['address']
+                mdata[index] = region
+                index += 1
+                continue
+            if 'address' in region:
+                # the incomplete region is reported only with its address
+                mdata[index] = region
+            break
+        if mdata:
+            memory_list[name] = mdata
+
+    # External Memories
+    ext_mem_list = []
+    ext_mem_ids = [mem_id for _, mem_id, _ in ExtMemId]
+
+    values, _ = yield PropertyTag.CURRENT_VERSION, 0
+    if not values:
+        return memory_list
+
+    if Version(values[0]) <= Version("2.0.0"):
+        # old versions mboot support only Quad SPI memory
+        ext_mem_ids = [ExtMemId.QUAD_SPI0]
+
+    for id in ext_mem_ids:
+        values, status_code = yield PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES, id
+
+        if not values:
+            if status_code == StatusCode.UNKNOWN_PROPERTY:
+                # No external memories are supported by current device.
+                break
+            elif status_code in (StatusCode.INVALID_ARGUMENT, StatusCode.QSPI_NOT_CONFIGURED,
+                                 StatusCode.MEMORY_NOT_CONFIGURED):
+                # Current memory type is not supported by the device or it's not configured, skip to next one.
+                continue
+            # Other Error
+            break
+
+        # memory ID and name
+        mem_attrs = {'mem_id': id, 'mem_name': ExtMemId[id]}
+        # parse memory attributes
+        if values[0] & ExtMemPropTags.START_ADDRESS:
+            mem_attrs['address'] = values[1]
+        if values[0] & ExtMemPropTags.SIZE_IN_KBYTES:
+            mem_attrs['size'] = values[2] * 1024
+        if values[0] & ExtMemPropTags.PAGE_SIZE:
+            mem_attrs['page_size'] = values[3]
+        if values[0] & ExtMemPropTags.SECTOR_SIZE:
+            mem_attrs['sector_size'] = values[4]
+        if values[0] & ExtMemPropTags.BLOCK_SIZE:
+            mem_attrs['block_size'] = values[5]
+        # store attributes
+        ext_mem_list.append(mem_attrs)
+
+    if ext_mem_list:
+        memory_list['external'] = ext_mem_list
+
+    return memory_list
+
 
 ########################################################################################################################
 # McuBoot Tags for Key Provisioning Operations
@@ -40,10 +253,31 @@ class KeyProvOperation(Enum):
 
 
 ########################################################################################################################
-# McuBoot Main Class
+# McuBoot I/O Requests
 ########################################################################################################################
 
-class McuBoot:
+# The operations of McuBootBase are generators of I/O requests as tuples (request, argument), the result of request
+# is sent back into generator and the exception raised by interface (e.g. TimeoutError) is thrown into it.
+IO_WRITE = 'write'  # write the command or data packet (argument)
+IO_READ = 'read'    # read the response or data packet, the argument is timeout in [ms]
+IO_POLL = 'poll'    # get the response packet if it's already received, otherwise None
+IO_ABORT = 'abort'  # abort the data phase
+IO_OPEN = 'open'    # open the interface
+IO_CLOSE = 'close'  # close the interface
+IO_SLEEP = 'sleep'  # wait for specified time in [s]
+IO_DATA = 'data'    # pass the chunk of read data (argument) to caller of iterating operation
+
+
+########################################################################################################################
+# McuBoot Base Class
+########################################################################################################################
+
+class McuBootBase:
+    """
+    The I/O independent part of McuBoot and AsyncMcuBoot: the state of session and the protocol logic of bootloader
+    commands implemented as generators of I/O requests (see IO_* constants). The requests are executed by _run() and
+    _iter_run() methods of derived class, so the blocking and asyncio versions share one implementation of protocol.
+    """
 
     @property
     def status_code(self):
@@ -57,38 +291,50 @@ class McuBoot:
     def is_opened(self):
         return self._device.is_opened
 
-    def __init__(self, device: DevConnBase, cmd_exception: bool = False):
+    @property
+    def cache_hits(self):
+        return self._cache_hits
+
+    @property
+    def cache_misses(self):
+        return self._cache_misses
+
+    @property
+    def skipped_requests(self):
+        return self._skipped_requests
+
+    def __init__(self, device, cmd_exception: bool = False, cache_properties: bool = False,
+                 manifests: Optional[ManifestCache] = None):
         """
-        Initialize the McuBoot object.
+        Initialize the McuBootBase object.
 
         :param device: The instance of communication interface class
-        :param cmd_exception:
+        :param cmd_exception: True to throw McuBootCommandError on any error, False to set status code only
+        :param cache_properties: If True, the responses of static properties are cached during the session
+        :param manifests: The ManifestCache object, the sector hashes of device are removed from it before the first
+                          command which changes content of memory
         """
         self._cmd_exception = cmd_exception
+        self._cache_properties = cache_properties
+        self._property_cache = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._skipped_requests = 0
+        self._unsupported_properties = set()
         self._status_code = StatusCode.SUCCESS
         self._device = device
+        self._max_packet_size = None
+        self._manifests = manifests
         self.reopen = False
+        # The max size of data read by one ReadMemory command (0 - disabled) and count of retries for failed segment
+        self.segment_size = 0x10000
+        self.read_retries = 3
+        # The address ranges with different content found by last verify_memory()
+        self.mismatches = []
 
-    def __enter__(self):
-        self.reopen = True
-        self.open()
-        return self
-
-    def __exit__(self, *args, **kwargs):
-        self.close()
-
-    def open(self):
-        """ Connect to device """
-        if not self._device.is_opened:
-            self._device.open()
-
-    def close(self):
-        """ Disconnect device """
-        self._device.close()
-
-    def abort(self):
-        """ Abort executed operation """
-        self._device.abort()
+    def clear_cache(self):
+        """ Invalidate all cached property values """
+        self._property_cache.clear()
 
     def _check_response(self, cmd_packet: CmdPacket, cmd_response: CmdResponse, logger_info: bool = True):
 
@@ -111,6 +357,19 @@ class McuBoot:
 
         return False
 
+    def _read(self, timeout: int = 1000):
+        """
+        Read response or data packet
+
+        :param timeout: The maximal waiting time in [ms]
+        """
+        try:
+            return (yield IO_READ, timeout)
+        except TimeoutError:
+            self._status_code = StatusCode.NO_RESPONSE
+            logger.debug('RX: No Response, Timeout Error !')
+            raise McuBootConnectionError("No Response from Device")
+
     def _process_cmd(self, cmd_packet: CmdPacket, timeout: int = 2000):
         """
         Process Command
@@ -126,88 +385,870 @@ class McuBoot:
         logger.debug('TX-PACKET: ' + str(cmd_packet))
 
         try:
-            self._device.write(cmd_packet)
-            cmd_response = self._device.read(timeout)
+            yield IO_WRITE, cmd_packet
+        except TimeoutError:
+            self._status_code = StatusCode.NO_RESPONSE
+            logger.debug('TX: No Response, Timeout Error !')
+            raise McuBootConnectionError("No Response from Device")
+        cmd_response = yield from self._read(timeout)
+
+        logger.debug('RX-PACKET: ' + str(cmd_response))
+
+        return cmd_response
+
+    def _receive_data(self, cmd_tag: int, length: int, store, timeout: int = 1000):
+        """
+        Receive data phase of command, every data packet is passed into store function
+
+        :param cmd_tag: The command tag
+        :param length: Count of bytes announced in response packet
+        :param store: The function called with received packet (memoryview), it returns iterable of I/O requests
+        :param timeout: The maximal waiting time in [ms] for data packet
+        :return: Count of received bytes
+        """
+        if not self._device.is_opened:
+            logger.info('RX: Device not opened')
+            raise McuBootConnectionError('Device not opened')
+
+        received = 0
+
+        while True:
+            response = yield from self._read(timeout)
+
+            if isinstance(response, (bytes, bytearray)):
+                size = min(len(response), length - received)
+                if size > 0:
+                    received += size
+                    yield from store(memoryview(response)[:size])
+
+            elif isinstance(response, GenericResponse):
+                logger.debug('RX-PACKET: ' + str(response))
+                self._status_code = response.status_code
+                if response.cmd_tag == cmd_tag:
+                    break
+
+        if received < length or self.status_code != StatusCode.SUCCESS:
+            logger.debug(f"CMD: Received {received} from {length} Bytes, {self.status_info}")
+            if self._cmd_exception:
+                raise McuBootCommandError(CommandTag[cmd_tag], self.status_code)
+        else:
+            logger.info(f"CMD: Successfully Received {received} from {length} Bytes")
+
+        return received
+
+    def _read_data_into(self, cmd_tag: int, buffer, length: int, timeout: int = 1000):
+        """
+        Read Data directly into buffer
+
+        :param cmd_tag: The command tag
+        :param buffer: The writable bytes-like object (bytearray, memoryview, mmap, ...)
+        :param length: Count of bytes announced in response packet
+        :param timeout: The maximal waiting time in [ms] for data packet
+        :return: Count of received bytes
+        """
+        view = memoryview(buffer).cast('B')
+        received = 0
+
+        def store(packet):
+            nonlocal received
+            view[received: received + len(packet)] = packet
+            received += len(packet)
+            return ()
+
+        yield from self._receive_data(cmd_tag, min(length, len(view)), store, timeout)
+        return received
+
+    def _read_data(self, cmd_tag: int, length: int, timeout: int = 1000):
+        """
+        Read Data
+
+        :param cmd_tag: The command tag
+        :param length: Count of bytes announced in response packet
+        :param timeout: The maximal waiting time in [ms] for data packet
+        """
+        buffer = bytearray(length)
+        received = yield from self._read_data_into(cmd_tag, buffer, length, timeout)
+        return bytes(buffer) if received == length else bytes(buffer[:received])
+
+    def _iter_data_chunks(self, cmd_tag: int, length: int, chunk: int):
+        """
+        Read Data as chunks with specified size (the last one can be shorter), which are passed to caller by IO_DATA
+
+        :param cmd_tag: The command tag
+        :param length: Count of bytes announced in response packet
+        :param chunk: The size of chunk in bytes
+        :return: Count of received bytes
+        """
+        buffer = bytearray(chunk)
+        view = memoryview(buffer)
+        size = 0
+
+        def store(packet):
+            nonlocal size
+            while packet:
+                count = min(len(packet), chunk - size)
+                view[size: size + count] = packet[:count]
+                packet = packet[count:]
+                size += count
+                if size == chunk:
+                    yield IO_DATA, bytes(buffer)
+                    size = 0
+
+        received = yield from self._receive_data(cmd_tag, length, store)
+        if size:
+            yield IO_DATA, bytes(buffer[:size])
+        return received
+
+    def _check_received(self, cmd_tag: int, received: int, length: int):
+        """
+        Check that iterated read command delivered all requested data. The iterators can't return the status as other
+        read methods, so the rejected command or the incomplete data are always reported by exception.
+
+        :param cmd_tag: The command tag
+        :param received: Count of received bytes
+        :param length: Count of requested bytes
+        """
+        if received >= length:
+            return
+        logger.info(f"CMD: {CommandTag[cmd_tag]} delivered {received} from {length} Bytes, {self.status_info}")
+        if self._status_code == StatusCode.NO_RESPONSE:
+            raise McuBootConnectionError('No response from device')
+        if self._status_code == StatusCode.SUCCESS:
+            self._status_code = StatusCode.FAIL
+        raise McuBootCommandError(CommandTag[cmd_tag], self._status_code)
+
+    def _get_max_packet_size(self):
+        """ Get the size of data packet used in data phase (read from target by MAX_PACKET_SIZE property) """
+        if self._max_packet_size is None:
+            values = yield from self._read_property(PropertyTag.MAX_PACKET_SIZE)
+            self._max_packet_size = values[0] if values else DEFAULT_MAX_PACKET_SIZE
+        return self._max_packet_size
+
+    def _init_data_phase(self, data, length: Optional[int] = None):
+        """
+        Prepare data phase of command: get length of data and read max packet size from target
+
+        The MAX_PACKET_SIZE property must be read before the command packet is sent.
+
+        :param data: Data as bytes-like object, file object or iterable of bytes chunks
+        :param length: Count of bytes (required only if can't be detected from data)
+        """
+        if length is None:
+            length = get_data_length(data)
+            if length is None:
+                raise ValueError('Length of data must be specified')
+        yield from self._get_max_packet_size()
+        return length
+
+    def _send_data(self, cmd_tag: int, data, length: int, progress: Optional[Callable[[int, int], None]] = None):
+        """
+        Send Data part of specific command
+
+        The data are split into packets of negotiated size (MAX_PACKET_SIZE) and the transfer is stopped as soon as
+        the target sends a response in the middle of data phase (usually an error status). The response is checked by
+        poll() after the first packet and then once per 'poll_interval' of interface.
+
+        :param cmd_tag: The command tag
+        :param data: Data as bytes-like object, file object or iterable of bytes chunks
+        :param length: Count of bytes announced in command packet
+        :param progress: The callback function with arguments: sent bytes, total bytes
+        """
+        if not self._device.is_opened:
+            logger.info('TX: Device Disconnected')
+            raise McuBootConnectionError('Device Disconnected !')
+
+        sent = 0
+        response = None
+        poll_interval = self._device.poll_interval
+        poll_time = 0
+        try:
+            for packet in iter_data_packets(data, self._max_packet_size):
+                if sent + len(packet) > length:
+                    packet = packet[:length - sent]
+                yield IO_WRITE, packet
+                sent += len(packet)
+                if progress:
+                    progress(sent, length)
+                if sent >= length:
+                    break
+                if poll_interval:
+                    now = monotonic()
+                    if now < poll_time:
+                        continue
+                    poll_time = now + poll_interval
+                response = yield IO_POLL, None
+                if response is not None:
+                    break
+            if response is None:
+                response = yield IO_READ, 1000
         except TimeoutError:
             self._status_code = StatusCode.NO_RESPONSE
-            logger.debug('RX-PACKET: No Response, Timeout Error !')
+            logger.debug('RX: No Response, Timeout Error !')
             raise McuBootConnectionError("No Response from Device")
 
-        logger.debug('RX-PACKET: ' + str(cmd_response))
+        if not isinstance(response, GenericResponse):
+            raise McuBootError(f"CMD: {CommandTag[cmd_tag]} -> Unsupported response format")
+
+        logger.debug('RX-PACKET: ' + str(response))
+        self._status_code = response.status_code
+        if response.status_code != StatusCode.SUCCESS:
+            logger.debug(f"CMD: Send Error after {sent} from {length} Bytes, " + self.status_info)
+            if self._cmd_exception:
+                raise McuBootCommandError(CommandTag[cmd_tag], self.status_code)
+            return False
+
+        if sent < length:
+            logger.debug(f"CMD: Data phase terminated by target after {sent} from {length} Bytes")
+            self._status_code = StatusCode.FAIL
+            if self._cmd_exception:
+                raise McuBootCommandError(CommandTag[cmd_tag], self.status_code)
+            return False
+
+        logger.info(f"CMD: Successfully Send {sent} Bytes")
+        return True
+
+    def _drop_manifest(self):
+        """
+        Remove sector hashes of connected device from manifest cache (once per session), the content of memory is
+        going to be changed and the hashes of last written image are not valid
+        """
+        if self._manifests is None:
+            return
+        values = yield from self._read_property(PropertyTag.UNIQUE_DEVICE_IDENT)
+        if values:
+            self._manifests.remove(''.join(f"{value:08X}" for value in values))
+        self._manifests = None
+
+    def _read_property(self, prop_tag: int, index: int = 0):
+        """
+        Read property value without raising command exception and without change of status code
+
+        :param prop_tag: Property TAG (see Properties Enum)
+        :param index: External memory ID or internal memory region index (depends on property type)
+        """
+        status_code = self._status_code
+        try:
+            return (yield from self._get_property(prop_tag, index))
+        except McuBootCommandError:
+            return None
+        finally:
+            self._status_code = status_code
+
+    def _run_requests(self, requests):
+        """
+        Send the GetProperty requests yielded by generator and pass their results back into it
+
+        :param requests: The generator as returned by build_property_list() or build_memory_list()
+        :return: The return value of generator
+        """
+        try:
+            request = next(requests)
+            while True:
+                try:
+                    values = yield from self._get_property(*request)
+                except McuBootCommandError:
+                    values = None
+                request = requests.send((values, self._status_code))
+        except StopIteration as e:
+            return e.value
+
+    def _get_property_list(self):
+        skipped_requests = self._skipped_requests + self._cache_hits
+        property_list, skipped = yield from self._run_requests(build_property_list())
+        self._skipped_requests += skipped
+        skipped_requests = self._skipped_requests + self._cache_hits - skipped_requests
+        logger.info(f"CMD: GetPropertyList -> {len(property_list)} properties, {skipped_requests} requests skipped")
+
+        self._status_code = StatusCode.SUCCESS
+        if not property_list:
+            self._status_code = StatusCode.FAIL
+            if self._cmd_exception:
+                raise McuBootCommandError('GetPropertyList', self.status_code)
+
+        return property_list
+
+    def _get_memory_list(self):
+        memory_list = yield from self._run_requests(build_memory_list())
+
+        self._status_code = StatusCode.SUCCESS
+        if not memory_list:
+            self._status_code = StatusCode.FAIL
+            if self._cmd_exception:
+                raise McuBootCommandError('GetMemoryList', self.status_code)
+
+        return memory_list
+
+    def _flash_erase_all(self, mem_id: int = 0):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: FlashEraseAll(mem_id={mem_id})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_ALL, 0, mem_id)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _flash_erase_region(self, address: int, length: int, mem_id: int = 0):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: FlashEraseRegion(address=0x{address:08X}, length={length}, mem_id={mem_id})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_REGION, 0, address, length, mem_id)
+        cmd_response = yield from self._process_cmd(cmd_packet, 5000)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _flush(self, timeout: int = 100):
+        """
+        Abort current data phase and drop all pending packets from interface
+
+        :param timeout: The waiting time in [ms] for next packet
+        """
+        yield IO_ABORT, None
+        try:
+            while True:
+                yield IO_READ, timeout
+        except TimeoutError:
+            pass
+
+    def _read_memory_segment(self, address: int, view: memoryview, mem_id: int = 0):
+        """
+        Read one segment of MCU memory into memoryview with retries
+
+        If the data phase fails (timeout or error status), the read is resumed from the first missing byte. The count
+        of attempts is limited by 'read_retries' attribute.
+
+        :param address: Start address
+        :param view: The memoryview of buffer with size of segment
+        :param mem_id: Memory ID
+        :return: Count of received bytes or None if the command was rejected
+        """
+        length = len(view)
+        received = 0
+        attempt = 0
+
+        def store(packet):
+            nonlocal received
+            view[received: received + len(packet)] = packet
+            received += len(packet)
+            return ()
+
+        while True:
+            error = None
+            logger.info(f"CMD: ReadMemory(address=0x{address + received:08X}, length={length - received}, "
+                        f"mem_id={mem_id})")
+            cmd_packet = CmdPacket(CommandTag.READ_MEMORY, 0, address + received, length - received, mem_id)
+            try:
+                cmd_response = yield from self._process_cmd(cmd_packet)
+            except McuBootConnectionError as e:
+                cmd_response, error = None, e
+
+            if cmd_response is not None:
+                if not self._check_response(cmd_packet, cmd_response, False):
+                    return received if received else None
+                try:
+                    yield from self._receive_data(CommandTag.READ_MEMORY, length - received, store)
+                except (McuBootConnectionError, McuBootCommandError) as e:
+                    error = e
+                else:
+                    if received >= length and self._status_code == StatusCode.SUCCESS:
+                        return received
+
+            attempt += 1
+            if attempt > self.read_retries:
+                if error is not None and self._cmd_exception:
+                    raise error
+                return received
+
+            logger.info(f"CMD: ReadMemory failed at 0x{address + received:08X}, retry {attempt}/{self.read_retries}")
+            yield from self._flush()
+
+    def _read_memory(self, address: int, length: int, mem_id: int = 0):
+        buffer = bytearray(length)
+        received = yield from self._read_memory_into(address, buffer, mem_id)
+        if received is None:
+            return None
+        return bytes(buffer) if received == length else bytes(buffer[:received])
+
+    def _iter_read_memory(self, address: int, length: int, chunk: int = 0x1000, mem_id: int = 0):
+        if not self.segment_size:
+            logger.info(f"CMD: ReadMemory(address=0x{address:08X}, length={length}, mem_id={mem_id})")
+            cmd_packet = CmdPacket(CommandTag.READ_MEMORY, 0, address, length, mem_id)
+            cmd_response = yield from self._process_cmd(cmd_packet)
+            received = 0
+            if self._check_response(cmd_packet, cmd_response, False):
+                received = yield from self._iter_data_chunks(CommandTag.READ_MEMORY, cmd_response.length, chunk)
+            self._check_received(CommandTag.READ_MEMORY, received, length)
+            return
+
+        # segment size must be multiple of chunk size
+        segment_size = max(chunk, self.segment_size - self.segment_size % chunk)
+        buffer = memoryview(bytearray(min(length, segment_size)))
+        for offset in range(0, length, segment_size):
+            view = buffer[:min(segment_size, length - offset)]
+            received = yield from self._read_memory_segment(address + offset, view, mem_id)
+            received = received or 0
+            for index in range(0, received, chunk):
+                yield IO_DATA, bytes(view[index: min(index + chunk, received)])
+            self._check_received(CommandTag.READ_MEMORY, received, len(view))
+
+    def _verify_memory(self, address: int, data, mem_id: int = 0, chunk: int = 0x1000):
+        view = memoryview(data).cast('B')
+        length = len(view)
+        segment_size = self.segment_size or length
+        buffer = memoryview(bytearray(min(length, segment_size)))
+        self.mismatches = []
+        offset = 0
+        while offset < length and not self.mismatches:
+            segment = buffer[:min(segment_size, length - offset)]
+            received = yield from self._read_memory_segment(address + offset, segment, mem_id)
+            if not received:
+                break
+            for index in range(0, received, chunk):
+                read_data = segment[index: min(index + chunk, received)]
+                ref_data = view[offset + index: offset + index + len(read_data)]
+                if read_data != ref_data:
+                    self.mismatches = get_diff_ranges(address + offset + index, read_data, ref_data)
+                    break
+            offset += received
+            if received < len(segment):
+                break
+
+        if not self.mismatches and offset < length:
+            # the rest of memory can't be read
+            self.mismatches = [(address + offset, address + length)]
+
+        if not self.mismatches:
+            logger.info(f"CMD: Verified {length} Bytes at 0x{address:08X}")
+            return True
+
+        logger.info(f"CMD: Verification failed at 0x{self.mismatches[0][0]:08X}")
+        self._status_code = StatusCode.FAIL
+        if self._cmd_exception:
+            raise McuBootVerifyError(self.mismatches)
+        return False
+
+    def _read_memory_into(self, address: int, buffer, mem_id: int = 0):
+        view = memoryview(buffer).cast('B')
+        length = len(view)
+        segment_size = self.segment_size or length
+        received = 0
+        for offset in range(0, length, segment_size):
+            segment = view[offset: offset + segment_size]
+            count = yield from self._read_memory_segment(address + offset, segment, mem_id)
+            if count is None:
+                return received if offset else None
+            received += count
+            if count < len(segment):
+                break
+        return received
+
+    def _write_memory(self, address: int, data, mem_id: int = 0, length: Optional[int] = None,
+                      progress: Optional[Callable[[int, int], None]] = None):
+        length = yield from self._init_data_phase(data, length)
+        yield from self._drop_manifest()
+        logger.info(f"CMD: WriteMemory(address=0x{address:08X}, length={length}, mem_id={mem_id})")
+        cmd_packet = CmdPacket(CommandTag.WRITE_MEMORY, 0, address, length, mem_id)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._send_data(CommandTag.WRITE_MEMORY, data, length, progress))
+        return False
+
+    def _fill_memory(self, address: int, length: int, pattern: int = 0xFFFFFFFF):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: FillMemory(address=0x{address:08X}, length={length}, pattern=0x{pattern:08X})")
+        cmd_packet = CmdPacket(CommandTag.FILL_MEMORY, 0, address, length, pattern)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _flash_security_disable(self, backdoor_key: bytes):
+        if len(backdoor_key) != 8:
+            raise ValueError('Backdoor key must by 8 bytes long')
+        logger.info(f"CMD: FlashSecurityDisable(backdoor_key={backdoor_key})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_SECURITY_DISABLE, 0, data=backdoor_key)
+        self.clear_cache()
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _get_property(self, prop_tag: int, index: int = 0):
+        logger.info(f"CMD: GetProperty({PropertyTag[prop_tag]}, index={index})")
+        cmd_packet = CmdPacket(CommandTag.GET_PROPERTY, 0, prop_tag, index)
+        if self._cache_properties and prop_tag in self._unsupported_properties:
+            self._skipped_requests += 1
+            logger.debug('CMD: Unsupported property, request skipped')
+            cmd_response = GetPropertyResponse(PacketHeader(ResponseTag.GET_PROPERTY, 0, 0, 1),
+                                               (StatusCode.UNKNOWN_PROPERTY,))
+        elif self._cache_properties and prop_tag in STATIC_PROPERTIES:
+            key = (prop_tag, index if prop_tag in INDEXED_PROPERTIES else 0)
+            if key in self._property_cache:
+                self._cache_hits += 1
+                logger.debug('CMD: Response loaded from cache')
+                cmd_response = self._property_cache[key]
+            else:
+                self._cache_misses += 1
+                cmd_response = yield from self._process_cmd(cmd_packet)
+                self._property_cache[key] = cmd_response
+        else:
+            cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._cache_properties and cmd_response.status_code == StatusCode.UNKNOWN_PROPERTY:
+            self._unsupported_properties.add(prop_tag)
+        if self._check_response(cmd_packet, cmd_response):
+            return cmd_response.values
+        return None
+
+    def _set_property(self, prop_tag: int, value: int):
+        logger.info(f"CMD: SetProperty({PropertyTag[prop_tag]}, value=0x{value:08X})")
+        cmd_packet = CmdPacket(CommandTag.SET_PROPERTY, 0, prop_tag, value)
+        self.clear_cache()
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _receive_sb_file(self, data, length: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None):
+        length = yield from self._init_data_phase(data, length)
+        yield from self._drop_manifest()
+        logger.info(f"CMD: ReceiveSBfile(data_length={length})")
+        cmd_packet = CmdPacket(CommandTag.RECEIVE_SB_FILE, 1, length)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._send_data(CommandTag.RECEIVE_SB_FILE, data, length, progress))
+        return False
+
+    def _execute(self, address: int, argument: int, sp: int):
+        logger.info(f"CMD: Execute(address=0x{address:08X}, argument=0x{argument:08X}, SP=0x{sp:08X})")
+        cmd_packet = CmdPacket(CommandTag.EXECUTE, 0, address, argument, sp)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _call(self, address: int, argument: int):
+        logger.info(f"CMD: Call(address=0x{address:08X}, argument=0x{argument:08X})")
+        cmd_packet = CmdPacket(CommandTag.CALL, 0, address, argument)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _reset(self, timeout: int = 2000, reopen: bool = True):
+        ret_val = False
+        logger.info('CMD: Reset MCU')
+        cmd_packet = CmdPacket(CommandTag.RESET, 0)
+        self.clear_cache()
+        self._max_packet_size = None
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response):
+            yield IO_CLOSE, None
+            ret_val = True
+            if self.reopen and reopen:
+                yield IO_SLEEP, timeout / 1000
+                try:
+                    yield IO_OPEN, None
+                except Exception:
+                    ret_val = False
+                    if self._cmd_exception:
+                        raise McuBootConnectionError()
+        return ret_val
+
+    def _flash_erase_all_unsecure(self):
+        yield from self._drop_manifest()
+        logger.info('CMD: FlashEraseAllUnsecure')
+        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_ALL_UNSECURE, 0)
+        self.clear_cache()
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _efuse_read_once(self, index: int):
+        logger.info(f"CMD: FlashReadOnce(index={index})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_READ_ONCE, 0, index, 4)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return cmd_response.values[0] if self._check_response(cmd_packet, cmd_response) else None
+
+    def _efuse_program_once(self, index: int, value: int):
+        logger.info(f"CMD: FlashProgramOnce(index={index}, value=0x{value:X})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_PROGRAM_ONCE, 0, index, 4, value)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _flash_read_once(self, index: int, count: int = 4):
+        assert count in (4, 8)
+        logger.info(f"CMD: FlashReadOnce(index={index}, bytes={count})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_READ_ONCE, 0, index, count)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return cmd_response.data if self._check_response(cmd_packet, cmd_response) else None
+
+    def _flash_program_once(self, index: int, data: bytes):
+        assert len(data) in (4, 8)
+        logger.info(f"CMD: FlashProgramOnce(index={index}, data={data})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_PROGRAM_ONCE, 0, index, len(data), data=data)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _flash_read_resource(self, address: int, length: int, option: int = 1):
+        logger.info(f"CMD: FlashReadResource(address=0x{address:08X}, length={length}, option={option})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_READ_RESOURCE, 0, address, length, option)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._read_data(CommandTag.FLASH_READ_RESOURCE, cmd_response.length))
+        return None
+
+    def _iter_flash_read_resource(self, address: int, length: int, chunk: int = 0x1000, option: int = 1):
+        logger.info(f"CMD: FlashReadResource(address=0x{address:08X}, length={length}, option={option})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_READ_RESOURCE, 0, address, length, option)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        received = 0
+        if self._check_response(cmd_packet, cmd_response, False):
+            received = yield from self._iter_data_chunks(CommandTag.FLASH_READ_RESOURCE, cmd_response.length, chunk)
+        self._check_received(CommandTag.FLASH_READ_RESOURCE, received, length)
+
+    def _flash_read_resource_into(self, address: int, buffer, option: int = 1):
+        length = memoryview(buffer).nbytes
+        logger.info(f"CMD: FlashReadResource(address=0x{address:08X}, length={length}, option={option})")
+        cmd_packet = CmdPacket(CommandTag.FLASH_READ_RESOURCE, 0, address, length, option)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._read_data_into(CommandTag.FLASH_READ_RESOURCE, buffer, cmd_response.length))
+        return None
+
+    def _configure_memory(self, address: int, mem_id: int):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: ConfigureMemory({ExtMemId[mem_id]}, address=0x{address:08X})")
+        cmd_packet = CmdPacket(CommandTag.CONFIGURE_MEMORY, 0, mem_id, address)
+        self.clear_cache()
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _reliable_update(self, address: int):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: ReliableUpdate(address=0x{address:08X})")
+        cmd_packet = CmdPacket(CommandTag.RELIABLE_UPDATE, 0, address)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _generate_key_blob(self, dek_data: bytes, count: int = 72):
+        dek_len = yield from self._init_data_phase(dek_data)
+        logger.info(f"CMD: GenerateKeyBlob(dek_len={dek_len}, count={count})")
+        cmd_packet = CmdPacket(CommandTag.GENERATE_KEY_BLOB, 1, 0, dek_len, 0)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if not self._check_response(cmd_packet, cmd_response, False):
+            return None
+        if not (yield from self._send_data(CommandTag.GENERATE_KEY_BLOB, dek_data, dek_len)):
+            return None
+        cmd_packet = CmdPacket(CommandTag.GENERATE_KEY_BLOB, 0, 0, count, 1)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._read_data(CommandTag.GENERATE_KEY_BLOB, cmd_response.length))
+        return None
+
+    def _kp_enroll(self):
+        logger.info("CMD: [KeyProvisioning] Enroll")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.ENROLL)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _kp_set_intrinsic_key(self, key_type: int, key_size: int):
+        logger.info(f"CMD: [KeyProvisioning] SetIntrinsicKey(type={key_type}, key_size={key_size})")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.SET_INTRINSIC_KEY, key_type, key_size)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _kp_write_nonvolatile(self, mem_id: int = 0):
+        yield from self._drop_manifest()
+        logger.info(f"CMD: [KeyProvisioning] WriteNonVolatileMemory(mem_id={mem_id})")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.WRITE_NON_VOLATILE, mem_id)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _kp_read_nonvolatile(self, mem_id: int = 0):
+        logger.info(f"CMD: [KeyProvisioning] ReadNonVolatileMemory(mem_id={mem_id})")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.READ_NON_VOLATILE, mem_id)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        return self._check_response(cmd_packet, cmd_response)
+
+    def _kp_send_key(self, operation: KeyProvOperation, key_type: int, key_data: bytes):
+        key_len = yield from self._init_data_phase(key_data)
+        logger.info(f"CMD: [KeyProvisioning] {KeyProvOperation[operation]}(key_type={key_type}, key_len={key_len})")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 1, operation, key_type, key_len)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._send_data(CommandTag.KEY_PROVISIONING, key_data, key_len))
+        return False
+
+    def _kp_read_key_store(self):
+        logger.info(f"CMD: [KeyProvisioning] ReadKeyStore")
+        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.READ_KEY_STORE)
+        cmd_response = yield from self._process_cmd(cmd_packet)
+        if self._check_response(cmd_packet, cmd_response, False):
+            return (yield from self._read_data(CommandTag.KEY_PROVISIONING, cmd_response.length))
+        return None
+
+
+########################################################################################################################
+# McuBoot Main Class
+########################################################################################################################
+
+class McuBoot(McuBootBase):
+
+    @property
+    def max_packet_size(self) -> int:
+        """ The size of data packet used in data phase (read from target by MAX_PACKET_SIZE property) """
+        return self._run(self._get_max_packet_size())
+
+    def __init__(self, device: DevConnBase, cmd_exception: bool = False, cache_properties: bool = False,
+                 manifests: Optional[ManifestCache] = None):
+        """
+        Initialize the McuBoot object.
+
+        :param device: The instance of communication interface class
+        :param cmd_exception:
+        :param cache_properties: If True, the responses of static properties are cached during the session
+        :param manifests: The ManifestCache object, the sector hashes of device are removed from it before the first
+                          command which changes content of memory
+        """
+        super().__init__(device, cmd_exception, cache_properties, manifests)
+
+    def __enter__(self):
+        self.reopen = True
+        self.open()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+    def open(self):
+        """ Connect to device """
+        if not self._device.is_opened:
+            self._device.open()
+
+    def close(self):
+        """ Disconnect device """
+        self._device.close()
+
+    def abort(self):
+        """ Abort executed operation """
+        self._device.abort()
 
-        return cmd_response
+    def _request(self, request: str, argument):
+        """
+        Execute one I/O request of operation
 
-    def _read_data(self, cmd_tag: int, length: int, timeout: int = 1000) -> bytes:
+        :param request: The type of request (IO_* constant)
+        :param argument: The argument of request
+        :return: The result of request
         """
-        Read Data
+        if request == IO_WRITE:
+            return self._device.write(argument)
+        if request == IO_READ:
+            return self._device.read(argument)
+        if request == IO_POLL:
+            return self._device.poll()
+        if request == IO_ABORT:
+            return self._device.abort()
+        if request == IO_OPEN:
+            return self._device.open()
+        if request == IO_CLOSE:
+            return self._device.close()
+        if request == IO_SLEEP:
+            return sleep(argument)
+        raise McuBootError(f"Unsupported I/O request: {request}")
 
-        :param cmd_tag:
-        :param length:
-        :param timeout:
+    def _iter_run(self, operation):
         """
-        data = b''
+        Execute the I/O requests of operation and yield the data passed by IO_DATA requests
 
-        if not self._device.is_opened:
-            logger.info('RX: Device not opened')
-            raise McuBootConnectionError('Device not opened')
+        :param operation: The generator of I/O requests (see McuBootBase)
+        :return: The return value of operation
+        """
+        result, error = None, None
+        try:
+            while True:
+                request, argument = operation.throw(error) if error is not None else operation.send(result)
+                result, error = None, None
+                if request == IO_DATA:
+                    yield argument
+                    continue
+                try:
+                    result = self._request(request, argument)
+                except Exception as e:
+                    error = e
+        except StopIteration as e:
+            return e.value
+        finally:
+            operation.close()
 
-        while True:
-            try:
-                response = self._device.read(timeout)
-            except TimeoutError:
-                self._status_code = StatusCode.NO_RESPONSE
-                logger.debug('RX: No Response, Timeout Error !')
-                raise McuBootConnectionError("No Response from Device")
+    def _run(self, operation):
+        """
+        Execute the I/O requests of operation
 
-            if isinstance(response, bytes):
-                data += response
+        :param operation: The generator of I/O requests (see McuBootBase)
+        :return: The return value of operation
+        """
+        iterator = self._iter_run(operation)
+        try:
+            while True:
+                next(iterator)
+        except StopIteration as e:
+            return e.value
 
-            elif isinstance(response, GenericResponse):
-                logger.debug('RX-PACKET: ' + str(response))
-                self._status_code = response.status_code
-                if response.cmd_tag == cmd_tag:
-                    break
 
-        if len(data) < length or self.status_code != StatusCode.SUCCESS:
-            logger.debug(f"CMD: Received {len(data)} from {length} Bytes, {self.status_info}")
-            if self._cmd_exception:
-                raise McuBootCommandError(CommandTag[cmd_tag], self.status_code)
-        else:
-            logger.info(f"CMD: Successfully Received {len(data)} from {length} Bytes")
+    def _get_identity(self) -> Optional[tuple]:
+        """
+        Get device identification for device profile: (identity, version)
+        """
+        values = self._run(self._read_property(PropertyTag.CURRENT_VERSION))
+        if not values:
+            return None
+        version = values[0]
+        for prop_tag, prefix in ((PropertyTag.UNIQUE_DEVICE_IDENT, 'UID'), (PropertyTag.SYSTEM_DEVICE_IDENT, 'SID')):
+            values = self._run(self._read_property(prop_tag))
+            if values:
+                return prefix + ''.join(f"{value:08X}" for value in values), version
+        return None
 
-        return data[:length] if len(data) > length else data
+    def get_uid(self) -> Optional[str]:
+        """
+        Get unique device identification (UNIQUE_DEVICE_IDENT property) as hex string
 
-    def _send_data(self, cmd_tag: int, data: bytes) -> bool:
+        :return: The UID or None if not supported
         """
-        Send Data part of specific command
+        values = self._run(self._read_property(PropertyTag.UNIQUE_DEVICE_IDENT))
+        if not values:
+            return None
+        return ''.join(f"{value:08X}" for value in values)
 
-        :param cmd_tag: The command tag
-        :param data: Data in bytes
+    def load_profile(self, profiles: ProfileCache) -> bool:
         """
-        if not self._device.is_opened:
-            logger.info('TX: Device Disconnected')
-            raise McuBootConnectionError('Device Disconnected !')
+        Identify connected device and load its cached properties (memory map, supported properties) from profile cache.
+        The property cache is enabled by this call.
 
-        try:
-            self._device.write(data)
-            response = self._device.read()
-        except TimeoutError:
-            self._status_code = StatusCode.NO_RESPONSE
-            logger.debug('RX: No Response, Timeout Error !')
-            raise McuBootConnectionError("No Response from Device")
+        :param profiles: The instance of ProfileCache
+        :return: True if the profile was found, otherwise False
+        """
+        self._cache_properties = True
+        identity = self._get_identity()
+        if identity is None:
+            return False
+        profile = profiles.load(*identity)
+        if profile is None:
+            logger.info(f"CMD: Profile of device {identity[0]} not found")
+            return False
+        logger.info(f"CMD: Profile of device {identity[0]} loaded")
+        for key, cmd_response in profile.responses.items():
+            self._property_cache.setdefault(key, cmd_response)
+        self._unsupported_properties.update(profile.unsupported)
+        return True
 
-        # TODO: Check response type if needed
-        # if not isinstance(response, GenericResponse):
+    def save_profile(self, profiles: ProfileCache) -> bool:
+        """
+        Save cached properties of connected device into profile cache. The state dependent values (MAX_PACKET_SIZE and
+        attributes of configurable external memories) are not stored.
 
-        logger.debug('RX-PACKET: ' + str(response))
-        self._status_code = response.status_code
-        if response.status_code != StatusCode.SUCCESS:
-            logger.debug("CMD: Send Error, " + self.status_info)
-            if self._cmd_exception:
-                raise McuBootCommandError(CommandTag[cmd_tag], self.status_code)
+        :param profiles: The instance of ProfileCache
+        :return: True if the profile was saved, otherwise False
+        """
+        identity = self._get_identity()
+        if identity is None:
             return False
-
-        logger.info(f"CMD: Successfully Send {len(data)} Bytes")
+        profile = profiles.load(*identity) or DeviceProfile(*identity)
+        for (prop_tag, index), cmd_response in self._property_cache.items():
+            if prop_tag == PropertyTag.MAX_PACKET_SIZE:
+                continue
+            if prop_tag == PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES and \
+               cmd_response.status_code not in (StatusCode.INVALID_ARGUMENT, StatusCode.UNKNOWN_PROPERTY):
+                continue
+            profile.responses[(prop_tag, index)] = cmd_response
+        profile.unsupported.update(self._unsupported_properties)
+        profiles.save(profile)
         return True
 
     def get_property_list(self) -> list:
@@ -216,23 +1257,7 @@ class McuBoot:
 
         :return: list
         """
-        property_list = []
-        for _, tag, _ in PropertyTag:
-            try:
-                values = self.get_property(tag)
-            except McuBootCommandError:
-                continue
-
-            if values:
-                property_list.append(parse_property_value(tag, values))
-
-        self._status_code = StatusCode.SUCCESS
-        if not property_list:
-            self._status_code = StatusCode.FAIL
-            if self._cmd_exception:
-                raise McuBootCommandError('GetPropertyList', self.status_code)
-
-        return property_list
+        return self._run(self._get_property_list())
 
     def get_memory_list(self) -> dict:
         """
@@ -240,135 +1265,16 @@ class McuBoot:
 
         :return: dict
         """
-        memory_list = {}
-        # Internal FLASH
-        index = 0
-        mdata: dict = {}
-        start_address = 0
-        while True:
-            try:
-                values = self.get_property(PropertyTag.FLASH_START_ADDRESS, index)
-                if not values:
-                    break
-                if index == 0:
-                    start_address = values[0]
-                elif start_address == values[0]:
-                    break
-                mdata[index] = {}
-                mdata[index]['address'] = values[0]
-                values = self.get_property(PropertyTag.FLASH_SIZE, index)
-                if not values:
-                    break
-                mdata[index]['size'] = values[0]
-                values = self.get_property(PropertyTag.FLASH_SECTOR_SIZE, index)
-                if not values:
-                    break
-                mdata[index]['sector_size'] = values[0]
-                index += 1
-            except McuBootCommandError:
-                break
-
-        if mdata:
-            memory_list['internal_flash'] = mdata
-
-        # Internal RAM
-        index = 0
-        mdata = {}
-        start_address = 0
-        while True:
-            try:
-                values = self.get_property(PropertyTag.RAM_START_ADDRESS, index)
-                if not values:
-                    break
-                if index == 0:
-                    start_address = values[0]
-                elif start_address == values[0]:
-                    break
-                mdata[index] = {}
-                mdata[index]['address'] = values[0]
-                values = self.get_property(PropertyTag.RAM_SIZE, index)
-                if not values:
-                    break
-                mdata[index]['size'] = values[0]
-                index += 1
-            except McuBootCommandError:
-                break
-        if mdata:
-            memory_list['internal_ram'] = mdata
-
-        # External Memories
-        ext_mem_list = []
-        ext_mem_ids = [mem_id for _, mem_id, _ in ExtMemId]
-
-        try:
-            values = self.get_property(PropertyTag.CURRENT_VERSION)
-        except McuBootCommandError:
-            values = None
-
-        if not values and self._status_code == StatusCode.UNKNOWN_PROPERTY:
-            self._status_code = StatusCode.SUCCESS
-            if not memory_list:
-                self._status_code = StatusCode.FAIL
-                if self._cmd_exception:
-                    raise McuBootCommandError('GetMemoryList', self.status_code)
-            return memory_list
-
-        if Version(values[0]) <= Version("2.0.0"):
-            # old versions mboot support only Quad SPI memory
-            ext_mem_ids = [ExtMemId.QUAD_SPI0]
-
-        for id in ext_mem_ids:
-            mem_attrs = {}
-
-            try:
-                values = self.get_property(PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES, id)
-            except McuBootCommandError:
-                values = None
-
-            if not values:
-                if self._status_code == StatusCode.UNKNOWN_PROPERTY:
-                    # No external memories are supported by current device.
-                    break
-                elif self._status_code == StatusCode.INVALID_ARGUMENT:
-                    # Current memory type is not supported by the device, skip to next external memory.
-                    continue
-                elif self._status_code == StatusCode.QSPI_NOT_CONFIGURED:
-                    # QSPI0 is not supported, skip to next external memory.
-                    continue
-                elif self._status_code == StatusCode.MEMORY_NOT_CONFIGURED:
-                    # Un-configured external memory, skip to next external memory.
-                    continue
-                elif self._status_code != StatusCode.SUCCESS:
-                    # Other Error
-                    break
+        return self._run(self._get_memory_list())
 
-            # memory ID and name
-            mem_attrs['mem_id'] = id
-            mem_attrs['mem_name'] = ExtMemId[id]
-            # parse memory attributes
-            if values[0] & ExtMemPropTags.START_ADDRESS:
-                mem_attrs['address'] = values[1]
-            if values[0] & ExtMemPropTags.SIZE_IN_KBYTES:
-                mem_attrs['size'] = values[2] * 1024
-            if values[0] & ExtMemPropTags.PAGE_SIZE:
-                mem_attrs['page_size'] = values[3]
-            if values[0] & ExtMemPropTags.SECTOR_SIZE:
-                mem_attrs['sector_size'] = values[4]
-            if values[0] & ExtMemPropTags.BLOCK_SIZE:
-                mem_attrs['block_size'] = values[5]
-            # store attributes
-            ext_mem_list.append(mem_attrs)
-
-        if ext_mem_list:
-            memory_list['external'] = ext_mem_list
-
-        self._status_code = StatusCode.SUCCESS
-        if not memory_list:
-            self._status_code = StatusCode.FAIL
-            if self._cmd_exception:
-                raise McuBootCommandError('GetMemoryList', self.status_code)
+    def plan(self) -> OperationPlan:
+        """
+        Create plan of deferred erase, write, fill and verify operations, which are optimized and sent
+        into target by execute() method
 
-        return memory_list
+        :return: OperationPlan
+        """
+        return OperationPlan(self)
 
     def flash_erase_all(self, mem_id: int = 0) -> bool:
         """
@@ -376,10 +1282,7 @@ class McuBoot:
 
         :param mem_id: Memory ID
         """
-        logger.info(f"CMD: FlashEraseAll(mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_ALL, 0, mem_id)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._flash_erase_all(mem_id))
 
     def flash_erase_region(self, address: int, length: int, mem_id: int = 0) -> bool:
         """
@@ -389,10 +1292,7 @@ class McuBoot:
         :param length: Count of bytes
         :param mem_id: Memory ID
         """
-        logger.info(f"CMD: FlashEraseRegion(address=0x{address:08X}, length={length}, mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_REGION, 0, address, length, mem_id)
-        cmd_response = self._process_cmd(cmd_packet, 5000)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._flash_erase_region(address, length, mem_id))
 
     def read_memory(self, address: int, length: int, mem_id: int = 0) -> Optional[bytes]:
         """
@@ -402,27 +1302,60 @@ class McuBoot:
         :param length: Count of bytes
         :param mem_id: Memory ID
         """
-        logger.info(f"CMD: ReadMemory(address=0x{address:08X}, length={length}, mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.READ_MEMORY, 0, address, length, mem_id)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._read_data(CommandTag.READ_MEMORY, cmd_response.length)
-        return None
+        return self._run(self._read_memory(address, length, mem_id))
+
+    def iter_read_memory(self, address: int, length: int, chunk: int = 0x1000, mem_id: int = 0):
+        """
+        Read data from MCU memory as generator of chunks (data are yielded as they are received)
+
+        :param address: Start address
+        :param length: Count of bytes
+        :param chunk: The size of yielded chunks in bytes (the last one can be shorter)
+        :param mem_id: Memory ID
+        :raises McuBootCommandError: If the command is rejected or the data are incomplete (regardless of cmd_exception)
+        :raises McuBootConnectionError: If the device doesn't respond
+        """
+        return self._iter_run(self._iter_read_memory(address, length, chunk, mem_id))
+
+    def verify_memory(self, address: int, data, mem_id: int = 0, chunk: int = 0x1000) -> bool:
+        """
+        Verify content of MCU memory, the data are read back by segments and compared in chunks. The verification
+        stops at the first different chunk, the different address ranges are available in 'mismatches' attribute.
+
+        :param address: Start address
+        :param data: The reference data as bytes-like object
+        :param mem_id: Memory ID
+        :param chunk: The size of compared chunks in bytes
+        """
+        return self._run(self._verify_memory(address, data, mem_id, chunk))
+
+    def read_memory_into(self, address: int, buffer, mem_id: int = 0) -> Optional[int]:
+        """
+        Read data from MCU memory directly into buffer (the count of bytes is given by buffer size)
+
+        Large reads are split into segments of 'segment_size' bytes, each one issued as separate command. If a segment
+        fails, only the missing part of it is read again. The returned count of bytes informs about the progress of
+        incomplete read.
+
+        :param address: Start address
+        :param buffer: The writable bytes-like object (bytearray, memoryview, mmap, ...)
+        :param mem_id: Memory ID
+        :return: Count of received bytes or None if the command failed
+        """
+        return self._run(self._read_memory_into(address, buffer, mem_id))
 
-    def write_memory(self, address: int, data: bytes, mem_id: int = 0) -> bool:
+    def write_memory(self, address: int, data, mem_id: int = 0, length: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None) -> bool:
         """
         Write data into MCU memory
 
         :param address: Start address
-        :param data: List of bytes
+        :param data: Data as bytes-like object, file object or iterable of bytes chunks
         :param mem_id: Memory ID
+        :param length: Count of bytes (required only if can't be detected from data)
+        :param progress: The callback function with arguments: sent bytes, total bytes
         """
-        logger.info(f"CMD: WriteMemory(address=0x{address:08X}, length={len(data)}, mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.WRITE_MEMORY, 0, address, len(data), mem_id)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._send_data(CommandTag.WRITE_MEMORY, data)
-        return False
+        return self._run(self._write_memory(address, data, mem_id, length, progress))
 
     def fill_memory(self, address: int, length: int, pattern: int = 0xFFFFFFFF) -> bool:
         """
@@ -432,10 +1365,7 @@ class McuBoot:
         :param length: Count of words (must be word aligned)
         :param pattern: Count of wrote bytes
         """
-        logger.info(f"CMD: FillMemory(address=0x{address:08X}, length={length}, pattern=0x{pattern:08X})")
-        cmd_packet = CmdPacket(CommandTag.FILL_MEMORY, 0, address, length, pattern)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._fill_memory(address, length, pattern))
 
     def flash_security_disable(self, backdoor_key: bytes) -> bool:
         """
@@ -443,12 +1373,7 @@ class McuBoot:
 
         :param backdoor_key: The key value as array of 8 bytes
         """
-        if len(backdoor_key) != 8:
-            raise ValueError('Backdoor key must by 8 bytes long')
-        logger.info(f"CMD: FlashSecurityDisable(backdoor_key={backdoor_key})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_SECURITY_DISABLE, 0, data=backdoor_key)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._flash_security_disable(backdoor_key))
 
     def get_property(self, prop_tag: int, index: int = 0) -> Optional[list]:
         """
@@ -457,12 +1382,7 @@ class McuBoot:
         :param prop_tag: Property TAG (see Properties Enum)
         :param index: External memory ID or internal memory region index (depends on property type)
         """
-        logger.info(f"CMD: GetProperty({PropertyTag[prop_tag]}, index={index})")
-        cmd_packet = CmdPacket(CommandTag.GET_PROPERTY, 0, prop_tag, index)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response):
-            return cmd_response.values
-        return None
+        return self._run(self._get_property(prop_tag, index))
 
     def set_property(self, prop_tag: int, value: int) -> bool:
         """
@@ -471,23 +1391,18 @@ class McuBoot:
         :param  prop_tag: Property TAG (see Property enumerator)
         :param  value: The value of selected property
         """
-        logger.info(f"CMD: SetProperty({PropertyTag[prop_tag]}, value=0x{value:08X})")
-        cmd_packet = CmdPacket(CommandTag.SET_PROPERTY, 0, prop_tag, value)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._set_property(prop_tag, value))
 
-    def receive_sb_file(self, data: bytes) -> bool:
+    def receive_sb_file(self, data, length: Optional[int] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> bool:
         """
         Receive SB file
 
-        :param  data: SB file data
+        :param data: SB file data as bytes-like object, file object or iterable of bytes chunks
+        :param length: Count of bytes (required only if can't be detected from data)
+        :param progress: The callback function with arguments: sent bytes, total bytes
         """
-        logger.info(f"CMD: ReceiveSBfile(data_length={len(data)})")
-        cmd_packet = CmdPacket(CommandTag.RECEIVE_SB_FILE, 1, len(data))
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._send_data(CommandTag.RECEIVE_SB_FILE, data)
-        return False
+        return self._run(self._receive_sb_file(data, length, progress))
 
     def execute(self, address: int, argument: int, sp: int) -> bool:
         """
@@ -497,10 +1412,7 @@ class McuBoot:
         :param argument: Function arguments address
         :param sp: Stack pointer address
         """
-        logger.info(f"CMD: Execute(address=0x{address:08X}, argument=0x{argument:08X}, SP=0x{sp:08X})")
-        cmd_packet = CmdPacket(CommandTag.EXECUTE, 0, address, argument, sp)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._execute(address, argument, sp))
 
     def call(self, address: int, argument: int) -> bool:
         """
@@ -509,10 +1421,7 @@ class McuBoot:
         :param address: Call address (must be word aligned)
         :param argument: Function arguments address
         """
-        logger.info(f"CMD: Call(address=0x{address:08X}, argument=0x{argument:08X})")
-        cmd_packet = CmdPacket(CommandTag.CALL, 0, address, argument)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._call(address, argument))
 
     def reset(self, timeout: int = 2000, reopen: bool = True) -> bool:
         """
@@ -521,22 +1430,7 @@ class McuBoot:
         :param timeout: The maximal waiting time in [ms] for reopen connection
         :param reopen: True for reopen connection after HW reset else False
         """
-        ret_val = False
-        logger.info('CMD: Reset MCU')
-        cmd_packet = CmdPacket(CommandTag.RESET, 0)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response):
-            self._device.close()
-            ret_val = True
-            if self.reopen and reopen:
-                sleep(timeout / 1000)
-                try:
-                    self._device.open()
-                except:
-                    ret_val = False
-                    if self._cmd_exception:
-                        raise McuBootConnectionError()
-        return ret_val
+        return self._run(self._reset(timeout, reopen))
 
     def flash_erase_all_unsecure(self) -> bool:
         """
@@ -544,10 +1438,7 @@ class McuBoot:
 
         :return bool
         """
-        logger.info('CMD: FlashEraseAllUnsecure')
-        cmd_packet = CmdPacket(CommandTag.FLASH_ERASE_ALL_UNSECURE, 0)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._flash_erase_all_unsecure())
 
     def efuse_read_once(self, index: int) -> Optional[int]:
         """
@@ -555,10 +1446,7 @@ class McuBoot:
 
         :param index: Start index
         """
-        logger.info(f"CMD: FlashReadOnce(index={index})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_READ_ONCE, 0, index, 4)
-        cmd_response = self._process_cmd(cmd_packet)
-        return cmd_response.values[0] if self._check_response(cmd_packet, cmd_response) else None
+        return self._run(self._efuse_read_once(index))
 
     def efuse_program_once(self, index: int, value: int) -> bool:
         """
@@ -567,10 +1455,7 @@ class McuBoot:
         :param index: Start index
         :param value: Int value (4 bytes long)
         """
-        logger.info(f"CMD: FlashProgramOnce(index={index}, value=0x{value:X})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_PROGRAM_ONCE, 0, index, 4, value)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._efuse_program_once(index, value))
 
     def flash_read_once(self, index: int, count: int = 4) -> Optional[bytes]:
         """
@@ -579,11 +1464,7 @@ class McuBoot:
         :param index: Start index
         :param count: Count of bytes
         """
-        assert count in (4, 8)
-        logger.info(f"CMD: FlashReadOnce(index={index}, bytes={count})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_READ_ONCE, 0, index, count)
-        cmd_response = self._process_cmd(cmd_packet)
-        return cmd_response.data if self._check_response(cmd_packet, cmd_response) else None
+        return self._run(self._flash_read_once(index, count))
 
     def flash_program_once(self, index: int, data: bytes) -> bool:
         """
@@ -592,11 +1473,7 @@ class McuBoot:
         :param index: Start index
         :param data: Input data aligned to 4 or 8 bytes
         """
-        assert len(data) in (4, 8)
-        logger.info(f"CMD: FlashProgramOnce(index={index}, data={data})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_PROGRAM_ONCE, 0, index, len(data), data=data)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._flash_program_once(index, data))
 
     def flash_read_resource(self, address: int, length: int, option: int = 1) -> Optional[bytes]:
         """
@@ -606,12 +1483,31 @@ class McuBoot:
         :param length: Number of bytes
         :param option:
         """
-        logger.info(f"CMD: FlashReadResource(address=0x{address:08X}, length={length}, option={option})")
-        cmd_packet = CmdPacket(CommandTag.FLASH_READ_RESOURCE, 0, address, length, option)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._read_data(CommandTag.FLASH_READ_RESOURCE, cmd_response.length)
-        return None
+        return self._run(self._flash_read_resource(address, length, option))
+
+    def iter_flash_read_resource(self, address: int, length: int, chunk: int = 0x1000, option: int = 1):
+        """
+        Read resource of flash module as generator of chunks (data are yielded as they are received)
+
+        :param address: Start address
+        :param length: Number of bytes
+        :param chunk: The size of yielded chunks in bytes (the last one can be shorter)
+        :param option:
+        :raises McuBootCommandError: If the command is rejected or the data are incomplete (regardless of cmd_exception)
+        :raises McuBootConnectionError: If the device doesn't respond
+        """
+        return self._iter_run(self._iter_flash_read_resource(address, length, chunk, option))
+
+    def flash_read_resource_into(self, address: int, buffer, option: int = 1) -> Optional[int]:
+        """
+        Read resource of flash module directly into buffer (the count of bytes is given by buffer size)
+
+        :param address: Start address
+        :param buffer: The writable bytes-like object (bytearray, memoryview, mmap, ...)
+        :param option:
+        :return: Count of received bytes or None if the command failed
+        """
+        return self._run(self._flash_read_resource_into(address, buffer, option))
 
     def configure_memory(self, address: int, mem_id: int) -> bool:
         """
@@ -620,10 +1516,7 @@ class McuBoot:
         :param address: The address in memory where are locating configuration data
         :param mem_id: External memory ID
         """
-        logger.info(f"CMD: ConfigureMemory({ExtMemId[mem_id]}, address=0x{address:08X})")
-        cmd_packet = CmdPacket(CommandTag.CONFIGURE_MEMORY, 0, mem_id, address)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._configure_memory(address, mem_id))
 
     def reliable_update(self, address: int) -> bool:
         """
@@ -631,10 +1524,7 @@ class McuBoot:
 
         :param address:
         """
-        logger.info(f"CMD: ReliableUpdate(address=0x{address:08X})")
-        cmd_packet = CmdPacket(CommandTag.RELIABLE_UPDATE, 0, address)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._reliable_update(address))
 
     def generate_key_blob(self, dek_data: bytes, count: int = 72) -> Optional[bytes]:
         """
@@ -643,27 +1533,13 @@ class McuBoot:
         :param dek_data: Data Encryption Key as bytes
         :param count: Key blob count (default: 72 - AES128bit)
         """
-        logger.info(f"CMD: GenerateKeyBlob(dek_len={len(dek_data)}, count={count})")
-        cmd_packet = CmdPacket(CommandTag.GENERATE_KEY_BLOB, 1, 0, len(dek_data), 0)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return None
-        if not self._send_data(CommandTag.GENERATE_KEY_BLOB, dek_data):
-            return None
-        cmd_packet = CmdPacket(CommandTag.GENERATE_KEY_BLOB, 0, 0, count, 1)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._read_data(CommandTag.GENERATE_KEY_BLOB, cmd_response.length)
-        return None
+        return self._run(self._generate_key_blob(dek_data, count))
 
     def kp_enroll(self) -> bool:
         """
         Key provisioning: Enroll Command (start PUF)
         """
-        logger.info("CMD: [KeyProvisioning] Enroll")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.ENROLL)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._kp_enroll())
 
     def kp_set_intrinsic_key(self, key_type: int, key_size: int) -> bool:
         """
@@ -672,10 +1548,7 @@ class McuBoot:
         :param key_type:
         :param key_size:
         """
-        logger.info(f"CMD: [KeyProvisioning] SetIntrinsicKey(type={key_type}, key_size={key_size})")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.SET_INTRINSIC_KEY, key_type, key_size)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._kp_set_intrinsic_key(key_type, key_size))
 
     def kp_write_nonvolatile(self, mem_id: int = 0) -> bool:
         """
@@ -683,10 +1556,7 @@ class McuBoot:
 
         :param mem_id: The memory ID (default: 0)
         """
-        logger.info(f"CMD: [KeyProvisioning] WriteNonVolatileMemory(mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.WRITE_NON_VOLATILE, mem_id)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._kp_write_nonvolatile(mem_id))
 
     def kp_read_nonvolatile(self, mem_id: int = 0) -> bool:
         """
@@ -694,10 +1564,7 @@ class McuBoot:
 
         :param mem_id: The memory ID (default: 0)
         """
-        logger.info(f"CMD: [KeyProvisioning] ReadNonVolatileMemory(mem_id={mem_id})")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.READ_NON_VOLATILE, mem_id)
-        cmd_response = self._process_cmd(cmd_packet)
-        return self._check_response(cmd_packet, cmd_response)
+        return self._run(self._kp_read_nonvolatile(mem_id))
 
     def kp_set_user_key(self, key_type: int, key_data: bytes) -> bool:
         """
@@ -706,12 +1573,7 @@ class McuBoot:
         :param key_type:
         :param key_data:
         """
-        logger.info(f"CMD: [KeyProvisioning] SetUserKey(key_type={key_type}, key_len={len(key_data)})")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 1, KeyProvOperation.SET_USER_KEY, key_type, len(key_data))
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._send_data(CommandTag.KEY_PROVISIONING, key_data)
-        return False
+        return self._run(self._kp_send_key(KeyProvOperation.SET_USER_KEY, key_type, key_data))
 
     def kp_write_key_store(self, key_type: int, key_data: bytes) -> bool:
         """
@@ -720,21 +1582,10 @@ class McuBoot:
         :param key_type:
         :param key_data:
         """
-        key_len = len(key_data)
-        logger.info(f"CMD: [KeyProvisioning] WriteKeyStore(key_type={key_type}, key_len={key_len})")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 1, KeyProvOperation.WRITE_KEY_STORE, key_type, key_len)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._send_data(CommandTag.KEY_PROVISIONING, key_data)
-        return False
+        return self._run(self._kp_send_key(KeyProvOperation.WRITE_KEY_STORE, key_type, key_data))
 
     def kp_read_key_store(self) -> Optional[bytes]:
         """
         Key provisioning: Read key data from key store area.
         """
-        logger.info(f"CMD: [KeyProvisioning] ReadKeyStore")
-        cmd_packet = CmdPacket(CommandTag.KEY_PROVISIONING, 0, KeyProvOperation.READ_KEY_STORE)
-        cmd_response = self._process_cmd(cmd_packet)
-        if self._check_response(cmd_packet, cmd_response, False):
-            return self._read_data(CommandTag.KEY_PROVISIONING, cmd_response.length)
-        return None
+        return self._run(self._kp_read_key_store())
@@ -0,0 +1,420 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import re
+import hashlib
+from bisect import bisect_right
+from struct import pack
+from typing import Optional, Callable, Iterator, List, Tuple, Dict
+from logging import getLogger
+
+from .image import Image, merge_ranges
+from .erase import ErasePlanner
+from .exceptions import McuBootCommandError
+
+logger = getLogger('MBOOT:PLAN')
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def split_blank(address: int, data, page_size: int, is_erased: Callable[[int, int], bool]) -> List[tuple]:
+    """
+    Split data into parts without the pages in erased state (0xFF), the pages are aligned to page size
+
+    :param address: Start address of data
+    :param data: The bytes-like object
+    :param page_size: The page size in bytes
+    :param is_erased: The function with arguments start, end which returns True if the range is erased in target
+    :return: List of tuples (address, memoryview)
+    """
+    view = memoryview(data).cast('B')
+    blank = b'\xFF' * page_size
+    parts = []
+    part = None
+    offset = 0
+    while offset < len(view):
+        end = min(len(view), offset + page_size - (address + offset) % page_size)
+        # the comparison of bytes is much faster than the comparison of memoryview
+        if bytes(view[offset: end]) == blank[:end - offset] and is_erased(address + offset, address + end):
+            if part is not None:
+                parts.append((address + part, view[part: offset]))
+                part = None
+        elif part is None:
+            part = offset
+        offset = end
+    if part is not None:
+        parts.append((address + part, view[part:]))
+    return parts
+
+
+def split_fill(address: int, data, min_length: int, align: int = 4) -> List[tuple]:
+    """
+    Split data into parts with aligned runs of repeated 32-bit pattern and parts with other data
+
+    :param address: Start address of data
+    :param data: The bytes-like object
+    :param min_length: The minimal length of run in bytes, zero for disable the runs detection
+    :param align: The alignment of runs in bytes, multiple of 4 (the program unit of flash)
+    :return: List of tuples (address, memoryview, pattern), the pattern is None for other data
+    """
+    view = memoryview(data).cast('B')
+    if not min_length:
+        return [(address, view, None)]
+    min_length = max(min_length, 8)
+    parts = []
+    offset = 0
+    for match in re.finditer(rb'(.{4})\1{%d,}' % (min_length // 4 - 1), view, re.DOTALL):
+        # align the run to specified boundaries, any aligned 4 bytes inside the run are the pattern
+        start = match.start() + (-(address + match.start()) % align)
+        end = match.end() - (address + match.end()) % align
+        if end - start < min_length:
+            continue
+        if start > offset:
+            parts.append((address + offset, view[offset: start], None))
+        parts.append((address + start, view[start: end], int.from_bytes(view[start: start + 4], 'little')))
+        offset = end
+    if offset < len(view):
+        parts.append((address + offset, view[offset:], None))
+    return parts
+
+
+def iter_sectors(image: Image, planner: ErasePlanner, mem_id: int = 0) -> Iterator[tuple]:
+    """
+    Split the data of image by flash sectors
+
+    :param image: The Image object
+    :param planner: The ErasePlanner object with memory map of target
+    :param mem_id: Memory ID
+    :return: Iterator of tuples (sector_address, address, memoryview), the sector_address is None outside flash
+    """
+    for segment in image:
+        view = memoryview(segment.data).cast('B')
+        address = segment.address
+        while address < segment.end:
+            region = planner.region(address, mem_id)
+            if region is None:
+                sector, end = None, segment.end
+            else:
+                sector = address - (address - region[0]) % region[2]
+                end = min(segment.end, sector + region[2])
+            yield sector, address, view[address - segment.address: end - segment.address]
+            address = end
+
+
+def get_sector_hashes(image: Image, planner: ErasePlanner, mem_id: int = 0) -> Dict[int, str]:
+    """
+    Get hashes of image content in every touched flash sector
+
+    :param image: The Image object
+    :param planner: The ErasePlanner object with memory map of target
+    :param mem_id: Memory ID
+    :return: The dict {sector_address: hash}
+    """
+    hashes = {}
+    for sector, address, data in iter_sectors(image, planner, mem_id):
+        if sector is not None:
+            if sector not in hashes:
+                hashes[sector] = hashlib.sha256()
+            hashes[sector].update(pack('<2I', address - sector, len(data)))
+            hashes[sector].update(data)
+    return {sector: value.hexdigest() for sector, value in hashes.items()}
+
+
+def run_commands(mboot, commands: List[tuple], progress: Optional[Callable[[int, int], None]] = None) -> bool:
+    """
+    Send the list of commands as returned by OperationPlan.optimize()
+
+    :param mboot: The McuBoot object
+    :param commands: List of tuples: ('erase', address, length, mem_id), ('erase_all', mem_id),
+                     ('fill', address, length, pattern) or ('write', address, data, mem_id)
+    :param progress: The callback function with arguments: processed bytes, total bytes
+    :return: True if all commands succeeded
+    """
+    total = sum(len(cmd[2]) for cmd in commands if cmd[0] == 'write')
+    done = 0
+
+    def write_progress(sent, _):
+        progress(done + sent, total)
+
+    for cmd in commands:
+        if cmd[0] == 'erase':
+            ret_val = mboot.flash_erase_region(*cmd[1:])
+        elif cmd[0] == 'erase_all':
+            ret_val = mboot.flash_erase_all(cmd[1])
+        elif cmd[0] == 'fill':
+            ret_val = mboot.fill_memory(*cmd[1:])
+        else:
+            ret_val = mboot.write_memory(cmd[1], cmd[2], cmd[3], progress=write_progress if progress else None)
+            done += len(cmd[2])
+        if not ret_val:
+            return False
+    return True
+
+
+########################################################################################################################
+# Operation Plan
+########################################################################################################################
+
+class OperationPlan:
+    """
+    Deferred sequence of erase, write, fill and verify operations.
+
+    The operations are only recorded and their final effect on target memory is modeled. The execute() method
+    sends optimized sequence of commands: merged erase regions first, then coalesced write and fill commands.
+    """
+
+    @property
+    def requests(self) -> int:
+        """ Count of queued operations """
+        return self._requests
+
+    def __init__(self, mboot, planner: Optional[ErasePlanner] = None):
+        """
+        Initialize the OperationPlan object.
+
+        :param mboot: The McuBoot object, None for offline planning with specified planner
+        :param planner: The ErasePlanner object (default: created from memory map of connected device)
+        """
+        self._mboot = mboot
+        self._requests = 0
+        self._verify = False
+        self._skip_blank = False
+        self._blank_check = False
+        self._fill_length = 256
+        # erase regions as list of (start, end) for every memory id
+        self._erases = {}
+        # content of memories written by write and fill operations for every memory id
+        self._images = {}
+        self._planner = planner
+
+    @property
+    def planner(self) -> ErasePlanner:
+        """ The erase planner created lazily from memory map of connected device """
+        if self._planner is None:
+            self._planner = ErasePlanner.from_device(self._mboot)
+        return self._planner
+
+    def _image(self, mem_id: int) -> Image:
+        if mem_id not in self._images:
+            self._images[mem_id] = Image()
+        return self._images[mem_id]
+
+    def erase(self, address: int, length: int, mem_id: int = 0, align: bool = False):
+        """
+        Erase specified range of flash
+
+        :param address: Start address
+        :param length: Count of bytes
+        :param mem_id: Memory ID
+        :param align: True for extending the range to boundaries of sectors which it touches
+        """
+        self._requests += 1
+        end = address + length
+        if align:
+            address, end = self.planner.align(address, end, mem_id)
+            length = end - address
+        self._erases.setdefault(mem_id, []).append((address, end))
+        # data written before erase are lost
+        self._image(mem_id).remove(address, length)
+        return self
+
+    def write(self, address: int, data, mem_id: int = 0, copy: bool = True):
+        """
+        Write data into MCU memory
+
+        :param address: Start address
+        :param data: The bytes-like object
+        :param mem_id: Memory ID
+        :param copy: False for keeping the reference to data (the data must not be modified before execution)
+        """
+        self._requests += 1
+        self._image(mem_id).add(address, data, copy)
+        return self
+
+    def fill(self, address: int, length: int, pattern: int = 0xFFFFFFFF):
+        """
+        Fill MCU memory with specified pattern
+
+        :param address: Start address (must be word aligned)
+        :param length: Count of bytes (must be word aligned)
+        :param pattern: The 32-bit pattern
+        """
+        self._requests += 1
+        data = pack('<I', pattern) * (length // 4 + 1)
+        self._image(0).add(address, data[:length])
+        return self
+
+    def write_image(self, image: Image, mem_id: int = 0, skip_sectors: Optional[set] = None):
+        """
+        Erase the flash sectors touched by image and write the image data
+
+        :param image: The Image object, its data are not copied (they must not be modified before execution)
+        :param mem_id: Memory ID
+        :param skip_sectors: The set of sector addresses which are not erased and written
+        """
+        ranges = merge_ranges([(address, address + len(data))
+                               for sector, address, data in iter_sectors(image, self.planner, mem_id)
+                               if not skip_sectors or sector not in skip_sectors])
+        # the written parts are slices of image segments (the image segments never touch, so the merged ranges are
+        # always inside one segment), the data are not copied and not merged with each other
+        parts = []
+        segments = iter(image)
+        segment = None
+        for start, end in ranges:
+            while segment is None or segment.end < end:
+                segment = next(segments)
+            parts.append((start, memoryview(segment.data).cast('B')[start - segment.address: end - segment.address]))
+        # all erases first, the sectors shared by several segments must not be erased after writing
+        for address, data in parts:
+            self.erase(address, len(data), mem_id, align=True)
+        for address, data in parts:
+            self.write(address, data, mem_id, copy=False)
+        return self
+
+    def verify(self, enable: bool = True):
+        """
+        Read back and compare the written data after execution
+
+        :param enable: True for enable verification
+        """
+        self._verify = enable
+        return self
+
+    def skip_blank(self, enable: bool = True):
+        """
+        Leave out the pages in erased state (0xFF) from the data phase of write commands, only the pages inside
+        erased regions are skipped
+
+        :param enable: True for enable skipping
+        """
+        self._skip_blank = enable
+        return self
+
+    def blank_check(self, enable: bool = True):
+        """
+        Read the sectors before erasing and skip erasing of the sectors which are already blank
+
+        :param enable: True for enable blank check
+        """
+        self._blank_check = enable
+        return self
+
+    def fill_runs(self, min_length: int = 256):
+        """
+        Send the runs of repeated 32-bit pattern in written data as fill commands. The runs in internal RAM are word
+        aligned, the runs in flash are aligned to its page size and they are not detected if the page size is not known
+
+        :param min_length: The minimal length of run in bytes, zero for disable
+        """
+        self._fill_length = min_length
+        return self
+
+    def _non_blank(self, address: int, length: int, mem_id: int) -> List[Tuple[int, int]]:
+        """ Get ranges of sectors which are not blank, the unreadable sectors are reported as not blank """
+        ranges = []
+        end = address + length
+        while address < end:
+            region = self.planner.region(address, mem_id)
+            if region is None:
+                ranges.append((address, end))
+                break
+            region_end = end if region[1] is None else min(end, region[1])
+            blank = b'\xFF' * region[2]
+            offset = address
+            try:
+                for data in self._mboot.iter_read_memory(address, region_end - address, region[2], mem_id):
+                    if data != blank[:len(data)]:
+                        ranges.append((offset, offset + len(data)))
+                    offset += len(data)
+            except McuBootCommandError:
+                pass
+            if offset < region_end:
+                ranges.append((offset, region_end))
+            address = region_end
+        return merge_ranges(ranges)
+
+    def optimize(self) -> List[tuple]:
+        """
+        Get the optimized list of commands, the erase regions are checked for alignment to sector size and for
+        overlapping with reserved regions
+
+        :return: List of tuples: ('erase', address, length, mem_id), ('erase_all', mem_id),
+                 ('fill', address, length, pattern) or ('write', address, data, mem_id)
+        """
+        commands = []
+        for mem_id, ranges in sorted(self._erases.items()):
+            commands += self.planner.plan(ranges, mem_id)
+
+        for mem_id, image in sorted(self._images.items()):
+            erased = merge_ranges(self._erases.get(mem_id, []))
+            starts = [start for start, _ in erased]
+
+            def is_erased(start, end):
+                index = bisect_right(starts, start) - 1
+                return index >= 0 and end <= erased[index][1]
+
+            page_size = self.planner.page_size(mem_id) if self._skip_blank else None
+            # the fill and write commands in flash must start and end on boundaries of program unit
+            flash_unit = self.planner.page_size(0)
+            for segment in image:
+                if page_size:
+                    parts = split_blank(segment.address, segment.data, page_size, is_erased)
+                else:
+                    parts = [(segment.address, memoryview(segment.data))]
+                for address, data in parts:
+                    if mem_id != 0:
+                        commands.append(('write', address, data, mem_id))
+                        continue
+                    unit = 4 if self.planner.is_ram(address, address + len(data)) else flash_unit
+                    if not unit:
+                        commands.append(('write', address, data, mem_id))
+                        continue
+                    unit = max(unit, 4)
+                    for address, data, pattern in split_fill(address, data, self._fill_length, unit):
+                        # the short data with repeated 32-bit pattern are sent as fill command too
+                        if pattern is None and 4 < len(data) <= max(self._fill_length, 4) and \
+                           not (address | len(data)) % unit and data == bytes(data[:4]) * (len(data) // 4):
+                            pattern = int.from_bytes(data[:4], 'little')
+                        if pattern is None:
+                            commands.append(('write', address, data, mem_id))
+                        else:
+                            commands.append(('fill', address, len(data), pattern))
+
+        logger.info(f"PLAN: {self._requests} operations optimized into {len(commands)} commands")
+        return commands
+
+    def execute(self, progress: Optional[Callable[[int, int], None]] = None) -> bool:
+        """
+        Execute the optimized list of commands
+
+        :param progress: The callback function with arguments: processed bytes, total bytes
+        :return: True if all commands succeeded
+        """
+        commands = self.optimize()
+        if self._blank_check:
+            # the blank sectors are not erased again
+            erase_commands = []
+            for cmd in commands:
+                if cmd[0] == 'erase':
+                    erase_commands += [('erase', start, end - start, cmd[3])
+                                       for start, end in self._non_blank(*cmd[1:])]
+                else:
+                    erase_commands.append(cmd)
+            commands = erase_commands
+
+        if not run_commands(self._mboot, commands, progress):
+            return False
+
+        if self._verify:
+            for mem_id, image in sorted(self._images.items()):
+                for segment in image:
+                    if not self._mboot.verify_memory(segment.address, segment.data, mem_id):
+                        return False
+
+        return True
@@ -161,6 +161,79 @@ class PropertyTag(Enum):
     PFR_KEYSTORE_UPDATE_OPT = (0x1D, 'PfrKeystoreUpdateOpt', 'PFR Keystore Update Opt')
 
 
+# Properties with constant value during the session (invalidated by commands changing the target state)
+STATIC_PROPERTIES = (
+    PropertyTag.CURRENT_VERSION,
+    PropertyTag.AVAILABLE_PERIPHERALS,
+    PropertyTag.FLASH_START_ADDRESS,
+    PropertyTag.FLASH_SIZE,
+    PropertyTag.FLASH_SECTOR_SIZE,
+    PropertyTag.FLASH_BLOCK_COUNT,
+    PropertyTag.AVAILABLE_COMMANDS,
+    PropertyTag.MAX_PACKET_SIZE,
+    PropertyTag.RESERVED_REGIONS,
+    PropertyTag.RAM_START_ADDRESS,
+    PropertyTag.RAM_SIZE,
+    PropertyTag.SYSTEM_DEVICE_IDENT,
+    PropertyTag.UNIQUE_DEVICE_IDENT,
+    PropertyTag.FLASH_FAC_SUPPORT,
+    PropertyTag.FLASH_ACCESS_SEGMENT_SIZE,
+    PropertyTag.FLASH_ACCESS_SEGMENT_COUNT,
+    PropertyTag.TARGET_VERSION,
+    PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES,
+    PropertyTag.FLASH_PAGE_SIZE,
+)
+
+# Properties with value depending on index (internal memory region index or external memory ID)
+INDEXED_PROPERTIES = (
+    PropertyTag.FLASH_START_ADDRESS,
+    PropertyTag.FLASH_SIZE,
+    PropertyTag.FLASH_SECTOR_SIZE,
+    PropertyTag.FLASH_BLOCK_COUNT,
+    PropertyTag.RAM_START_ADDRESS,
+    PropertyTag.RAM_SIZE,
+    PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES,
+    PropertyTag.FLASH_PAGE_SIZE,
+)
+
+
+# The properties introduced by every version of bootloader
+PROPERTIES_HISTORY = (
+    ('1.0.0', (PropertyTag.CURRENT_VERSION,
+               PropertyTag.AVAILABLE_PERIPHERALS,
+               PropertyTag.FLASH_START_ADDRESS,
+               PropertyTag.FLASH_SIZE,
+               PropertyTag.FLASH_SECTOR_SIZE,
+               PropertyTag.FLASH_BLOCK_COUNT,
+               PropertyTag.AVAILABLE_COMMANDS,
+               PropertyTag.CRC_CHECK_STATUS,
+               PropertyTag.LAST_ERROR,
+               PropertyTag.VERIFY_WRITES,
+               PropertyTag.MAX_PACKET_SIZE,
+               PropertyTag.RESERVED_REGIONS,
+               PropertyTag.VALIDATE_REGIONS,
+               PropertyTag.RAM_START_ADDRESS,
+               PropertyTag.RAM_SIZE,
+               PropertyTag.SYSTEM_DEVICE_IDENT,
+               PropertyTag.FLASH_SECURITY_STATE,
+               PropertyTag.UNIQUE_DEVICE_IDENT)),
+    ('1.1.0', (PropertyTag.FLASH_FAC_SUPPORT,
+               PropertyTag.FLASH_ACCESS_SEGMENT_SIZE,
+               PropertyTag.FLASH_ACCESS_SEGMENT_COUNT,
+               PropertyTag.FLASH_READ_MARGIN)),
+    ('1.2.0', (PropertyTag.QSPI_INIT_STATUS,)),
+    ('2.0.0', (PropertyTag.TARGET_VERSION,
+               PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES,
+               PropertyTag.RELIABLE_UPDATE_STATUS,
+               PropertyTag.FLASH_PAGE_SIZE,
+               PropertyTag.IRQ_NOTIFIER_PIN)),
+    ('3.0.0', (PropertyTag.PFR_KEYSTORE_UPDATE_OPT,)),
+)
+
+# The version of bootloader in which the property was introduced (derived from PROPERTIES_HISTORY)
+PROPERTIES_VERSION = {tag: Version(version) for version, tags in PROPERTIES_HISTORY for tag in tags}
+
+
 class PeripheryTag(Enum):
     UART = (0x01, 'UART', 'UART Interface')
     I2C_SLAVE = (0x02, 'I2C-Slave', 'I2C Slave Interface')
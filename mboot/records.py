@@ -0,0 +1,313 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+from binascii import hexlify, unhexlify, Error as BinasciiError
+from itertools import islice
+from struct import pack
+
+from .image import Image
+
+
+########################################################################################################################
+# Helper methods
+########################################################################################################################
+
+def pack_ihex(rec_type: int, address: int, data: bytes = b'') -> str:
+    """
+    Create Intel HEX record
+
+    :param rec_type: Record type
+    :param address: The 16-bit address
+    :param data: Record data
+    """
+    raw = pack('>BHB', len(data), address, rec_type) + data
+    return ':' + hexlify(raw + bytes([-sum(raw) & 0xFF])).decode('ascii').upper()
+
+
+def pack_srec(rec_type: int, address: int, data: bytes = b'') -> str:
+    """
+    Create Motorola S-Record
+
+    :param rec_type: Record type (0 - 9)
+    :param address: The address
+    :param data: Record data
+    """
+    address_size = {0: 2, 1: 2, 5: 2, 9: 2, 2: 3, 6: 3, 8: 3, 3: 4, 7: 4}[rec_type]
+    raw = bytes([len(data) + address_size + 1]) + address.to_bytes(address_size, 'big') + data
+    return f'S{rec_type}' + hexlify(raw + bytes([~sum(raw) & 0xFF])).decode('ascii').upper()
+
+
+########################################################################################################################
+# Streaming Writers
+########################################################################################################################
+
+class RecordWriter:
+    """ Base class for streaming writer of image file """
+
+    def __init__(self, stream, address: int = 0, record_size: int = 32):
+        """
+        Initialize the record writer
+
+        :param stream: Output file object
+        :param address: Start address of data
+        :param record_size: Count of data bytes in one record
+        """
+        self.stream = stream
+        self.address = address
+        self.record_size = record_size
+        self._pending = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_records(self, address: int, data) -> None:
+        raise NotImplementedError()
+
+    def _write_footer(self) -> None:
+        pass
+
+    def write(self, data) -> None:
+        """
+        Append data at current address
+
+        :param data: The bytes-like object
+        """
+        if self._pending:
+            self._pending += data
+            data = self._pending
+        size = len(data) - len(data) % self.record_size
+        if size:
+            self._write_records(self.address, memoryview(data)[:size])
+            self.address += size
+        self._pending = bytearray(data[size:])
+
+    def finish(self) -> None:
+        """ Write remaining data and footer records """
+        if self._pending:
+            self._write_records(self.address, memoryview(self._pending))
+            self.address += len(self._pending)
+            self._pending = bytearray()
+        self._write_footer()
+
+    def close(self) -> None:
+        """ Finish the output and close the stream """
+        self.finish()
+        self.stream.close()
+
+
+class BinWriter(RecordWriter):
+    """ Streaming writer of raw binary file """
+
+    def write(self, data) -> None:
+        self.stream.write(data)
+        self.address += len(data)
+
+
+class IHexWriter(RecordWriter):
+    """ Streaming writer of Intel HEX file (32-bit addresses) """
+
+    def __init__(self, stream, address: int = 0, record_size: int = 32):
+        super().__init__(stream, address, record_size)
+        self._linear_address = 0
+
+    def _write_records(self, address: int, data) -> None:
+        # the data are converted into hex string at once, the records are sliced from it
+        hex_data = hexlify(data).decode('ascii').upper()
+        lines = []
+        for offset in range(0, len(data), self.record_size):
+            upper_address = (address + offset) >> 16
+            if upper_address > self._linear_address:
+                self._linear_address = upper_address
+                lines.append(pack_ihex(0x04, 0, pack('>H', upper_address)))
+            record = data[offset: offset + self.record_size]
+            header = pack('>BHB', len(record), (address + offset) & 0xFFFF, 0x00)
+            checksum = -(sum(header) + sum(record)) & 0xFF
+            lines.append(f":{header.hex().upper()}{hex_data[2 * offset: 2 * (offset + len(record))]}{checksum:02X}")
+        self.stream.write('\n'.join(lines) + '\n')
+
+    def _write_footer(self) -> None:
+        self.stream.write(pack_ihex(0x01, 0) + '\n')
+
+
+class SRecWriter(RecordWriter):
+    """ Streaming writer of Motorola S-Record file (32-bit addresses) """
+
+    def __init__(self, stream, address: int = 0, record_size: int = 32, header: str = 'mboot'):
+        super().__init__(stream, address, record_size)
+        self._count = 0
+        if header is not None:
+            self.stream.write(pack_srec(0, 0, header.encode('ascii')) + '\n')
+
+    def _write_records(self, address: int, data) -> None:
+        # the data are converted into hex string at once, the records are sliced from it
+        hex_data = hexlify(data).decode('ascii').upper()
+        lines = []
+        for offset in range(0, len(data), self.record_size):
+            record = data[offset: offset + self.record_size]
+            header = pack('>BI', len(record) + 5, address + offset)
+            checksum = ~(sum(header) + sum(record)) & 0xFF
+            lines.append(f"S3{header.hex().upper()}{hex_data[2 * offset: 2 * (offset + len(record))]}{checksum:02X}")
+        self._count += len(lines)
+        self.stream.write('\n'.join(lines) + '\n')
+
+    def _write_footer(self) -> None:
+        if self._count > 0xFFFFFF:
+            raise ValueError(f'Too many records {self._count}')
+        self.stream.write(pack_srec(5 if self._count <= 0xFFFF else 6, self._count) + '\n')
+
+
+def open_writer(file_path: str, address: int = 0) -> RecordWriter:
+    """
+    Open streaming writer for output file, the format is selected by file extension
+
+    :param file_path: The output file path with extension: *.bin, *.hex, *.ihex, *.srec or *.s19
+    :param address: Start address of data
+    """
+    if file_path.lower().endswith(('.srec', '.s19')):
+        return SRecWriter(open(file_path, 'w'), address)
+    if file_path.lower().endswith(('.hex', '.ihex')):
+        return IHexWriter(open(file_path, 'w'), address)
+    return BinWriter(open(file_path, 'wb'), address)
+
+
+########################################################################################################################
+# Streaming Readers
+########################################################################################################################
+
+class _SegmentBuilder:
+    """ Collects the data of consecutive records into one bytearray """
+
+    def __init__(self, image: Image):
+        self.image = image
+        self.address = 0
+        self.data = bytearray()
+
+    def add(self, address: int, data) -> None:
+        if address != self.address + len(self.data):
+            self.flush()
+            self.address = address
+        self.data += data
+
+    def flush(self) -> None:
+        if self.data:
+            self.image.add(self.address, self.data, copy=False)
+            self.data = bytearray()
+
+
+def _iter_batches(stream, batch: int):
+    """
+    Read the records in batches of lines, the empty lines are skipped
+
+    :param stream: Input text stream (file object or iterable of lines)
+    :param batch: Count of lines in one batch
+    :return: Iterator of tuples (number of first record, list of records)
+    """
+    number = 1
+    while True:
+        lines = list(islice(stream, batch))
+        if not lines:
+            break
+        records = ' '.join(lines).split()
+        if records:
+            yield number, records
+            number += len(records)
+
+
+def _unhexlify(text: str, number: int, count: int) -> bytes:
+    try:
+        return unhexlify(text)
+    except BinasciiError:
+        raise ValueError(f"Invalid characters in records {number} - {number + count - 1}")
+
+
+def parse_ihex(stream, batch: int = 4096) -> Image:
+    """
+    Parse Intel HEX records from text stream, the hex strings of complete batch are decoded by one unhexlify call
+
+    :param stream: Input text stream (file object or iterable of lines)
+    :param batch: Count of lines decoded at once
+    :return: The Image object
+    """
+    image = Image()
+    builder = _SegmentBuilder(image)
+    base_address = 0
+    for number, records in _iter_batches(stream, batch):
+        text = ''.join(records)
+        if text.count(':') != len(records):
+            for index, record in enumerate(records):
+                if not record.startswith(':') or ':' in record[1:]:
+                    raise ValueError(f"Invalid record {number + index}: {record[:20]}")
+        raw = _unhexlify(text.replace(':', ''), number, len(records))
+        offset = 0
+        for index, line in enumerate(records):
+            end = offset + raw[offset] + 5 if offset < len(raw) else offset
+            record = raw[offset: end]
+            offset = end
+            if len(line) != 2 * len(record) + 1 or len(record) < 5:
+                raise ValueError(f"Invalid record length {number + index}: {line[:20]}")
+            if sum(record) & 0xFF:
+                raise ValueError(f"Invalid checksum of record {number + index}: {line[:20]}")
+            rec_type = record[3]
+            if rec_type == 0x00:
+                builder.add(base_address + (record[1] << 8 | record[2]), record[4:-1])
+            elif rec_type == 0x01:
+                builder.flush()
+                return image
+            elif rec_type == 0x02:
+                base_address = (record[4] << 8 | record[5]) << 4
+            elif rec_type == 0x04:
+                base_address = (record[4] << 8 | record[5]) << 16
+            elif rec_type > 0x05:
+                raise ValueError(f"Invalid type of record {number + index}: {line[:20]}")
+    builder.flush()
+    return image
+
+
+def parse_srec(stream, batch: int = 4096) -> Image:
+    """
+    Parse Motorola S-Records from text stream, the hex strings of complete batch are decoded by one unhexlify call
+
+    :param stream: Input text stream (file object or iterable of lines)
+    :param batch: Count of lines decoded at once
+    :return: The Image object
+    """
+    image = Image()
+    builder = _SegmentBuilder(image)
+    for number, records in _iter_batches(stream, batch):
+        raw = _unhexlify(''.join([record[2:] for record in records]), number, len(records))
+        offset = 0
+        for index, line in enumerate(records):
+            end = offset + raw[offset] + 1 if offset < len(raw) else offset
+            record = raw[offset: end]
+            offset = end
+            if line[0] != 'S' or len(line) != 2 * len(record) + 2 or len(record) < 3:
+                raise ValueError(f"Invalid record {number + index}: {line[:20]}")
+            if (sum(record) & 0xFF) != 0xFF:
+                raise ValueError(f"Invalid checksum of record {number + index}: {line[:20]}")
+            rec_type = line[1]
+            if rec_type in '123':
+                address_size = int(rec_type) + 1
+                builder.add(int.from_bytes(record[1: 1 + address_size], 'big'), record[1 + address_size: -1])
+            elif rec_type not in '056789':
+                raise ValueError(f"Invalid type of record {number + index}: {line[:20]}")
+    builder.flush()
+    return image
+
+
+def load_image(file_path: str) -> Image:
+    """
+    Load Intel HEX or S-Record file into sparse image, the format is selected by file extension
+
+    :param file_path: The input file path with extension: *.hex, *.ihex, *.srec or *.s19
+    """
+    with open(file_path, 'r') as f:
+        if file_path.lower().endswith(('.srec', '.s19')):
+            return parse_srec(f)
+        return parse_ihex(f)
@@ -0,0 +1,224 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import pytest
+import asyncio
+from collections import deque
+from struct import pack
+from mboot.commands import CommandTag, ResponseTag, CmdPacket, parse_cmd_response
+from mboot.properties import PropertyTag
+from mboot.errorcodes import StatusCode
+from mboot.connection import DevConnBase, AsyncDevConnBase
+
+
+########################################################################################################################
+# Virtual McuBoot Device
+########################################################################################################################
+
+class VirtualDevice(DevConnBase):
+    """ Simple in-memory model of MCU bootloader used as a mock of communication interface """
+
+    @property
+    def is_opened(self):
+        return self._opened
+
+    def __init__(self, memory_start=0, memory_size=0x10000, sector_size=0x400, max_packet_size=32, **kwargs):
+        super().__init__(**kwargs)
+        self._opened = False
+        self.memory_start = memory_start
+        self.memory = bytearray([0xFF] * memory_size)
+        self.properties = {
+            PropertyTag.CURRENT_VERSION: [0x4B020100],
+            PropertyTag.FLASH_START_ADDRESS: [memory_start],
+            PropertyTag.FLASH_SIZE: [memory_size],
+            PropertyTag.FLASH_SECTOR_SIZE: [sector_size],
+            PropertyTag.MAX_PACKET_SIZE: [max_packet_size],
+        }
+        self.max_packet_size = max_packet_size
+        # external memories attributes {mem_id: [attributes]}
+        self.ext_memories = {}
+        # data phase
+        self.rx_queue = deque()
+        self.data_phase = None
+        # injected errors: fail data phase after count of received bytes, count of interrupted reads
+        self.fail_after = None
+        self.broken_reads = 0
+        # statistics
+        self.commands = []
+        self.packets = []
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+
+    def abort(self):
+        self.data_phase = None
+
+    def info(self):
+        return "Virtual Device"
+
+    def _response(self, tag, *params):
+        return parse_cmd_response(pack(f'<4B{len(params)}I', tag, 0, 0, len(params), *params))
+
+    def _generic(self, status, cmd_tag):
+        return self._response(ResponseTag.GENERIC, status, cmd_tag)
+
+    def _offset(self, address, length):
+        offset = address - self.memory_start
+        if offset < 0 or offset + length > len(self.memory):
+            return None
+        return offset
+
+    def _process_cmd(self, packet: CmdPacket):
+        tag = packet.header.tag
+        params = packet.params
+        self.commands.append(packet)
+
+        if tag == CommandTag.GET_PROPERTY:
+            if params[0] == PropertyTag.EXTERNAL_MEMORY_ATTRIBUTES:
+                if params[1] in self.ext_memories:
+                    self.rx_queue.append(self._response(ResponseTag.GET_PROPERTY, StatusCode.SUCCESS,
+                                                        *self.ext_memories[params[1]]))
+                else:
+                    self.rx_queue.append(self._response(ResponseTag.GET_PROPERTY, StatusCode.INVALID_ARGUMENT))
+            elif params[0] in self.properties:
+                self.rx_queue.append(self._response(ResponseTag.GET_PROPERTY, StatusCode.SUCCESS,
+                                                    *self.properties[params[0]]))
+            else:
+                self.rx_queue.append(self._response(ResponseTag.GET_PROPERTY, StatusCode.UNKNOWN_PROPERTY))
+
+        elif tag in (CommandTag.WRITE_MEMORY, CommandTag.RECEIVE_SB_FILE, CommandTag.KEY_PROVISIONING):
+            if tag == CommandTag.WRITE_MEMORY:
+                address, length = params[0], params[1]
+            else:
+                address, length = None, params[-1]
+            if address is not None and self._offset(address, length) is None:
+                self.rx_queue.append(self._generic(StatusCode.MEMORY_RANGE_INVALID, tag))
+                return
+            self.data_phase = {'tag': tag, 'address': address, 'length': length, 'data': bytearray()}
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+        elif tag == CommandTag.READ_MEMORY:
+            address, length = params[0], params[1]
+            offset = self._offset(address, length)
+            if offset is None:
+                self.rx_queue.append(self._generic(StatusCode.MEMORY_RANGE_INVALID, tag))
+                return
+            self.rx_queue.append(self._response(ResponseTag.READ_MEMORY, StatusCode.SUCCESS, length))
+            for i in range(offset, offset + length, self.max_packet_size):
+                if self.broken_reads and i >= offset + length // 2:
+                    # the rest of data is lost
+                    self.broken_reads -= 1
+                    return
+                self.rx_queue.append(bytes(self.memory[i: min(i + self.max_packet_size, offset + length)]))
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+        elif tag == CommandTag.FLASH_ERASE_REGION:
+            offset = self._offset(params[0], params[1])
+            if offset is None:
+                self.rx_queue.append(self._generic(StatusCode.MEMORY_RANGE_INVALID, tag))
+                return
+            self.memory[offset: offset + params[1]] = bytes([0xFF] * params[1])
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+        elif tag == CommandTag.FLASH_ERASE_ALL:
+            self.memory[:] = bytes([0xFF] * len(self.memory))
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+        elif tag == CommandTag.FILL_MEMORY:
+            offset = self._offset(params[0], params[1])
+            if offset is None:
+                self.rx_queue.append(self._generic(StatusCode.MEMORY_RANGE_INVALID, tag))
+                return
+            pattern = pack('<I', params[2]) * (params[1] // 4 + 1)
+            self.memory[offset: offset + params[1]] = pattern[:params[1]]
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+        else:
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, tag))
+
+    def _process_data(self, data):
+        phase = self.data_phase
+        if phase is None:
+            return
+        phase['data'] += data
+        received = len(phase['data'])
+        if self.fail_after is not None and received >= self.fail_after:
+            self.data_phase = None
+            self.rx_queue.append(self._generic(StatusCode.FLASH_ALIGNMENT_ERROR, phase['tag']))
+        elif received >= phase['length']:
+            self.data_phase = None
+            if phase['address'] is not None:
+                offset = self._offset(phase['address'], phase['length'])
+                self.memory[offset: offset + phase['length']] = phase['data'][:phase['length']]
+            self.rx_queue.append(self._generic(StatusCode.SUCCESS, phase['tag']))
+
+    def write(self, packet):
+        if isinstance(packet, CmdPacket):
+            self._process_cmd(packet)
+        else:
+            assert len(packet) <= self.max_packet_size
+            self.packets.append(len(packet))
+            self._process_data(bytes(packet))
+
+    def read(self, timeout=1000):
+        if not self.rx_queue:
+            raise TimeoutError()
+        return self.rx_queue.popleft()
+
+    def poll(self):
+        if self.data_phase is None and self.rx_queue:
+            return self.rx_queue.popleft()
+        return None
+
+
+class AsyncVirtualDevice(AsyncDevConnBase):
+    """ Asynchronous wrapper of VirtualDevice, every transferred packet is delayed by specified latency """
+
+    @property
+    def is_opened(self):
+        return self.device.is_opened
+
+    def __init__(self, device=None, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.device = device if device is not None else VirtualDevice()
+        self.latency = latency
+        self.aborted = 0
+
+    async def open(self):
+        self.device.open()
+
+    async def close(self):
+        self.device.close()
+
+    async def abort(self):
+        self.aborted += 1
+        self.device.abort()
+
+    def info(self):
+        return "Async Virtual Device"
+
+    async def read(self, timeout=1000):
+        await asyncio.sleep(self.latency)
+        if not self.device.rx_queue:
+            await asyncio.sleep(timeout / 1000)
+        return self.device.read()
+
+    def poll(self):
+        return self.device.poll()
+
+    async def write(self, packet):
+        await asyncio.sleep(self.latency)
+        self.device.write(packet)
+
+
+@pytest.fixture
+def device():
+    return VirtualDevice()
+
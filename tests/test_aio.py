@@ -0,0 +1,139 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import time
+import asyncio
+import pytest
+from mboot import McuBoot, PropertyTag, StatusCode, ExtMemId, McuBootCommandError, McuBootConnectionError, \
+                  McuBootVerifyError
+from mboot.aio import AsyncMcuBoot
+from conftest import VirtualDevice, AsyncVirtualDevice
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_commands():
+    device = AsyncVirtualDevice()
+
+    async def session():
+        async with AsyncMcuBoot(device) as mb:
+            assert (await mb.get_property(PropertyTag.FLASH_SECTOR_SIZE))[0] == 0x400
+            assert await mb.get_property(PropertyTag.TARGET_VERSION) is None
+            assert mb.status_code == StatusCode.UNKNOWN_PROPERTY
+            assert await mb.write_memory(0x100, bytes(range(200)))
+            assert await mb.read_memory(0x100, 200) == bytes(range(200))
+            assert b''.join([data async for data in mb.iter_read_memory(0x100, 100)]) == bytes(range(100))
+            assert await mb.fill_memory(0x400, 0x10, 0x55AA55AA)
+            assert await mb.flash_erase_region(0, 0x400)
+            assert await mb.read_memory(0x100, 4) == b'\xFF' * 4
+            assert await mb.reset(0)
+
+    run(session())
+    assert device.device.memory[0x400:0x404] == b'\xAA\x55\xAA\x55'
+
+
+
+def test_lists():
+    device = VirtualDevice()
+    device.properties[PropertyTag.RAM_START_ADDRESS] = [0x20000000]
+    device.properties[PropertyTag.RAM_SIZE] = [0x8000]
+    device.ext_memories[ExtMemId.QUAD_SPI0] = [0x1F, 0x60000000, 1024, 0x100, 0x1000, 0x10000]
+
+    async def session():
+        async with AsyncMcuBoot(AsyncVirtualDevice(device)) as mb:
+            return await mb.get_property_list(), await mb.get_memory_list()
+
+    property_list, memory_list = run(session())
+    # the same results as of synchronous version
+    with McuBoot(device) as mb:
+        assert [p.to_str() for p in property_list] == [p.to_str() for p in mb.get_property_list()]
+        assert memory_list == mb.get_memory_list()
+    assert memory_list['external'][0]['sector_size'] == 0x1000
+
+
+def test_read_retry_and_verify():
+    device = AsyncVirtualDevice()
+    data = bytes(range(256)) * 8
+    device.device.memory[0x1000:0x1800] = data
+
+    async def session():
+        async with AsyncMcuBoot(device) as mb:
+            mb.segment_size = 0x400
+            # interrupted segment is resumed from first missing byte
+            device.device.broken_reads = 1
+            assert await mb.read_memory(0x1000, 0x800) == data
+            assert len(device.device.commands) == 3
+            chunks = [chunk async for chunk in mb.iter_read_memory(0x1000, 0x800, chunk=0x300)]
+            assert [len(chunk) for chunk in chunks] == [0x300, 0x300, 0x200]
+            assert await mb.verify_memory(0x1000, data)
+            device.device.memory[0x1410] ^= 0xFF
+            assert not await mb.verify_memory(0x1000, data)
+            assert mb.mismatches == [(0x1410, 0x1411)]
+        async with AsyncMcuBoot(device, True) as mb:
+            with pytest.raises(McuBootVerifyError):
+                await mb.verify_memory(0x1000, data)
+
+    run(session())
+
+
+def test_errors():
+    device = AsyncVirtualDevice()
+
+    async def session():
+        async with AsyncMcuBoot(device, True) as mb:
+            with pytest.raises(McuBootCommandError):
+                await mb.read_memory(0x20000, 10)
+            device.device.fail_after = 64
+            with pytest.raises(McuBootCommandError):
+                await mb.write_memory(0, bytes(1000))
+            assert mb.status_code == StatusCode.FLASH_ALIGNMENT_ERROR
+        await device.open()
+        mb = AsyncMcuBoot(device)
+        with pytest.raises(McuBootConnectionError):
+            await mb._run(mb._read(10))
+        assert mb.status_code == StatusCode.NO_RESPONSE
+
+    run(session())
+
+
+def test_multiple_devices():
+    devices = [AsyncVirtualDevice(latency=0.001) for _ in range(8)]
+
+    async def session(device, n):
+        async with AsyncMcuBoot(device, True) as mb:
+            await mb.write_memory(0x1000, bytes([n]) * 300)
+            return await mb.read_memory(0x1000, 300)
+
+    async def main():
+        return await asyncio.gather(*[session(device, n) for n, device in enumerate(devices)])
+
+    start = time.perf_counter()
+    results = run(main())
+    assert results == [bytes([n]) * 300 for n in range(len(devices))]
+    # the devices are served concurrently (~20 packets with latency 1ms per device)
+    assert time.perf_counter() - start < 0.02 * len(devices)
+
+
+def test_deadline():
+    device = AsyncVirtualDevice(latency=0.005)
+
+    async def session():
+        async with AsyncMcuBoot(device) as mb:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(mb.write_memory(0, bytes(0x1000)), 0.1)
+            assert device.aborted == 1
+            assert device.device.data_phase is None
+            # the connection is usable after cancelled operation
+            assert (await mb.get_property(PropertyTag.CURRENT_VERSION))[0] == 0x4B020100
+
+    run(session())
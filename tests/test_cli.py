@@ -0,0 +1,221 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import pytest
+import bincopy
+from click.testing import CliRunner
+from mboot import CommandTag, PropertyTag
+from mboot import __main__ as cli_main
+from conftest import VirtualDevice
+
+
+@pytest.fixture
+def devices(monkeypatch, tmp_path):
+    devs = [VirtualDevice() for _ in range(3)]
+    monkeypatch.setenv('MBOOT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(cli_main, 'scan_usb', lambda name=None: devs)
+    return devs
+
+
+def invoke(*args):
+    return CliRunner().invoke(cli_main.cli, list(args), obj={})
+
+
+def test_gang_write(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 4)
+    result = invoke('write', '-a', '0x1000', '--all', '-j', '2', str(file))
+    assert result.exit_code == 0
+    assert result.output.count('PASS') == 3
+    for dev in devices:
+        assert dev.memory[0x1000:0x1400] == bytes(range(256)) * 4
+
+
+def test_gang_failure(devices):
+    result = invoke('erase', '-a', '0', '-l', '0x400', '--devices', '0,2')
+    assert result.exit_code == 0 and result.output.count('PASS') == 2
+    result = invoke('erase', '-a', '0x20000', '-l', '0x400', '--all')
+    assert result.exit_code == 1
+    assert result.output.count('FAIL') == 3
+    result = invoke('info', '--devices', '5')
+    assert result.exit_code == 1
+
+
+def test_gang_uart(devices, monkeypatch):
+    ports = []
+
+    def scan_uart(port=None, baudrate=None, cache=None):
+        ports.append((port, baudrate))
+        return devices[:2]
+
+    monkeypatch.setattr(cli_main, 'scan_uart', scan_uart)
+    result = invoke('-u', 'COM3,COM4', '-b', '57600', 'erase', '-a', '0', '-l', '0x400', '--all')
+    assert result.exit_code == 0 and result.output.count('PASS') == 2
+    assert invoke('-u', 'all', 'info', '--devices', '1').exit_code == 0
+    assert ports == [(['COM3', 'COM4'], 57600), (None, None)]
+
+
+def test_sparse_write(devices, tmp_path):
+    image = bincopy.BinFile()
+    image.add_binary(bytes(range(256)), 0x100)
+    image.add_binary(b'\x55' * 0x500, 0x8300)
+    file = tmp_path / 'image.hex'
+    file.write_text(image.as_ihex())
+    del devices[1:]
+    result = invoke('-n', 'write', str(file))
+    assert result.exit_code == 0
+    dev = devices[0]
+    erased = [cmd.params[:2] for cmd in dev.commands if cmd.header.tag == CommandTag.FLASH_ERASE_REGION]
+    written = [cmd.params[:2] for cmd in dev.commands if cmd.header.tag in (CommandTag.WRITE_MEMORY,
+                                                                             CommandTag.FILL_MEMORY)]
+    assert erased == [[0x0, 0x400], [0x8000, 0x800]]
+    assert written == [[0x100, 0x100], [0x8300, 0x500]]
+    assert dev.memory[0x100:0x200] == bytes(range(256))
+    assert dev.memory[0x8300:0x8800] == b'\x55' * 0x500
+    # offset and relocation
+    result = invoke('-n', 'write', '-a', '0x2000', '-o', '0x80', str(file))
+    assert result.exit_code == 0
+    assert dev.memory[0x2000:0x2080] == bytes(range(0x80, 0x100))
+    assert dev.memory[0xA180:0xA680] == b'\x55' * 0x500
+
+
+def test_write_verify(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 4)
+    result = invoke('write', '-a', '0x1000', '-v', '--all', str(file))
+    assert result.exit_code == 0
+    for dev in devices:
+        assert [cmd.params[:2] for cmd in dev.commands if cmd.header.tag == CommandTag.READ_MEMORY] == [[0x1000, 0x400]]
+    # the read-back of second device is interrupted
+    devices[1].broken_reads = 10
+    result = invoke('write', '-a', '0x1000', '-v', '--all', str(file))
+    assert result.exit_code == 1
+    assert result.output.count('PASS') == 2 and result.output.count('FAIL') == 1
+
+
+def test_write_manifest(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 16)
+    del devices[1:]
+    dev = devices[0]
+    dev.properties[PropertyTag.UNIQUE_DEVICE_IDENT] = [0x12345678, 0x9ABCDEF0]
+    dev.properties[PropertyTag.FLASH_PAGE_SIZE] = [0x100]
+
+    def written():
+        addresses = [cmd.params[0] for cmd in dev.commands if cmd.header.tag == CommandTag.WRITE_MEMORY]
+        dev.commands.clear()
+        return addresses
+
+    # without verification are the sector hashes not stored
+    assert invoke('write', '-a', '0x1000', str(file)).exit_code == 0
+    assert invoke('write', '-a', '0x1000', str(file)).exit_code == 0
+    assert written() == [0x1000, 0x1000]
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    assert written() == [0x1000]
+    # only the changed sector is erased and written
+    file.write_bytes(bytes(range(256)) * 8 + b'\x55' * 0x100 + bytes(range(256)) * 7)
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    erased = [cmd.params[:2] for cmd in dev.commands if cmd.header.tag == CommandTag.FLASH_ERASE_REGION]
+    assert erased == [[0x1800, 0x400]]
+    # the run of 0x55 is sent as fill command
+    assert written() == [0x1900]
+    assert dev.memory[0x1800:0x1900] == b'\x55' * 0x100
+    assert invoke('write', '-a', '0x1000', '--force', str(file)).exit_code == 0
+    assert written() == [0x1000, 0x1900]
+    # the erase command drops the manifest
+    assert invoke('erase', '-a', '0x1000', '-l', '0x1000').exit_code == 0
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    assert written() == [0x1000, 0x1900]
+
+
+def test_fill_drops_manifest(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 4)
+    del devices[1:]
+    dev = devices[0]
+    dev.properties[PropertyTag.UNIQUE_DEVICE_IDENT] = [0x12345678, 0x9ABCDEF0]
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    # the memory changed by other command than write is not trusted by next write
+    assert invoke('fill', '0x1000', '0x100').exit_code == 0
+    assert dev.memory[0x1000:0x1100] == b'\xFF' * 0x100
+    assert invoke('write', '-a', '0x1000', '-v', str(file)).exit_code == 0
+    assert dev.memory[0x1000:0x1400] == bytes(range(256)) * 4
+
+
+def test_mapped_input(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 4)
+    sb_file = tmp_path / 'image.sb'
+    sb_file.write_bytes(bytes(1000))
+    del devices[1:]
+    dev = devices[0]
+    assert invoke('-n', 'write', '-a', '0x2000', '-o', '0x80', str(file)).exit_code == 0
+    assert dev.memory[0x2000:0x2380] == (bytes(range(256)) * 4)[0x80:]
+    assert dev.memory[0x2380] == 0xFF
+    dev.packets.clear()
+    assert invoke('-n', 'sbfile', str(sb_file)).exit_code == 0
+    assert sum(dev.packets) == 1000
+
+
+def test_image_cache(devices, monkeypatch, tmp_path):
+    image = bincopy.BinFile()
+    image.add_binary(bytes(range(256)) * 8, 0x1000)
+    file = tmp_path / 'image.srec'
+    file.write_text(image.as_srec())
+    del devices[1:]
+    assert invoke('write', '-v', str(file)).exit_code == 0
+    # the second run uses the compiled image and precomputed sector hashes
+    monkeypatch.setattr(cli_main, 'load_image', None)
+    monkeypatch.setattr(cli_main, 'get_sector_hashes', None)
+    devices[0].memory[:] = bytes([0xFF] * len(devices[0].memory))
+    assert invoke('write', '--force', str(file)).exit_code == 0
+    assert devices[0].memory[0x1000:0x1800] == bytes(range(256)) * 8
+
+
+def test_flash_plan(devices, tmp_path):
+    file = tmp_path / 'image.bin'
+    file.write_bytes(bytes(range(256)) * 4 + b'\x00' * 0x400)
+    plan = tmp_path / 'image.mbp'
+    result = invoke('compile', '-a', '0x1000', '-m', '0,0x10000,0x400,0x100', str(file), str(plan))
+    assert result.exit_code == 0
+    result = invoke('flash', '-c', str(plan))
+    assert result.exit_code == 0 and 'FILL' in result.output
+    # the plan is executed without parsing of image and planning of erase
+    devices[0].memory[0x1000:0x1400] = bytes(0x400)
+    assert invoke('flash', '-v', '--all', str(plan)).exit_code == 0
+    for dev in devices:
+        assert dev.memory[0x1000:0x1800] == bytes(range(256)) * 4 + b'\x00' * 0x400
+        assert not any(cmd.header.tag == CommandTag.GET_PROPERTY and cmd.params[0] == PropertyTag.FLASH_SECTOR_SIZE
+                       for cmd in dev.commands)
+
+
+def test_read_failure(devices, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli_main, 'scan_usb', lambda name=None: devices[:1])
+    file = tmp_path / 'dump.bin'
+    file.write_bytes(b'previous')
+    devices[0].memory[:0x800] = bytes(range(256)) * 8
+    assert invoke('read', '-f', str(file), '0', '0x800').exit_code == 0
+    assert file.read_bytes() == devices[0].memory[:0x800]
+    # the rejected read keeps output file untouched
+    assert invoke('read', '-f', str(file), '0x20000', '0x100').exit_code == 1
+    assert file.read_bytes() == devices[0].memory[:0x800]
+    # the incomplete read is reported by exit code
+    devices[0].broken_reads = 10
+    assert invoke('read', '-f', str(tmp_path / 'part.bin'), '0', '0x800').exit_code == 1
+
+
+def test_info_skipped_requests(devices, monkeypatch):
+    monkeypatch.setattr(cli_main, 'scan_usb', lambda name=None: devices[:1])
+    skipped = []
+    for version in (0x4B020100, 0x4B010100):
+        devices[0].properties[PropertyTag.CURRENT_VERSION] = [version]
+        result = invoke('info')
+        assert result.exit_code == 0
+        skipped.append(int(result.output.split('Skipped Requests:')[1]))
+    # the version 1.1.0 doesn't support further six properties (QSPI_INIT_STATUS and five of version 2.0.0)
+    assert skipped[1] - skipped[0] == 6
@@ -0,0 +1,534 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import io
+import os
+import mmap
+import time
+import tracemalloc
+import pytest
+from mboot import McuBoot, CommandTag, StatusCode, PropertyTag, ExtMemId, McuBootCommandError, McuBootConnectionError, \
+                  McuBootVerifyError
+from mboot.cache import ProfileCache, ImageCache, ManifestCache
+from mboot.image import Image, Segment
+from mboot.erase import ErasePlanner
+from mboot.plan import OperationPlan, split_blank, split_fill, get_sector_hashes
+from mboot.bundle import FlashBundle
+from mboot.mcuboot import iter_data_packets, get_data_length, get_diff_ranges
+
+
+def test_data_packets():
+    data = bytes(range(100))
+    packets = list(iter_data_packets(data, 32))
+    assert [len(p) for p in packets] == [32, 32, 32, 4]
+    assert b''.join(packets) == data
+    assert b''.join(iter_data_packets(io.BytesIO(data), 32)) == data
+    assert b''.join(iter_data_packets([data[:10], data[10:50], data[50:]], 32)) == data
+    assert get_data_length(data) == 100
+    assert get_data_length(io.BytesIO(data)) == 100
+    assert get_data_length([data[:10], data[10:]]) == 100
+    assert get_data_length(iter([data])) is None
+
+
+def test_write_memory(device):
+    data = bytes(range(256)) * 4
+    with McuBoot(device) as mb:
+        assert mb.write_memory(0x100, data)
+        assert mb.max_packet_size == 32
+    assert device.memory[0x100: 0x100 + len(data)] == data
+    assert device.packets == [32] * (len(data) // 32)
+
+
+def test_write_memory_mmap(device, tmp_path):
+    data = bytes(range(256)) * 4
+    file = tmp_path / 'image.bin'
+    file.write_bytes(data)
+    with open(str(file), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert get_data_length(mm) == len(data)
+        view = memoryview(mm)
+        with McuBoot(device) as mb:
+            assert mb.write_memory(0x100, mm)
+            assert mb.write_memory(0x1000, view[0x80:])
+        view.release()
+    assert device.memory[0x100: 0x100 + len(data)] == data
+    assert device.memory[0x1000: 0x1000 + len(data) - 0x80] == data[0x80:]
+
+
+def test_write_memory_stream(device):
+    data = bytes(range(200))
+    progress = []
+    with McuBoot(device) as mb:
+        assert mb.write_memory(0, io.BytesIO(data), progress=lambda n, t: progress.append((n, t)))
+        assert mb.write_memory(0x200, (data[i: i + 7] for i in range(0, len(data), 7)), length=len(data))
+        with pytest.raises(ValueError):
+            mb.write_memory(0, iter([data]))
+    assert device.memory[0: len(data)] == data
+    assert device.memory[0x200: 0x200 + len(data)] == data
+    assert progress[-1] == (200, 200)
+
+
+def test_write_memory_early_error(device):
+    device.fail_after = 64
+    with McuBoot(device) as mb:
+        assert not mb.write_memory(0, bytes(1024))
+        assert mb.status_code == StatusCode.FLASH_ALIGNMENT_ERROR
+    assert sum(device.packets) == 64
+    device.fail_after = 64
+    with McuBoot(device, True) as mb:
+        with pytest.raises(McuBootCommandError):
+            mb.receive_sb_file(bytes(1024))
+
+
+def test_write_memory_poll_interval(device):
+    polls = []
+    poll = device.poll
+    device.poll = lambda: polls.append(1) or poll()
+    with McuBoot(device) as mb:
+        # the early response is checked after every packet except the last one
+        assert mb.write_memory(0, bytes(1024))
+        assert len(polls) == 1024 // 32 - 1
+        # the expensive poll is called after the first packet and then once per interval
+        polls.clear()
+        device.poll_interval = 60
+        assert mb.write_memory(0, bytes(1024))
+        assert len(polls) == 1
+        device.fail_after = 64
+        assert not mb.write_memory(0, bytes(1024))
+        assert mb.status_code == StatusCode.FLASH_ALIGNMENT_ERROR
+
+
+def test_drop_manifest(device, tmp_path):
+    device.properties[PropertyTag.UNIQUE_DEVICE_IDENT] = [0x12345678]
+    manifests = ManifestCache(str(tmp_path))
+    manifests.save('12345678', {(0, 0): 'hash'})
+    with McuBoot(device, manifests=manifests) as mb:
+        assert mb.read_memory(0, 4)
+        assert manifests.load('12345678')
+        # the manifest is dropped before the first change of memory
+        assert mb.fill_memory(0, 4)
+        assert manifests.load('12345678') == {}
+
+
+def test_read_memory(device):
+    device.memory[0x100: 0x200] = bytes(range(256))
+    with McuBoot(device) as mb:
+        assert mb.read_memory(0x100, 256) == bytes(range(256))
+        assert mb.read_memory(0x100, 10) == bytes(range(10))
+        assert mb.read_memory(0x20000, 10) is None
+
+
+def test_read_memory_into(device):
+    device.memory[0x100: 0x200] = bytes(range(256))
+    buffer = bytearray(300)
+    with McuBoot(device) as mb:
+        assert mb.read_memory_into(0x100, memoryview(buffer)[10: 110]) == 100
+        assert mb.read_memory_into(0x20000, buffer) is None
+    assert buffer[10: 110] == bytes(range(100))
+    assert buffer[:10] == bytes(10)
+
+
+def test_iter_read_memory(device):
+    device.memory[0: 0x1000] = bytes(range(256)) * 16
+    with McuBoot(device) as mb:
+        chunks = list(mb.iter_read_memory(0x10, 1000, chunk=100))
+        with pytest.raises(McuBootCommandError):
+            list(mb.iter_read_memory(0x20000, 10))
+        assert mb.status_code == StatusCode.MEMORY_RANGE_INVALID
+    assert [len(c) for c in chunks] == [100] * 10
+    assert b''.join(chunks) == device.memory[0x10: 0x10 + 1000]
+
+
+def test_read_memory_segments(device):
+    device.memory[:] = bytes(range(256)) * (len(device.memory) // 256)
+    with McuBoot(device) as mb:
+        mb.segment_size = 0x1000
+        assert mb.read_memory(0x100, 0x3000) == device.memory[0x100: 0x3100]
+        assert len(device.commands) == 3
+        # interrupted segments are resumed from first missing byte
+        device.broken_reads = 2
+        assert mb.read_memory(0, 0x2000) == device.memory[:0x2000]
+        assert len(device.commands) == 7
+        # the count of retries is limited
+        device.broken_reads = 10
+        buffer = bytearray(0x2000)
+        received = mb.read_memory_into(0, buffer)
+        assert 0 < received < 0x1000
+        assert buffer[:received] == device.memory[:received]
+        # iterator
+        device.broken_reads = 1
+        chunks = list(mb.iter_read_memory(0, 0x2000, chunk=0x300))
+        assert b''.join(chunks) == device.memory[:0x2000]
+        # the incomplete data are reported by iterator even without cmd_exception
+        device.broken_reads = 10
+        chunks = []
+        with pytest.raises(McuBootConnectionError):
+            for chunk in mb.iter_read_memory(0, 0x2000, chunk=0x300):
+                chunks.append(chunk)
+        assert 0 < len(b''.join(chunks)) < 0x1000
+    with McuBoot(device, True) as mb:
+        device.broken_reads = 10
+        with pytest.raises(McuBootConnectionError):
+            mb.read_memory(0, 0x1000)
+
+
+def test_verify_memory(device):
+    data = bytes(range(256)) * 32
+    device.memory[0x1000: 0x3000] = data
+    assert get_diff_ranges(0x100, b'\x00\x01\x02\x03', b'\x00\xAA\xAA\x03') == [(0x101, 0x103)]
+    with McuBoot(device) as mb:
+        assert mb.verify_memory(0x1000, data)
+        assert mb.mismatches == []
+        device.memory[0x2010: 0x2014] = bytes(4)
+        device.memory[0x2100] = 0xAA
+        device.commands.clear()
+        assert not mb.verify_memory(0x1000, data, chunk=0x400)
+        assert mb.status_code == StatusCode.FAIL
+        assert mb.mismatches == [(0x2010, 0x2014), (0x2100, 0x2101)]
+        # the read-back stops at first different chunk
+        assert len(device.commands) == 1
+        # unreadable memory
+        assert not mb.verify_memory(0xFF00, bytes(0x200))
+    with McuBoot(device, True) as mb:
+        with pytest.raises(McuBootVerifyError) as exc:
+            mb.verify_memory(0x1000, data)
+        assert '0x00002010 - 0x00002014' in str(exc.value)
+
+
+def test_property_cache(device):
+    with McuBoot(device, cache_properties=True) as mb:
+        assert mb.get_property(PropertyTag.FLASH_SECTOR_SIZE)[0] == 0x400
+        assert mb.get_property(PropertyTag.FLASH_SECTOR_SIZE)[0] == 0x400
+        assert mb.get_property(PropertyTag.FLASH_SECTOR_SIZE, 1)[0] == 0x400
+        assert mb.get_property(PropertyTag.CURRENT_VERSION, 1)[0] == 0x4B020100
+        assert mb.get_property(PropertyTag.CURRENT_VERSION)[0] == 0x4B020100
+        # unsupported properties are remembered
+        assert mb.get_property(PropertyTag.TARGET_VERSION) is None
+        assert mb.get_property(PropertyTag.TARGET_VERSION) is None
+        assert mb.status_code == StatusCode.UNKNOWN_PROPERTY
+        # dynamic properties are never cached
+        assert mb.get_property(PropertyTag.LAST_ERROR) is None
+        assert mb.get_property(PropertyTag.LAST_ERROR) is None
+        assert (mb.cache_hits, mb.cache_misses, mb.skipped_requests) == (2, 4, 2)
+        assert len(device.commands) == 5
+        # invalidation
+        mb.set_property(PropertyTag.VERIFY_WRITES, 1)
+        assert mb.get_property(PropertyTag.FLASH_SECTOR_SIZE)[0] == 0x400
+        assert mb.cache_misses == 5
+
+
+def test_property_list(device, tmp_path):
+    with McuBoot(device) as mb:
+        full_list = mb.get_property_list()
+    # PFR_KEYSTORE_UPDATE_OPT is not supported by version 2.1.0
+    requests = len(device.commands)
+    assert requests == len(PropertyTag) - 1
+
+    # the properties which are not supported by bootloader version are skipped
+    device.commands.clear()
+    device.properties[PropertyTag.CURRENT_VERSION] = [0x4B010100]
+    with McuBoot(device) as mb:
+        assert len(mb.get_property_list()) == len(full_list)
+        assert mb.skipped_requests == 7
+    assert len(device.commands) == requests - 6
+
+    # unsupported properties are stored into profile
+    profiles = ProfileCache(str(tmp_path))
+    device.properties[PropertyTag.UNIQUE_DEVICE_IDENT] = [0x12345678, 0x9ABCDEF0]
+    device.commands.clear()
+    with McuBoot(device, cache_properties=True) as mb:
+        mb.get_property_list()
+        assert mb.save_profile(profiles)
+    requests = len(device.commands)
+    device.commands.clear()
+    with McuBoot(device) as mb:
+        assert mb.load_profile(profiles)
+        assert len(mb.get_property_list()) == len(full_list) + 1
+    assert len(device.commands) < requests
+
+
+def test_device_profile(device, tmp_path):
+    profiles = ProfileCache(str(tmp_path))
+    device.properties[PropertyTag.UNIQUE_DEVICE_IDENT] = [0x12345678, 0x9ABCDEF0]
+    device.ext_memories[ExtMemId.FLEX_SPI_NOR] = [0x1F, 0x60000000, 0x2000, 0x100, 0x1000, 0x10000]
+    with McuBoot(device) as mb:
+        assert not mb.load_profile(profiles)
+        memory_list = mb.get_memory_list()
+        assert mb.save_profile(profiles)
+    discovery = len(device.commands)
+
+    device.commands.clear()
+    with McuBoot(device) as mb:
+        assert mb.load_profile(profiles)
+        assert mb.get_memory_list() == memory_list
+    # identification (version, uid) and attributes of configurable external memory
+    assert len(device.commands) == 3 < discovery
+
+    device.properties[PropertyTag.CURRENT_VERSION] = [0x4B020200]
+    with McuBoot(device) as mb:
+        assert not mb.load_profile(profiles)
+
+
+def test_image():
+    image = Image()
+    image.add(0x10, b'\x01' * 0x10)
+    image.add(0x30, b'\x02' * 0x10)
+    image.add(0x20, b'\x03' * 0x10)
+    assert image.segments == [Segment(0x10, bytearray(b'\x01' * 0x10 + b'\x03' * 0x10 + b'\x02' * 0x10))]
+    image.add(0x08, b'\x04' * 0x10)
+    assert image.segments[0].address == 0x08 and image.size == 0x38
+    image.remove(0x20, 0x10)
+    assert [(s.address, s.end) for s in image] == [(0x08, 0x20), (0x30, 0x40)]
+    image.remove(0x00, 0x40)
+    assert not image
+    # the data are not copied
+    data = bytearray(0x100)
+    image.add(0x100, data, copy=False)
+    data[0] = 0x55
+    assert image.segments[0].data[0] == 0x55
+    image.remove(0x100, 0x10)
+    assert image.segments[0].data.obj is data
+
+
+def test_plan(device):
+    device.properties[PropertyTag.FLASH_PAGE_SIZE] = [0x100]
+    with McuBoot(device) as mb:
+        plan = mb.plan()
+        for address in range(0x1000, 0x2000, 0x400):
+            plan.erase(address, 0x400)
+        for address in range(0x1000, 0x1800, 0x10):
+            plan.write(address, bytes([address & 0xFF] * 0x10))
+        # overwritten by later write
+        plan.write(0x1100, b'\x55' * 0x100)
+        # dropped by later erase
+        plan.write(0x4000, b'\x66' * 0x100)
+        plan.erase(0x4000, 0x400)
+        plan.fill(0x3000, 0x100, 0x12345678)
+        plan.verify()
+        device.commands.clear()
+        assert plan.execute()
+        assert plan.requests == 136
+    assert [cmd.header.tag for cmd in device.commands if cmd.header.tag != CommandTag.GET_PROPERTY] == [
+        CommandTag.FLASH_ERASE_REGION, CommandTag.FLASH_ERASE_REGION,
+        CommandTag.WRITE_MEMORY, CommandTag.FILL_MEMORY, CommandTag.WRITE_MEMORY, CommandTag.FILL_MEMORY,
+        CommandTag.READ_MEMORY, CommandTag.READ_MEMORY]
+    assert device.memory[0x1100:0x1200] == b'\x55' * 0x100
+    assert device.memory[0x3000:0x3008] == bytes.fromhex('7856341278563412')
+    assert device.memory[0x4000:0x4400] == b'\xFF' * 0x400
+
+
+def test_plan_alignment(device):
+    with McuBoot(device) as mb:
+        plan = mb.plan().erase(0x1000, 0x400).erase(0x1400, 0x100)
+        with pytest.raises(ValueError):
+            plan.execute()
+    assert all(cmd.header.tag == CommandTag.GET_PROPERTY for cmd in device.commands)
+
+
+def test_erase_planner():
+    memory_list = {
+        'internal_flash': {0: {'address': 0, 'size': 0x10000, 'sector_size': 0x400},
+                           1: {'address': 0x10000, 'size': 0x10000, 'sector_size': 0x1000}},
+        'internal_ram': {0: {'address': 0x20000000, 'size': 0x8000}},
+        'external': [{'mem_id': ExtMemId.QUAD_SPI0, 'address': 0x60000000, 'size': 0x100000, 'sector_size': 0x1000}]
+    }
+    planner = ErasePlanner(memory_list, [(0x20000, 0x20800)])
+    assert planner.align(0xFF00, 0x10100) == (0xFC00, 0x11000)
+    ranges = [(0x100, 0x200), (0x300, 0x500), (0xFF00, 0x10100), (0x20000000, 0x20000100)]
+    assert planner.plan(ranges, align=True) == [('erase', 0, 0x800, 0), ('erase', 0xFC00, 0x1400, 0)]
+    assert planner.plan([(0x60000100, 0x60000200)], ExtMemId.QUAD_SPI0, True) == \
+        [('erase', 0x60000000, 0x1000, ExtMemId.QUAD_SPI0)]
+    # complete flash is erased by one command
+    assert planner.plan([(0, 0x8000), (0x8000, 0x20000)]) == [('erase_all', 0)]
+    assert planner.plan([(0, 0x8000), (0x9000, 0x20000)]) == [('erase', 0, 0x8000, 0), ('erase', 0x9000, 0x17000, 0)]
+    # most of every flash region is erased by one command if allowed
+    planner.erase_all_threshold = 0.9
+    assert planner.plan([(0, 0x8000), (0x9000, 0x20000)]) == [('erase_all', 0)]
+    assert planner.plan([(0, 0x10000), (0x11000, 0x12000)]) == [('erase', 0, 0x10000, 0), ('erase', 0x11000, 0x1000, 0)]
+    with pytest.raises(ValueError):
+        planner.plan([(0x100, 0x400)])
+    with pytest.raises(ValueError):
+        planner.plan([(0x20000, 0x20400)])
+    # the reserved region inside flash is never erased by erase all
+    planner = ErasePlanner(memory_list, [(0x1F000, 0x20000)], erase_all_threshold=0.9)
+    assert planner.plan([(0, 0x1F000)]) == [('erase', 0, 0x1F000, 0)]
+
+
+def test_plan_reserved(device):
+    device.properties[PropertyTag.RESERVED_REGIONS] = [0xF000, 0xFFFF, 0, 0]
+    device.properties[PropertyTag.RAM_START_ADDRESS] = [0x20000000]
+    device.properties[PropertyTag.RAM_SIZE] = [0x8000]
+    with McuBoot(device) as mb:
+        plan = mb.plan().erase(0xE000, 0x1400).erase(0x20000000, 0x100)
+        with pytest.raises(ValueError):
+            plan.optimize()
+        plan = mb.plan().erase(0x100, 0x100, align=True).erase(0x20000000, 0x100)
+        assert plan.optimize() == [('erase', 0, 0x400, 0)]
+
+
+def test_split_blank():
+    data = b'\xFF' * 0x80 + b'\x01' * 0x100 + b'\xFF' * 0x200 + b'\x02' + b'\xFF' * 0x7F
+    parts = split_blank(0x1080, data, 0x100, lambda start, end: True)
+    assert [(address, bytes(part)) for address, part in parts] == [
+        (0x1100, b'\x01' * 0x100), (0x1400, b'\x02' + b'\xFF' * 0x7F)]
+    # the pages outside erased regions are not skipped
+    parts = split_blank(0x1080, data, 0x100, lambda start, end: start >= 0x1200)
+    assert [(address, len(part)) for address, part in parts] == [(0x1080, 0x180), (0x1400, 0x80)]
+
+
+def test_plan_blank(device):
+    device.properties[PropertyTag.FLASH_PAGE_SIZE] = [0x100]
+    device.memory[0x1400] = 0
+    data = bytes(range(256)) + b'\xFF' * 0x200 + bytes(range(256)) + b'\xFF' * 0x400
+    with McuBoot(device) as mb:
+        plan = mb.plan().erase(0x1000, 0x800, align=True).write(0x1000, data)
+        plan.skip_blank().blank_check().verify()
+        device.commands.clear()
+        assert plan.execute()
+    erased = [cmd.params[:2] for cmd in device.commands if cmd.header.tag == CommandTag.FLASH_ERASE_REGION]
+    written = [cmd.params[:2] for cmd in device.commands if cmd.header.tag == CommandTag.WRITE_MEMORY]
+    assert erased == [[0x1400, 0x400]]
+    assert written == [[0x1000, 0x100], [0x1300, 0x100]]
+    assert device.memory[0x1000:0x1800] == data
+
+
+def test_split_fill():
+    data = b'\x01\x02' + bytes(0x100) + bytes(range(14)) + b'\x12\x34\x56\x78' * 0x10
+    parts = split_fill(0x1000, data, 0x40)
+    assert [(address, len(part), pattern) for address, part, pattern in parts] == [
+        (0x1000, 0x4, None), (0x1004, 0xFC, 0), (0x1100, 0x10, None), (0x1110, 0x40, 0x78563412)]
+    assert b''.join(bytes(part) for _, part, _ in parts) == data
+    assert len(split_fill(0x1000, data, 0x200)) == 1
+    assert len(split_fill(0x1000, data, 0)) == 1
+    # the runs are aligned to program unit of flash
+    parts = split_fill(0x1008, data, 0x40, 0x10)
+    assert [(address, len(part), pattern) for address, part, pattern in parts] == [
+        (0x1008, 0x8, None), (0x1010, 0xF0, 0), (0x1100, 0x58, None)]
+
+
+def test_plan_fill_runs(device):
+    data = bytes(range(256)) + bytes(0x400) + bytes(range(256))
+    with McuBoot(device) as mb:
+        # the page size of flash is not known
+        assert mb.plan().write(0x3000, data).fill_runs(0x100).execute()
+        device.properties[PropertyTag.FLASH_PAGE_SIZE] = [0x200]
+        assert mb.plan().write(0x1000, data).fill_runs(0x100).execute()
+        assert mb.plan().write(0x2000, data).fill_runs(0).execute()
+    commands = [(cmd.header.tag, cmd.params[0]) for cmd in device.commands if cmd.header.tag != CommandTag.GET_PROPERTY]
+    assert commands == [
+        (CommandTag.WRITE_MEMORY, 0x3000),
+        (CommandTag.WRITE_MEMORY, 0x1000), (CommandTag.FILL_MEMORY, 0x1200), (CommandTag.WRITE_MEMORY, 0x1400),
+        (CommandTag.WRITE_MEMORY, 0x2000)]
+    assert device.memory[0x1000:0x1600] == data
+    assert device.memory[0x2000:0x2600] == data
+    assert device.memory[0x3000:0x3600] == data
+
+
+def test_write_image(device):
+    image = Image()
+    image.add(0x1000, bytes(range(256)))
+    image.add(0x1200, bytes(range(256)))
+    image.add(0x1300, bytes(range(256)) * 2)
+    with McuBoot(device) as mb:
+        plan = mb.plan()
+        hashes = get_sector_hashes(image, plan.planner)
+        assert sorted(hashes) == [0x1000, 0x1400]
+        # the segments sharing one sector are erased before writing
+        assert plan.write_image(image).execute()
+        assert device.memory[0x1000:0x1100] == device.memory[0x1200:0x1300] == bytes(range(256))
+        image.add(0x1400, b'\xAA')
+        assert get_sector_hashes(image, plan.planner)[0x1000] == hashes[0x1000]
+        assert get_sector_hashes(image, plan.planner)[0x1400] != hashes[0x1400]
+        device.commands.clear()
+        assert mb.plan().write_image(image, skip_sectors={0x1000}).execute()
+    assert [cmd.params[:2] for cmd in device.commands if cmd.header.tag == CommandTag.FLASH_ERASE_REGION] == [
+        [0x1400, 0x400]]
+
+
+def test_write_image_scaling():
+    # the planning of large image is linear, the sector parts are not merged into new buffer
+    planner = ErasePlanner({'internal_flash': {0: {'address': 0, 'size': 0x4000000, 'sector_size': 0x1000}}})
+    image = Image()
+    image.add(0, bytes(range(256)) * 0x10000, copy=False)
+    start = time.perf_counter()
+    plan = OperationPlan(None, planner).write_image(image).fill_runs(0)
+    commands = plan.optimize()
+    assert time.perf_counter() - start < 1.0
+    assert [cmd[0] for cmd in commands] == ['erase', 'write'] and len(commands[1][2]) == 0x1000000
+
+
+def test_write_image_no_copy():
+    planner = ErasePlanner({'internal_flash': {0: {'address': 0, 'size': 0x1000000, 'sector_size': 0x1000}}})
+    data = bytes(range(256)) * 0x1000
+    image = Image()
+    image.add(0x1000, data, copy=False)
+    image.add(0x200000, data, copy=False)
+    tracemalloc.start()
+    try:
+        commands = OperationPlan(None, planner).write_image(image, skip_sectors={0x2000}).fill_runs(0).optimize()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < len(data) // 2
+    writes = [cmd for cmd in commands if cmd[0] == 'write']
+    assert [(cmd[1], len(cmd[2])) for cmd in writes] == [(0x1000, 0x1000), (0x3000, 0xFE000), (0x200000, 0x100000)]
+    # the written data are slices of image data
+    assert all(isinstance(cmd[2], memoryview) and cmd[2].obj is data for cmd in writes)
+
+
+def test_image_cache(tmp_path):
+    image = Image()
+    image.add(0x100, bytes(range(256)))
+    image.add(0x8000, b'\x55' * 0x1000)
+    cache = ImageCache(str(tmp_path), max_size=0x2000)
+    assert cache.load('A') is None
+    cache.save('A', image, {'value': 1})
+    loaded, meta = cache.load('A')
+    assert loaded.segments == image.segments and meta == {'value': 1}
+    cache.save_meta('A', {'value': 2})
+    assert cache.load('A')[1] == {'value': 2}
+    # the least recently used image is evicted
+    cache.save('B', image)
+    assert cache.load('A') is None and cache.load('B') is not None
+    # the just saved image is never evicted, the image larger than cache is not saved
+    os.utime(cache._file_path('B', '.json'), (time.time() + 10, time.time() + 10))
+    cache.save('C', image)
+    assert cache.load('B') is None and cache.load('C') is not None
+    large = Image()
+    large.add(0, bytes(0x2001))
+    assert not cache.save('D', large)
+    assert cache.load('D') is None and cache.load('C') is not None
+    cache.max_age = -1
+    cache.evict()
+    assert cache.load('C') is None
+
+
+def test_flash_bundle(device, tmp_path):
+    image = Image()
+    image.add(0x1000, bytes(range(256)) * 2)
+    image.add(0x2000, b'\x55' * 0x400)
+    planner = ErasePlanner({'internal_flash': {0: {'address': 0, 'size': 0x10000, 'sector_size': 0x400}}},
+                           page_size=0x100)
+    bundle = FlashBundle.compile(image, planner)
+    assert [cmd[0] for cmd in bundle.commands] == ['erase', 'erase', 'write', 'fill']
+    file = tmp_path / 'image.mbp'
+    bundle.save(str(file))
+    loaded = FlashBundle.load(str(file))
+    loaded.validate()
+    assert loaded.size == 0x200 and loaded.digests == bundle.digests
+    with McuBoot(device) as mb:
+        assert loaded.execute(mb, verify=True)
+    assert device.memory[0x1000:0x1200] == bytes(range(256)) * 2
+    assert device.memory[0x2000:0x2400] == b'\x55' * 0x400
+    # the corrupted data are detected by offline validation
+    data = bytearray(file.read_bytes())
+    data[-1] ^= 1
+    file.write_bytes(data)
+    with pytest.raises(ValueError):
+        FlashBundle.load(str(file)).validate()
+    file.write_bytes(data[:-1])
+    with pytest.raises(ValueError):
+        FlashBundle.load(str(file))
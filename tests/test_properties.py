@@ -9,7 +9,7 @@ import pytest
 from mboot.properties import Version, BoolValue, EnumValue, IntValue, VersionValue, ReservedRegionsValue, \
                              AvailableCommandsValue, AvailablePeripheralsValue, ExternalMemoryAttributesValue, \
                              DeviceUidValue, FlashReadMargin, IrqNotifierPinValue, PfrKeystoreUpdateOpt, \
-                             parse_property_value, PropertyTag
+                             parse_property_value, PropertyTag, PROPERTIES_VERSION
 
 
 def test_version_class():
@@ -94,3 +94,10 @@ def test_device_uid_value():
 
 def test_reserved_regions_value():
     pass
+
+
+def test_properties_version():
+    assert sorted(PROPERTIES_VERSION) == sorted(tag for _, tag, _ in PropertyTag)
+    assert PROPERTIES_VERSION[PropertyTag.UNIQUE_DEVICE_IDENT] == Version('1.0.0')
+    assert PROPERTIES_VERSION[PropertyTag.QSPI_INIT_STATUS] == Version('1.2.0')
+    assert PROPERTIES_VERSION[PropertyTag.PFR_KEYSTORE_UPDATE_OPT] == Version('3.0.0')
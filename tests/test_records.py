@@ -0,0 +1,66 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import io
+import pytest
+import bincopy
+from mboot.records import IHexWriter, SRecWriter, parse_ihex, parse_srec
+
+
+@pytest.mark.parametrize('address, length', [(0, 100), (0x10, 40), (0xFFF0, 40), (0x2000FFE0, 0x20100)])
+def test_ihex_writer(address, length):
+    data = bytes(i & 0xFF for i in range(length))
+    ref = bincopy.BinFile()
+    ref.add_binary(data, address)
+    stream = io.StringIO()
+    writer = IHexWriter(stream, address)
+    for offset in range(0, length, 7):
+        writer.write(data[offset: offset + 7])
+    writer.finish()
+    assert stream.getvalue() == ref.as_ihex()
+
+
+@pytest.mark.parametrize('address, length', [(0, 100), (0x10, 40), (0x2000FFE0, 0x20100)])
+def test_srec_writer(address, length):
+    data = bytes(i & 0xFF for i in range(length))
+    ref = bincopy.BinFile()
+    ref.add_binary(data, address)
+    ref.header = 'mboot'
+    stream = io.StringIO()
+    writer = SRecWriter(stream, address)
+    for offset in range(0, length, 100):
+        writer.write(data[offset: offset + 100])
+    writer.finish()
+    assert stream.getvalue() == ref.as_srec()
+
+
+def get_sparse_file():
+    ref = bincopy.BinFile()
+    ref.add_binary(bytes(range(256)) * 3, 0x100)
+    ref.add_binary(bytes(range(100)), 0x1000)
+    ref.add_binary(bytes(range(256)) * 0x200, 0x2000FFE0)
+    return ref
+
+
+@pytest.mark.parametrize('parse, fmt', [(parse_ihex, 'as_ihex'), (parse_srec, 'as_srec')])
+def test_parser(parse, fmt):
+    ref = get_sparse_file()
+    image = parse(io.StringIO(getattr(ref, fmt)()), batch=100)
+    assert [(s.address, bytes(s.data)) for s in image] == [(s.address, bytes(s.data)) for s in ref.segments]
+
+
+def test_parser_errors():
+    lines = get_sparse_file().as_ihex().splitlines()
+    with pytest.raises(ValueError, match='checksum of record 3'):
+        parse_ihex(lines[:2] + [lines[2][:-2] + '00'] + lines[3:])
+    with pytest.raises(ValueError, match='record 2'):
+        parse_ihex(lines[:1] + ['0' + lines[1][1:]])
+    with pytest.raises(ValueError):
+        parse_ihex([':10010000XX'])
+    lines = get_sparse_file().as_srec().splitlines()
+    with pytest.raises(ValueError, match='checksum of record 2'):
+        parse_srec(lines[:1] + [lines[1][:-2] + '00'])
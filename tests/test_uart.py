@@ -0,0 +1,292 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import os
+import time
+import asyncio
+import pytest
+import select
+import threading
+from collections import deque
+from struct import pack, unpack_from
+from mboot import McuBoot, AsyncMcuBoot, PropertyTag, McuBootConnectionError
+from mboot.cache import BaudrateCache
+from mboot.commands import CmdPacket, CommandTag, PacketHeader
+from mboot.connection.uart import FPT, UartPacket, UartParser, Uart, AsyncUart, Crc16, crc16, crc16_table, \
+                                scan_uart, BAUDRATES
+from conftest import VirtualDevice
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+# the UART tests with target are running over pseudo-terminal
+pty = pytest.mark.skipif(termios is None, reason="pseudo-terminal is not supported")
+
+
+class UartTarget(threading.Thread):
+    """ Target side of UART framing protocol over pseudo-terminal, the packets are processed by VirtualDevice """
+
+    def __init__(self, device=None, naks=0, corrupt=0, baudrate=None, autobaud=False):
+        """
+        :param device: The VirtualDevice object
+        :param naks: Count of received command and data packets rejected by NAK
+        :param corrupt: Count of sent packets with corrupted CRC
+        :param baudrate: The only baud rate of host port with response to ping (default: any)
+        :param autobaud: True for locking the baud rate on the first ping like the bootloader after reset
+        """
+        super().__init__(daemon=True)
+        self.device = device if device is not None else VirtualDevice()
+        self.device.open()
+        self.naks = naks
+        self.corrupt = corrupt
+        self.baudrate = baudrate
+        self.autobaud = autobaud
+        self.pings = 0
+        self._master, self._slave = os.openpty()
+        self.port = os.ttyname(self._slave)
+        self._parser = UartParser()
+        self._outgoing = deque()
+        self._last = None
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _send_next(self):
+        self._last = self._outgoing.popleft() if self._outgoing else None
+        if self._last is not None:
+            frame = bytearray(self._last)
+            if self.corrupt:
+                self.corrupt -= 1
+                frame[-1] ^= 0xFF
+            os.write(self._master, frame)
+
+    def _process(self, packet):
+        if packet is None:
+            os.write(self._master, UartPacket(FPT.NAK).to_bytes())
+        elif packet.fp_type == FPT.PING:
+            self.pings += 1
+            speed = termios.tcgetattr(self._slave)[5]
+            if self.autobaud and self.baudrate is None:
+                self.baudrate = next(value for value in BAUDRATES if getattr(termios, f'B{value}') == speed)
+            if self.baudrate is not None and speed != getattr(termios, f'B{self.baudrate}'):
+                return
+            frame = pack('<2BI2H', UartPacket.START_BYTE, FPT.RESP, 0x50010200, 0, 0)
+            os.write(self._master, frame[:8] + pack('<H', crc16(frame[:8])))
+        elif packet.fp_type == FPT.ACK:
+            self._send_next()
+        elif packet.fp_type == FPT.NAK:
+            if self._last is not None:
+                os.write(self._master, self._last)
+        elif packet.fp_type == FPT.ABORT:
+            self.device.abort()
+        elif self.naks:
+            self.naks -= 1
+            os.write(self._master, UartPacket(FPT.NAK).to_bytes())
+        else:
+            os.write(self._master, UartPacket(FPT.ACK).to_bytes())
+            if packet.fp_type == FPT.CMD:
+                header = PacketHeader.from_bytes(packet.data)
+                params = unpack_from(f'<{header.params_count}I', packet.data, 4)
+                self.device.write(CmdPacket(header.tag, header.flags, *params))
+            else:
+                self.device.write(packet.data)
+            idle = not self._outgoing and self._last is None
+            while self.device.rx_queue:
+                item = self.device.rx_queue.popleft()
+                fp_type = FPT.DATA if isinstance(item, bytes) else FPT.CMD
+                self._outgoing.append(UartPacket(fp_type, item if fp_type == FPT.DATA else item.to_bytes()).to_bytes())
+            if idle:
+                self._send_next()
+
+    def run(self):
+        while not self._stopped.is_set():
+            if select.select([self._master], [], [], 0.05)[0]:
+                for packet in self._parser.feed(os.read(self._master, 4096)):
+                    self._process(packet)
+
+
+@pytest.fixture
+def uart_target():
+    target = UartTarget()
+    target.start()
+    yield target
+    target.stop()
+
+
+def crc16_reference(data, crc=0):
+    # the original bit by bit implementation
+    for c in data:
+        crc ^= c << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+    return crc
+
+
+def test_crc16():
+    data = bytes(range(256)) * 3 + b'123456789'
+    assert crc16(b'123456789') == crc16_table(b'123456789') == 0x31C3
+    for length in (0, 1, 7, 100, len(data)):
+        part = data[:length]
+        assert crc16(part) == crc16_table(part) == crc16_reference(part)
+        assert crc16(part, 0x1D0F) == crc16_table(part, 0x1D0F) == crc16_reference(part, 0x1D0F)
+    # incremental calculation
+    assert Crc16().update(data[:100]).update(memoryview(data)[100:]).value == crc16(data)
+    assert crc16(data[300:], crc16(data[:300])) == crc16(data)
+
+
+def test_packet():
+    assert UartPacket(FPT.ACK).to_bytes() == b'\x5A\xA1'
+    assert UartPacket(FPT.PING).to_bytes() == b'\x5A\xA6'
+    # GetProperty(CurrentVersion) command from reference manual
+    packet = UartPacket(FPT.CMD, CmdPacket(CommandTag.GET_PROPERTY, 0, 1, 0).to_bytes(False))
+    assert packet.to_bytes() == bytes.fromhex('5AA40C00 4B33 07000002 01000000 00000000')
+
+
+def test_parser():
+    frames = UartPacket(FPT.ACK).to_bytes() + UartPacket(FPT.DATA, b'\x01\x02\x03').to_bytes() + \
+             UartPacket(FPT.CMD, bytes(8)).to_bytes()
+    parser = UartParser()
+    packets = []
+    # received byte by byte with garbage at the start
+    for b in b'\x00\xFF' + frames:
+        packets += parser.feed(bytes([b]))
+    assert [(p.fp_type, p.data) for p in packets] == [(FPT.ACK, None), (FPT.DATA, b'\x01\x02\x03'),
+                                                      (FPT.CMD, bytes(8))]
+    # corrupted frame
+    corrupted = bytearray(UartPacket(FPT.DATA, b'\x01\x02\x03').to_bytes())
+    corrupted[-1] ^= 0xFF
+    packets = parser.feed(corrupted + UartPacket(FPT.NAK).to_bytes())
+    assert packets[0] is None
+    assert packets[1].fp_type == FPT.NAK
+    # corrupted length field, the parser resynchronizes on following packets
+    corrupted = bytearray(UartPacket(FPT.DATA, bytes(range(64))).to_bytes())
+    corrupted[3] ^= 0x40
+    packets = parser.feed(corrupted + UartPacket(FPT.ACK).to_bytes() + UartPacket(FPT.CMD, bytes(8)).to_bytes())
+    assert packets[0] is None
+    assert [(p.fp_type, p.data) for p in packets[1:]] == [(FPT.ACK, None), (FPT.CMD, bytes(8))]
+    assert not parser._buffer
+
+
+@pty
+def test_uart(uart_target):
+    data = bytes(range(256)) * 4
+    uart = Uart(uart_target.port)
+    with McuBoot(uart, True) as mb:
+        assert uart.ping() == (0x50010200, 0)
+        assert mb.write_memory(0x1000, data)
+        assert uart_target.device.memory[0x1000:0x1400] == data
+        assert mb.read_memory(0x1000, len(data)) == data
+
+
+@pty
+def test_uart_retransmit():
+    # the rejected and corrupted packets are repeated
+    target = UartTarget(naks=2, corrupt=3)
+    target.start()
+    try:
+        with McuBoot(Uart(target.port), True) as mb:
+            assert mb.write_memory(0x100, bytes(range(100)))
+            assert mb.read_memory(0x100, 100) == bytes(range(100))
+    finally:
+        target.stop()
+    assert target.naks == 0 and target.corrupt == 0
+
+
+@pty
+def test_uart_baudrate(tmp_path):
+    target = UartTarget(baudrate=230400)
+    target.start()
+    cache = BaudrateCache(str(tmp_path / 'baudrates.json'))
+    try:
+        uart = Uart(target.port, None, cache=cache)
+        with McuBoot(uart, True) as mb:
+            assert uart.baudrate == 230400
+            assert mb.get_property(PropertyTag.CURRENT_VERSION)[0] == 0x4B020100
+        assert cache.load(target.port) == 230400
+        # the cached baud rate is tried first
+        target.pings = 0
+        with McuBoot(Uart(target.port, None, cache=cache)):
+            assert target.pings == 3
+        target.baudrate = 9600
+        with pytest.raises(McuBootConnectionError):
+            Uart(target.port, [115200, 230400], cache=cache).open()
+        assert cache.load(target.port) is None
+    finally:
+        target.stop()
+
+
+@pty
+def test_uart_autobaud():
+    target = UartTarget(autobaud=True)
+    target.start()
+    try:
+        # the fresh target is locked at the first detected rate, the other rates are not answered until reset
+        with McuBoot(Uart(target.port, [230400, 115200]), True):
+            assert target.baudrate == 230400
+        with pytest.raises(McuBootConnectionError):
+            Uart(target.port, 115200).open()
+        # the rate of locked target is found by search over candidates
+        uart = Uart(target.port, [460800, 230400, 115200])
+        with McuBoot(uart, True):
+            assert uart.baudrate == 230400
+    finally:
+        target.stop()
+
+
+@pty
+def test_async_uart_autobaud():
+    target = UartTarget(autobaud=True)
+    target.start()
+
+    async def session():
+        uart = AsyncUart(target.port, 230400)
+        async with AsyncMcuBoot(uart, True) as mb:
+            # the fresh target is locked by ping on open
+            assert target.pings == 1 and target.baudrate == 230400
+            assert uart.info() == f"{target.port} (230400 baud, P1.2.0)"
+            assert (await mb.get_property(PropertyTag.CURRENT_VERSION))[0] == 0x4B020100
+        with pytest.raises(McuBootConnectionError):
+            await AsyncUart(target.port, 115200, ping_timeout=100).open()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(session())
+    finally:
+        loop.close()
+        target.stop()
+
+
+@pty
+def test_scan_uart():
+    targets = [UartTarget(baudrate=baudrate) for baudrate in (115200, 230400, 115200)]
+    for target in targets:
+        target.start()
+    # the port without target
+    master, slave = os.openpty()
+    try:
+        ports = [targets[0].port, os.ttyname(slave), targets[1].port, targets[2].port]
+        start = time.perf_counter()
+        devices = scan_uart(ports, timeout=200)
+        # the ports are probed in parallel
+        assert time.perf_counter() - start < 0.6
+        assert [dev.info() for dev in devices] == [f"{targets[0].port} (115200 baud, P1.2.0)",
+                                                   f"{targets[2].port} (115200 baud, P1.2.0)"]
+        devices = scan_uart(ports, [115200, 230400], timeout=100)
+        assert [dev.baudrate for dev in devices] == [115200, 230400, 115200]
+        with McuBoot(devices[1]) as mb:
+            assert mb.get_property(PropertyTag.CURRENT_VERSION)[0] == 0x4B020100
+    finally:
+        for target in targets:
+            target.stop()
+        os.close(master)
+        os.close(slave)
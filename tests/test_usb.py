@@ -0,0 +1,54 @@
+# Copyright (c) 2019 Martin Olejar
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# The BSD-3-Clause license for this file can be found in the LICENSE file included with this distribution
+# or at https://spdx.org/licenses/BSD-3-Clause.html#licenseText
+
+
+import os
+import errno
+import logging
+import pytest
+from mboot.commands import CommandTag, GenericResponse
+from mboot.connection.usb import ReportEncoder, RawHidBase, REPORT_ID
+
+
+def test_report_encoder(caplog):
+    data = bytes(range(100))
+    encoder = ReportEncoder(36)
+    reports = [bytes(report) for report in encoder.iter_reports(REPORT_ID['DATA_OUT'], data)]
+    assert reports == [b'\x02\x00\x20\x00' + data[0:32], b'\x02\x00\x20\x00' + data[32:64],
+                       b'\x02\x00\x20\x00' + data[64:96], b'\x02\x00\x04\x00' + data[96:] + bytes(28)]
+    assert list(encoder.iter_reports(REPORT_ID['DATA_OUT'], b'')) == []
+    # the padding after shorter data is cleared, the report is formatted into log only in debug level
+    with caplog.at_level(logging.DEBUG, 'MBOOT:USB'):
+        report = next(encoder.iter_reports(REPORT_ID['CMD_OUT'], memoryview(b'\xAA\xBB')))
+    assert report == b'\x01\x00\x02\x00\xAA\xBB' + bytes(30)
+    assert caplog.messages == ["OUT[36]: 01 00 02 00 AA BB" + " 00" * 30]
+
+
+def test_decode_report():
+    response = RawHidBase._decode_report(bytes.fromhex('03000C00 A0000002 00000000 04000000') + bytes(20))
+    assert isinstance(response, GenericResponse) and response.cmd_tag == CommandTag.WRITE_MEMORY
+    assert RawHidBase._decode_report(b'\x04\x00\x02\x00\x01\x02\x03') == b'\x01\x02'
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="libusb backend")
+def test_libusb_poll():
+    import usb.core
+    from mboot.connection.usb import RawHid
+
+    class Endpoint:
+        wMaxPacketSize = 36
+        reports = [b'\x04\x00\x02\x00\x01\x02' + bytes(30)]
+
+        def read(self, size, timeout):
+            assert size == 36 and timeout > 0
+            if not self.reports:
+                raise usb.core.USBError('Operation timed out', -7, errno.ETIMEDOUT)
+            return self.reports.pop()
+
+    hid = RawHid()
+    hid.ep_in = Endpoint()
+    assert hid.poll() == b'\x01\x02'
+    assert hid.poll() is None